@@ -49,6 +49,9 @@ from course.constants import (
 
 from course.content import get_flow_desc
 
+import logging
+logger = logging.getLogger(__name__)
+
 
 # {{{ flow list
 
@@ -88,7 +91,8 @@ class Histogram(object):
             num_enforce_bounds=False, num_log_bins=False,
             num_bin_title_formatter=str):
         self.string_weights = {}
-        self.num_values = []
+        # weight -> list of numeric values added with that weight
+        self.num_values_by_weight = {}
         self.num_bin_starts = num_bin_starts
         self.num_min_value = num_min_value
         self.num_max_value = num_max_value
@@ -97,56 +101,88 @@ class Histogram(object):
         self.num_bin_title_formatter = num_bin_title_formatter
 
     def add_data_point(self, value, weight=1):
-        if isinstance(value, six.string_types):
-            self.string_weights[value] = \
-                    self.string_weights.get(value, 0) + weight
-        elif value is None:
-            self.add_data_point(
-                "".join([
-                        "(",
-                        pgettext("No data", "None"),
-                        ")"]),
-                weight)
-        else:
-            if (self.num_max_value is not None
-                    and value > self.num_max_value):
-                self.add_data_point(
+        self.add_data_points([value], weight)
+
+    def add_data_points(self, values, weight=1):
+        """Add each of *values* (numbers, strings or *None*) with *weight*.
+        Numbers are sorted into bins only once :meth:`get_bin_info_list` is
+        called.
+        """
+
+        num_values = []
+        for value in values:
+            if value is None:
+                value = "".join(["(", pgettext("No data", "None"), ")"])
+
+            if isinstance(value, six.string_types):
+                self.string_weights[value] = \
+                        self.string_weights.get(value, 0) + weight
+            else:
+                num_values.append(value)
+
+        if self.num_max_value is not None:
+            in_bounds_values = [
+                    value for value in num_values
+                    if value <= self.num_max_value]
+            self._add_string_weight(
                     "".join([
                             "(",
                             pgettext("Value of grade", "value greater than max"),
                             ")"]),
-                    weight)
-            elif (self.num_min_value is not None
-                    and value < self.num_min_value):
-                self.add_data_point(
+                    (len(num_values) - len(in_bounds_values)) * weight)
+            num_values = in_bounds_values
+
+        if self.num_min_value is not None:
+            in_bounds_values = [
+                    value for value in num_values
+                    if value >= self.num_min_value]
+            self._add_string_weight(
                     "".join([
                             "(",
                             pgettext("Value of grade", "value smaller than min"),
                             ")"]),
-                    weight)
-            else:
-                self.num_values.append((value, weight))
+                    (len(num_values) - len(in_bounds_values)) * weight)
+            num_values = in_bounds_values
+
+        if num_values:
+            self.num_values_by_weight.setdefault(weight, []).extend(num_values)
+
+    def _add_string_weight(self, key, weight):
+        if weight:
+            self.string_weights[key] = self.string_weights.get(key, 0) + weight
 
     def total_weight(self):
         return (
-                sum(weight for val, weight in self.num_values)
+                sum(weight * len(values)
+                    for weight, values in six.iteritems(
+                        self.num_values_by_weight))
                 + sum(six.itervalues(self.string_weights)))
 
     def get_bin_info_list(self):
         min_value = self.num_min_value
         max_value = self.num_max_value
 
+        # Once sorted, the values in each bin form a contiguous range whose
+        # bounds are found by bisection.
+        sorted_values_by_weight = dict(
+                (weight, sorted(values))
+                for weight, values in six.iteritems(self.num_values_by_weight))
+
         if self.num_bin_starts is not None:
             num_bin_starts = self.num_bin_starts
         else:
             if min_value is None:
-                if self.num_values:
-                    min_value, _ = min(self.num_values)
+                if sorted_values_by_weight:
+                    min_value = min(
+                            values[0] for values in six.itervalues(
+                                sorted_values_by_weight))
                 else:
                     min_value = 1
             if max_value is None:
-                if self.num_values:
-                    max_value, _ = max(self.num_values)
+                if sorted_values_by_weight:
+                    max_value = max(
+                            values[-1] for values in six.itervalues(
+                                sorted_values_by_weight))
                 else:
                     max_value = 1
 
@@ -162,22 +198,31 @@ class Histogram(object):
                         min_value+bin_width*i
                         for i in range(self.num_bin_count)]
 
+        from bisect import bisect_left, bisect_right
+
         bins = [0 for i in range(len(num_bin_starts))]
+        oob_weight = 0
+
+        for weight, values in six.iteritems(sorted_values_by_weight):
+            # values[bin_edges[i]:bin_edges[i+1]] fall into bin i
+            bin_edges = [bisect_left(values, start) for start in num_bin_starts]
+            if max_value is not None:
+                bin_edges.append(bisect_right(values, max_value))
+            else:
+                bin_edges.append(len(values))
+
+            for i, (start, end) in enumerate(zip(bin_edges[:-1], bin_edges[1:])):
+                bins[i] += weight * (end - start)
+
+            oob_weight += weight * (
+                    bin_edges[0] + len(values) - bin_edges[-1])
 
         temp_string_weights = self.string_weights.copy()
 
         oob = pgettext("Value in histogram", "<out of bounds>")
-
-        from bisect import bisect
-        for value, weight in self.num_values:
-            if ((max_value is not None
-                    and value > max_value)
-                    or value < num_bin_starts[0]):
-                temp_string_weights[oob] = \
-                        temp_string_weights.get(oob, 0) + weight
-            else:
-                bin_nr = bisect(num_bin_starts, value)-1
-                bins[bin_nr] += weight
+        if oob_weight:
+            temp_string_weights[oob] = \
+                    temp_string_weights.get(oob, 0) + oob_weight
 
         total_weight = self.total_weight()
 
@@ -264,14 +309,26 @@ def make_grade_histogram(pctx, flow_id):
     hist = Histogram(
         num_min_value=0,
         num_max_value=100)
-    for session in qset:
-        if session.in_progress:
-            hist.add_data_point(
-                    "".join(["<",
-                        pgettext("Status of session", "in progress"),
-                        ">"]))
+
+    in_progress_count = 0
+    percentages = []
+    for in_progress, points, max_points in qset.values_list(
+            "in_progress", "points", "max_points").iterator():
+        if in_progress:
+            in_progress_count += 1
+        elif points is not None and max_points:
+            # cf. FlowSession.points_percentage
+            percentages.append(100*points/max_points)
         else:
-            hist.add_data_point(session.points_percentage())
+            percentages.append(None)
+
+    if in_progress_count:
+        hist.add_data_point(
+                "".join(["<",
+                    pgettext("Status of session", "in progress"),
+                    ">"]),
+                weight=in_progress_count)
+    hist.add_data_points(percentages)
 
     return hist
 
@@ -297,97 +354,435 @@ def safe_div(num, denom):
     return num/denom
 
 
+# {{{ page statistics
+
+def get_participation_ids_in_grade_statistics(course):
+    from course.models import Participation, ParticipationPermission
+
+    return (
+            set(Participation.objects
+                .filter(
+                    course=course,
+                    roles__permissions__permission=(
+                        pperm.included_in_grade_statistics))
+                .values_list("id", flat=True))
+            | set(ParticipationPermission.objects
+                .filter(
+                    participation__course=course,
+                    permission=pperm.included_in_grade_statistics)
+                .values_list("participation_id", flat=True)))
+
+
+class _SubmittedVisit(object):
+    __slots__ = ("id", "page_data_id", "participation_id", "visit_time",
+            "has_answer", "correctness")
+
+    def __init__(self, id, page_data_id, participation_id, visit_time,
+            has_answer, correctness):
+        self.id = id
+        self.page_data_id = page_data_id
+        self.participation_id = participation_id
+        self.visit_time = visit_time
+        self.has_answer = has_answer
+        self.correctness = correctness
+
+
+def get_submitted_visits_by_page(course, flow_id):
+    """Retrieve all submitted answer visits in sessions of *flow_id* that
+    count towards grade statistics, along with the correctness of their most
+    recent grade, in a single query.
+
+    :returns: a dictionary mapping ``(group_id, page_id)`` to a list of
+        objects with attributes ``id``, ``page_data_id``,
+        ``participation_id``, ``visit_time``, ``has_answer`` and
+        ``correctness`` (*None* if ungraded).
+    """
+
+    from django.db.models import Case, When, Value, BooleanField
+
+    # The outer join with the grades yields one row per visit and grade,
+    # the most recent grade last.
+    rows = (FlowPageVisit.objects
+            .filter(
+                flow_session__course=course,
+                flow_session__flow_id=flow_id,
+                flow_session__participation__in=(
+                    get_participation_ids_in_grade_statistics(course)),
+                is_submitted_answer=True)
+            .annotate(has_answer=Case(
+                When(answer__isnull=True, then=Value(False)),
+                default=Value(True),
+                output_field=BooleanField()))
+            .order_by("id", "grades__grade_time")
+            .values_list(
+                "id",
+                "page_data__group_id",
+                "page_data__page_id",
+                "page_data_id",
+                "flow_session__participation_id",
+                "visit_time",
+                "has_answer",
+                "grades__correctness"))
+
+    result = {}
+    last_visit = None
+
+    for (visit_id, group_id, page_id, page_data_id, participation_id,
+            visit_time, has_answer, correctness) in rows.iterator():
+        if last_visit is not None and last_visit.id == visit_id:
+            last_visit.correctness = correctness
+            continue
+
+        last_visit = _SubmittedVisit(visit_id, page_data_id, participation_id,
+                visit_time, has_answer, correctness)
+        result.setdefault((group_id, page_id), []).append(last_visit)
+
+    return result
+
+
+def _pick_visits(visits, key, latest):
+    """Keep one visit (the earliest or, if *latest*, the latest) among those
+    sharing the same *key*.
+    """
+
+    picked = {}
+    for visit in visits:
+        k = key(visit)
+        prev_visit = picked.get(k)
+        if (prev_visit is None
+                or (latest and visit.visit_time > prev_visit.visit_time)
+                or (not latest and visit.visit_time < prev_visit.visit_time)):
+            picked[k] = visit
+
+    return list(picked.values())
+
+
+_VISIT_ID_CHUNK_SIZE = 500
+
+
+def _get_normalized_answers(page, page_context, visit_ids):
+    """
+    :returns: a dictionary mapping each of *visit_ids* to the normalized
+        answer in that visit. Identical answers are normalized only once,
+        see :meth:`course.page.PageBase.normalized_answers`.
+    """
+
+    visit_ids = list(visit_ids)
+
+    result = {}
+    for i in range(0, len(visit_ids), _VISIT_ID_CHUNK_SIZE):
+        rows = list(FlowPageVisit.objects
+                .filter(id__in=visit_ids[i:i+_VISIT_ID_CHUNK_SIZE])
+                .values_list("id", "page_data__data", "answer"))
+
+        result.update(zip(
+            [visit_id for visit_id, _, _ in rows],
+            page.normalized_answers(page_context,
+                [page_data for _, page_data, _ in rows],
+                [answer for _, _, answer in rows])))
+
+    return result
+
+
+def update_page_statistics(visit, page, page_context, correctness):
+    """Count the submitted answer in *visit*, which was just graded with
+    *correctness* (or, if it is not gradable, looked at), in the
+    :class:`course.models.FlowPageStatistics` of its page, replacing the
+    answer previously counted for its session (or participant) if *visit* is
+    more recent (or earlier).
+
+    This happens once the current transaction commits, so that grading does
+    not hold the statistics' row locks. Failures are logged and do not affect
+    grading.
+    """
+
+    if not visit.is_submitted_answer:
+        return
+
+    from django.db import transaction
+
+    def update():
+        try:
+            _update_page_statistics(visit, page, page_context, correctness)
+        except Exception:
+            logger.exception("failed to update page statistics for visit %d",
+                    visit.id)
+
+    transaction.on_commit(update)
+
+
+def _update_page_statistics(visit, page, page_context, correctness):
+    participation = visit.flow_session.participation
+    if (participation is None
+            or not participation.has_permission(
+                pperm.included_in_grade_statistics)):
+        return
+
+    from django.db import transaction
+    from course.models import (
+            FlowPageStatistics, FlowPageStatisticsEntry,
+            FlowPageStatisticsBuild)
+    from course.constants import page_statistics_attempt_mode
+
+    page_data = visit.page_data
+    normalized_answer = page.normalized_answer(
+            page_context, page_data.data, visit.answer)
+
+    with transaction.atomic():
+        # Waits for a rebuild of the flow's statistics to finish, so that this
+        # visit is either counted by it or counted here afterwards.
+        build = (FlowPageStatisticsBuild.objects
+                .select_for_update()
+                .filter(
+                    course=visit.flow_session.course,
+                    flow_id=visit.flow_session.flow_id)
+                .first())
+        if build is None:
+            # Counted when the statistics of the flow are first built.
+            return
+
+        for attempt_mode, slot, is_preferred in [
+                (page_statistics_attempt_mode.latest, page_data.id,
+                    lambda entry: visit.visit_time >= entry.visit_time),
+                (page_statistics_attempt_mode.first, participation.id,
+                    lambda entry: visit.visit_time <= entry.visit_time),
+                ]:
+            stats, _ = FlowPageStatistics.objects.get_or_create(
+                    course=visit.flow_session.course,
+                    flow_id=visit.flow_session.flow_id,
+                    group_id=page_data.group_id,
+                    page_id=page_data.page_id,
+                    attempt_mode=attempt_mode)
+
+            # Serialize with deletions of entries, which update the counts.
+            stats = FlowPageStatistics.objects.select_for_update().get(
+                    id=stats.id)
+
+            entry = stats.entries.filter(slot=slot).first()
+            if entry is not None:
+                if entry.visit_id != visit.id and not is_preferred(entry):
+                    continue
+
+                for name, value in six.iteritems(entry.get_counts()):
+                    setattr(stats, name, getattr(stats, name) - value)
+            else:
+                entry = FlowPageStatisticsEntry(statistics=stats, slot=slot)
+
+            entry.visit = visit
+            entry.visit_time = visit.visit_time
+            entry.has_answer = visit.answer is not None
+            entry.correctness = correctness
+            entry.normalized_answer = normalized_answer
+            entry.save()
+
+            for name, value in six.iteritems(entry.get_counts()):
+                setattr(stats, name, getattr(stats, name) + value)
+
+            stats.save()
+
+
+def rebuild_page_statistics(repo, course, flow_id, commit_sha):
+    """Recompute all :class:`course.models.FlowPageStatistics` of *flow_id*
+    from the submitted answers and their grades.
+
+    The :class:`course.models.FlowPageStatisticsBuild` of the flow is
+    committed first, so that :func:`update_page_statistics` counts every
+    answer graded from then on, and locked while the answers are read and
+    counted, so that it only does so after the rebuild has committed.
+    Must therefore not be called within a transaction.
+    """
+
+    from django.db import transaction
+    from django.utils.timezone import now
+    from course.models import (
+            FlowPageStatistics, FlowPageStatisticsEntry,
+            FlowPageStatisticsBuild)
+    from course.constants import page_statistics_attempt_mode
+
+    page_cache = PageInstanceCache(repo, course, flow_id)
+
+    from course.page import PageContext
+    page_context = PageContext(
+            course=course,
+            repo=repo,
+            commit_sha=commit_sha,
+            flow_session=None)
+
+    with transaction.atomic():
+        FlowPageStatisticsBuild.objects.get_or_create(
+                course=course, flow_id=flow_id)
+
+    with transaction.atomic():
+        build = (FlowPageStatisticsBuild.objects
+                .select_for_update()
+                .get(course=course, flow_id=flow_id))
+
+        visits_by_page = get_submitted_visits_by_page(course, flow_id)
+
+        # Skip the per-entry post_delete bookkeeping, the statistics go away
+        # as well.
+        FlowPageStatisticsEntry.objects.filter(
+                statistics__course=course,
+                statistics__flow_id=flow_id)._raw_delete(
+                        FlowPageStatisticsEntry.objects.db)
+        FlowPageStatistics.objects.filter(
+                course=course, flow_id=flow_id).delete()
+
+        for (group_id, page_id), visits in six.iteritems(visits_by_page):
+            try:
+                page = page_cache.get_page(group_id, page_id, commit_sha)
+            except ObjectDoesNotExist:
+                # page no longer exists
+                continue
+
+            picked_visits_by_mode = [
+                    (attempt_mode, slot_attr, _pick_visits(visits,
+                        lambda visit: getattr(visit, slot_attr), latest=latest))
+                    for attempt_mode, slot_attr, latest in [
+                        (page_statistics_attempt_mode.latest, "page_data_id",
+                            True),
+                        (page_statistics_attempt_mode.first, "participation_id",
+                            False),
+                        ]]
+
+            # The modes mostly count the same visits.
+            normalized_answers = _get_normalized_answers(page, page_context,
+                    set(visit.id
+                        for _, _, picked_visits in picked_visits_by_mode
+                        for visit in picked_visits))
+
+            for attempt_mode, slot_attr, picked_visits in picked_visits_by_mode:
+                stats = FlowPageStatistics.objects.create(
+                        course=course,
+                        flow_id=flow_id,
+                        group_id=group_id,
+                        page_id=page_id,
+                        attempt_mode=attempt_mode)
+
+                entries = []
+                for visit in picked_visits:
+                    entry = FlowPageStatisticsEntry(
+                            statistics=stats,
+                            slot=getattr(visit, slot_attr),
+                            visit_id=visit.id,
+                            visit_time=visit.visit_time,
+                            has_answer=visit.has_answer,
+                            correctness=visit.correctness,
+                            normalized_answer=normalized_answers[visit.id])
+                    entries.append(entry)
+
+                    for name, value in six.iteritems(entry.get_counts()):
+                        setattr(stats, name, getattr(stats, name) + value)
+
+                FlowPageStatisticsEntry.objects.bulk_create(entries)
+                stats.save()
+
+        build.build_time = now()
+        build.save()
+
+
+def get_page_statistics(pctx, flow_id, attempt_mode):
+    """
+    :returns: a dictionary mapping ``(group_id, page_id)`` to
+        :class:`course.models.FlowPageStatistics` for *attempt_mode*,
+        computing them first if that has never happened for *flow_id*.
+    """
+
+    from course.models import FlowPageStatistics, FlowPageStatisticsBuild
+
+    if not FlowPageStatisticsBuild.objects.filter(
+            course=pctx.course, flow_id=flow_id,
+            build_time__isnull=False).exists():
+        rebuild_page_statistics(pctx.repo, pctx.course, flow_id,
+                pctx.course_commit_sha)
+
+    return dict(
+            ((stats.group_id, stats.page_id), stats)
+            for stats in FlowPageStatistics.objects.filter(
+                course=pctx.course, flow_id=flow_id,
+                attempt_mode=attempt_mode))
+
+
+def get_sample_visits(stats_list):
+    """
+    :returns: a dictionary mapping the IDs of the
+        :class:`course.models.FlowPageStatistics` in *stats_list* to one of
+        the visits counted in them, e.g. to render the page's title.
+    """
+
+    from django.db.models import Min
+    from course.models import FlowPageStatisticsEntry
+
+    stats_id_to_visit_id = dict(
+            FlowPageStatisticsEntry.objects
+            .filter(statistics__in=stats_list)
+            .values("statistics_id")
+            .annotate(sample_visit_id=Min("visit_id"))
+            .values_list("statistics_id", "sample_visit_id"))
+
+    visits = dict(
+            (visit.id, visit)
+            for visit in FlowPageVisit.objects
+            .filter(id__in=list(stats_id_to_visit_id.values()))
+            .select_related("page_data", "flow_session"))
+
+    return dict(
+            (stats_id, visits[visit_id])
+            for stats_id, visit_id in six.iteritems(stats_id_to_visit_id))
+
+# }}}
+
+
 def make_page_answer_stats_list(pctx, flow_id, restrict_to_first_attempt):
+    from course.constants import page_statistics_attempt_mode
+
     flow_desc = get_flow_desc(pctx.repo, pctx.course, flow_id,
             pctx.course_commit_sha)
 
     page_cache = PageInstanceCache(pctx.repo, pctx.course, flow_id)
 
+    page_stats = get_page_statistics(pctx, flow_id,
+            page_statistics_attempt_mode.first
+            if restrict_to_first_attempt
+            else page_statistics_attempt_mode.latest)
+
+    sample_visits = get_sample_visits(list(page_stats.values()))
+
     page_info_list = []
     for group_desc in flow_desc.groups:
         for page_desc in group_desc.pages:
-            points = 0
-            graded_count = 0
-            empty_count = 0
-
-            answer_count = 0
-            total_count = 0
-
-            visits = (FlowPageVisit.objects
-                    .filter(
-                        flow_session__course=pctx.course,
-                        flow_session__flow_id=flow_id,
-                        flow_session__participation__roles__permissions__permission=(
-                            pperm.included_in_grade_statistics),
-                        page_data__group_id=group_desc.id,
-                        page_data__page_id=page_desc.id,
-                        is_submitted_answer=True,
-                        ))
-
-            if connection.features.can_distinct_on_fields:
-                if restrict_to_first_attempt:
-                    visits = (visits
-                            .distinct("flow_session__participation__id")
-                            .order_by("flow_session__participation__id",
-                                "visit_time"))
-                elif is_page_multiple_submit(flow_desc, page_desc):
-                    visits = (visits
-                            .distinct("page_data__id")
-                            .order_by("page_data__id", "-visit_time"))
-
-            visits = (visits
-                    .select_related("flow_session")
-                    .select_related("page_data"))
-
-            answer_expected = False
-
-            title = None
-            for visit in visits:
-                page = page_cache.get_page(group_desc.id, page_desc.id,
-                        pctx.course_commit_sha)
-
-                answer_expected = answer_expected or page.expects_answer()
-
-                from course.page import PageContext
-                grading_page_context = PageContext(
-                        course=pctx.course,
-                        repo=pctx.repo,
-                        commit_sha=pctx.course_commit_sha,
-                        flow_session=visit.flow_session)
-
-                title = page.title(grading_page_context, visit.page_data.data)
-
-                answer_feedback = visit.get_most_recent_feedback()
-
-                if visit.answer is not None:
-                    answer_count += 1
-                else:
-                    empty_count += 1
+            stats = page_stats.get((group_desc.id, page_desc.id))
+            if stats is None or stats.id not in sample_visits:
+                continue
 
-                total_count += 1
+            page = page_cache.get_page(group_desc.id, page_desc.id,
+                    pctx.course_commit_sha)
 
-                if (answer_feedback is not None
-                        and answer_feedback.correctness is not None):
-                    if visit.answer is None:
-                        assert answer_feedback.correctness == 0
-                    else:
-                        points += answer_feedback.correctness
+            if not page.expects_answer():
+                continue
 
-                    graded_count += 1
+            sample_visit = sample_visits[stats.id]
 
-            if not answer_expected:
-                continue
+            from course.page import PageContext
+            grading_page_context = PageContext(
+                    course=pctx.course,
+                    repo=pctx.repo,
+                    commit_sha=pctx.course_commit_sha,
+                    flow_session=sample_visit.flow_session)
+
+            title = page.title(grading_page_context, sample_visit.page_data.data)
 
             page_info_list.append(
                     PageAnswerStats(
                         group_id=group_desc.id,
                         page_id=page_desc.id,
                         title=title,
-                        average_correctness=safe_div(points, graded_count),
+                        average_correctness=safe_div(
+                            stats.correctness_sum, stats.graded_count),
                         average_emptiness=safe_div(
-                            empty_count, graded_count),
-                        answer_count=answer_count,
-                        total_count=total_count,
+                            stats.empty_count, stats.graded_count),
+                        answer_count=stats.answer_count,
+                        total_count=stats.total_count,
                         url=reverse(
                             "relate-page_analytics",
                             args=(
@@ -412,16 +807,24 @@ def make_time_histogram(pctx, flow_id):
                     "$>$ %.1f ",
                     pgettext("Minute (time unit)", "min"))
                 % minutes))
-    for session in qset:
-        if session.in_progress:
-            hist.add_data_point(
-                    "".join(["<",
-                        pgettext("Status of session", "in progress"),
-                        ">"]))
+
+    in_progress_count = 0
+    minutes = []
+    for in_progress, start_time, completion_time in qset.values_list(
+            "in_progress", "start_time", "completion_time").iterator():
+        if in_progress:
+            in_progress_count += 1
         else:
-            delta = session.completion_time - session.start_time
-            minutes = delta.total_seconds() / 60
-            hist.add_data_point(minutes)
+            minutes.append(
+                    (completion_time - start_time).total_seconds() / 60)
+
+    if in_progress_count:
+        hist.add_data_point(
+                "".join(["<",
+                    pgettext("Status of session", "in progress"),
+                    ">"]),
+                weight=in_progress_count)
+    hist.add_data_points(minutes)
 
     return hist
 
@@ -493,70 +896,45 @@ def page_analytics(pctx, flow_id, group_id, page_id):
     restrict_to_first_attempt = int(
             bool(pctx.request.GET.get("restrict_to_first_attempt") == "1"))
 
-    is_multiple_submit = is_flow_multiple_submit(flow_desc)
-
     page_cache = PageInstanceCache(pctx.repo, pctx.course, flow_id)
 
-    visits = (FlowPageVisit.objects
-            .filter(
-                flow_session__course=pctx.course,
-                flow_session__flow_id=flow_id,
-                flow_session__participation__roles__permissions__permission=(
-                    pperm.included_in_grade_statistics),
-                page_data__group_id=group_id,
-                page_data__page_id=page_id,
-                is_submitted_answer=True,
-                ))
-
-    if connection.features.can_distinct_on_fields:
-        if restrict_to_first_attempt:
-            visits = (visits
-                    .distinct("flow_session__participation__id")
-                    .order_by("flow_session__participation__id", "visit_time"))
-        elif is_multiple_submit:
-            visits = (visits
-                    .distinct("page_data__id")
-                    .order_by("page_data__id", "-visit_time"))
-
-    visits = (visits
-            .select_related("flow_session")
-            .select_related("page_data"))
+    from course.constants import page_statistics_attempt_mode
+    stats = get_page_statistics(pctx, flow_id,
+            page_statistics_attempt_mode.first
+            if restrict_to_first_attempt
+            else page_statistics_attempt_mode.latest).get((group_id, page_id))
 
     normalized_answer_and_correctness_to_count = {}
 
     title = None
     body = None
     total_count = 0
-    graded_count = 0
-
-    for visit in visits:
-        page = page_cache.get_page(group_id, page_id, pctx.course_commit_sha)
-
-        from course.page import PageContext
-        grading_page_context = PageContext(
-                course=pctx.course,
-                repo=pctx.repo,
-                commit_sha=pctx.course_commit_sha,
-                flow_session=visit.flow_session)
-
-        title = page.title(grading_page_context, visit.page_data.data)
-        body = page.body(grading_page_context, visit.page_data.data)
-        normalized_answer = page.normalized_answer(
-                grading_page_context, visit.page_data.data, visit.answer)
-
-        answer_feedback = visit.get_most_recent_feedback()
-
-        if answer_feedback is not None:
-            key = (normalized_answer, answer_feedback.correctness)
-            normalized_answer_and_correctness_to_count[key] = \
-                    normalized_answer_and_correctness_to_count.get(key, 0) + 1
-            graded_count += 1
-        else:
-            key = (normalized_answer, None)
-            normalized_answer_and_correctness_to_count[key] = \
-                    normalized_answer_and_correctness_to_count.get(key, 0) + 1
 
-        total_count += 1
+    if stats is not None:
+        total_count = stats.total_count
+
+        from django.db.models import Count
+        for normalized_answer, correctness, count in (stats.entries
+                .values("normalized_answer", "correctness")
+                .annotate(count=Count("id"))
+                .order_by()
+                .values_list("normalized_answer", "correctness", "count")):
+            normalized_answer_and_correctness_to_count[
+                    normalized_answer, correctness] = count
+
+        sample_visit = get_sample_visits([stats]).get(stats.id)
+        if sample_visit is not None:
+            page = page_cache.get_page(group_id, page_id, pctx.course_commit_sha)
+
+            from course.page import PageContext
+            grading_page_context = PageContext(
+                    course=pctx.course,
+                    repo=pctx.repo,
+                    commit_sha=pctx.course_commit_sha,
+                    flow_session=sample_visit.flow_session)
+
+            title = page.title(grading_page_context, sample_visit.page_data.data)
+            body = page.body(grading_page_context, sample_visit.page_data.data)
 
     answer_stats = []
     for (normalized_answer, correctness), count in \
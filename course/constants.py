@@ -512,6 +512,37 @@ GRADE_STATE_CHANGE_CHOICES = (
 # }}}
 
 
+# {{{ page statistics attempt mode
+
+class page_statistics_attempt_mode:  # noqa
+    """Which submitted answers are counted in
+    :class:`course.models.FlowPageStatistics`.
+
+    .. attribute:: latest
+
+        The latest submitted answer in each flow session.
+
+    .. attribute:: first
+
+        The first submitted answer of each participant.
+    """
+
+    latest = "latest"
+    first = "first"
+
+
+PAGE_STATISTICS_ATTEMPT_MODE_CHOICES = (
+        (page_statistics_attempt_mode.latest,
+            pgettext_lazy("Page statistics attempt mode",
+                "Latest answer in each session")),
+        (page_statistics_attempt_mode.first,
+            pgettext_lazy("Page statistics attempt mode",
+                "First answer of each participant")),
+        )
+
+# }}}
+
+
 # {{{ exam ticket state
 
 class exam_ticket_states:  # noqa
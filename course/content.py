@@ -32,6 +32,7 @@ import re
 import datetime
 import six
 import sys
+import threading
 
 from django.utils.timezone import now
 from django.core.exceptions import ObjectDoesNotExist, ImproperlyConfigured
@@ -45,7 +46,7 @@ from six.moves import html_parser
 from jinja2 import (
         BaseLoader as BaseTemplateLoader, TemplateNotFound, FileSystemLoader)
 
-from relate.utils import dict_to_struct, Struct, SubdirRepoWrapper
+from relate.utils import dict_to_struct, Struct, SubdirRepoWrapper, LRUCache
 from course.constants import ATTRIBUTES_FILENAME
 
 from yaml import load as load_yaml
@@ -59,7 +60,7 @@ else:
 # {{{ mypy
 
 from typing import (  # noqa
-        cast, Union, Any, List, Tuple, Optional, Callable, Text)
+        cast, Union, Any, List, Tuple, Optional, Callable, Text, Dict)
 
 if False:
     # for mypy
@@ -171,6 +172,148 @@ class FlowDesc(Struct):
 # }}}
 
 
+# {{{ content cache
+
+class _PickledValue(object):
+    """Holds a mutable value in pickled form so that each retrieval from the
+    in-process tier hands out an independent copy.
+    """
+
+    def __init__(self, data):
+        # type: (bytes) -> None
+        self.data = data
+
+
+def make_content_cache_key(kind, *parts):
+    # type: (Text, *Any) -> Text
+    """Return a fixed-length cache key for content of *kind* identified by
+    *parts*, which may be text or byte strings. Hashing the parts keeps
+    keys within memcache's length limit regardless of repository paths.
+    """
+
+    import hashlib
+    h = hashlib.sha256()
+    for part in parts:
+        if not isinstance(part, six.binary_type):
+            part = six.text_type(part).encode("utf-8")
+        h.update(part)
+        h.update(b"\0")
+
+    return "relate:%s:%s:%s" % (CACHE_KEY_ROOT, kind, h.hexdigest())
+
+
+class ContentCache(object):
+    """A two-tier cache for content derived from course repositories.
+
+    A per-process LRU, bounded by the total size of its entries, sits in
+    front of Django's default cache. Text and byte strings are kept as-is in
+    the in-process tier. Other values (e.g. parsed YAML) are kept pickled
+    there, so that callers may continue to modify what they receive, but
+    hits avoid a round trip to the shared cache.
+    """
+
+    def __init__(self, max_local_bytes):
+        # type: (int) -> None
+        self.local = LRUCache(max_size=max_local_bytes)
+
+        self.shared_hits = 0
+        self.shared_misses = 0
+
+    def _get_shared_cache(self):
+        # type: () -> Any
+        try:
+            import django.core.cache as cache
+        except ImproperlyConfigured:
+            return None
+
+        return cache.caches["default"]
+
+    def _put_local(self, key, value):
+        # type: (Text, Any) -> None
+        if isinstance(value, (six.binary_type, six.text_type)):
+            self.local.put(key, value, size=len(value))
+        else:
+            from six.moves import cPickle as pickle
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            self.local.put(key, _PickledValue(data), size=len(data))
+
+    def get(self, key, local=True):
+        # type: (Text, bool) -> Any
+        """
+        :arg local: whether to use the in-process tier.
+        """
+
+        result = self.local.get(key) if local else None
+        if result is not None:
+            if isinstance(result, _PickledValue):
+                from six.moves import cPickle as pickle
+                result = pickle.loads(result.data)
+
+            return result
+
+        shared_cache = self._get_shared_cache()
+        if shared_cache is None:
+            return None
+
+        result = shared_cache.get(key)
+        if result is None:
+            self.shared_misses += 1
+            return None
+
+        self.shared_hits += 1
+
+        # Values are wrapped in a tuple to force pickling because memcache's
+        # python wrapper appears to auto-decode/encode string values, thus
+        # trying to decode our byte strings. Grr.
+        (result,) = result
+
+        if local:
+            self._put_local(key, result)
+        return result
+
+    def add(self, key, value, shared=True, local=True):
+        # type: (Text, Any, bool, bool) -> None
+        """
+        :arg shared: whether to store *value* in the shared cache.
+        :arg local: whether to store *value* in the in-process tier.
+        """
+
+        if local:
+            self._put_local(key, value)
+
+        if shared:
+            shared_cache = self._get_shared_cache()
+            if shared_cache is not None:
+                shared_cache.add(key, (value,), None)
+
+    def get_stats(self):
+        # type: () -> Dict[Text, int]
+        stats = dict(
+                ("local_" + name, value)
+                for name, value in six.iteritems(self.local.get_stats()))
+        stats["shared_hits"] = self.shared_hits
+        stats["shared_misses"] = self.shared_misses
+        return stats
+
+
+_CONTENT_CACHE = None  # type: Optional[ContentCache]
+
+
+def get_content_cache():
+    # type: () -> ContentCache
+    global _CONTENT_CACHE
+
+    if _CONTENT_CACHE is None:
+        _CONTENT_CACHE = ContentCache(
+                max_local_bytes=getattr(
+                    settings, "RELATE_LOCAL_CONTENT_CACHE_MAX_BYTES",
+                    32*1024*1024))
+
+    return _CONTENT_CACHE
+
+# }}}
+
+
 # {{{ repo blob getting
 
 def get_true_repo_and_path(repo, path):
@@ -195,11 +338,146 @@ def get_course_repo_path(course):
     return join(settings.GIT_ROOT, course.identifier)
 
 
+class CourseRepoPool(object):
+    """A process-wide registry of open :class:`dulwich.repo.Repo` objects,
+    keyed by course identifier.
+
+    Keeping repositories open across requests lets dulwich reuse its pack
+    indices and file handles instead of re-reading them for every request.
+    dulwich reads refs from disk on every access and notices newly arrived
+    packs by itself, so pooled repositories stay usable after a fetch
+    performed by another process. :meth:`refresh` additionally forces a
+    reopen after a fetch in this process.
+
+    Since dulwich's pack access (seek, then read) is not safe to share
+    between threads, each thread holds its own set of repositories. Pooled
+    repositories must not be closed by their users.
+    """
+
+    def __init__(self, max_size=None):
+        # type: (Optional[int]) -> None
+        import threading
+        self.max_size = max_size
+
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+        # course identifier -> generation, bumped by refresh()
+        self.generations = {}  # type: Dict[Text, int]
+
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def _thread_repos(self):
+        # type: () -> Any
+        repos = getattr(self.local, "repos", None)
+        if repos is None:
+            from collections import OrderedDict
+            repos = self.local.repos = OrderedDict()
+
+        return repos
+
+    def get(self, identifier, repo_path):
+        # type: (Text, Text) -> dulwich.repo.Repo
+        repos = self._thread_repos()
+
+        with self.lock:
+            generation = self.generations.get(identifier, 0)
+
+        entry = repos.pop(identifier, None)
+        if entry is not None:
+            entry_path, entry_generation, repo = entry
+            if entry_path == repo_path and entry_generation == generation:
+                # move to most-recently-used position
+                repos[identifier] = entry
+
+                with self.lock:
+                    self.hits += 1
+                return repo
+
+            # Stale repositories are not closed explicitly, since a caller
+            # earlier in the same request may still be using them. Their
+            # files get closed once they are garbage-collected.
+
+        from dulwich.repo import Repo
+        repo = Repo(repo_path)
+        repos[identifier] = (repo_path, generation, repo)
+
+        evicted = 0
+        while self.max_size is not None and len(repos) > self.max_size:
+            repos.popitem(last=False)
+            evicted += 1
+
+        with self.lock:
+            self.misses += 1
+            self.evictions += evicted
+
+        return repo
+
+    def refresh(self, identifier):
+        # type: (Text) -> None
+        """Make all threads reopen the repository for *identifier* on next
+        access, e.g. after a fetch changed its refs or packs.
+        """
+        with self.lock:
+            self.generations[identifier] = \
+                    self.generations.get(identifier, 0) + 1
+            self.refreshes += 1
+
+    def get_stats(self):
+        # type: () -> Dict[Text, int]
+        with self.lock:
+            return {
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "refreshes": self.refreshes,
+                    "evictions": self.evictions,
+                    }
+
+
+_COURSE_REPO_POOL = None  # type: Optional[CourseRepoPool]
+
+
+def get_course_repo_pool():
+    # type: () -> Optional[CourseRepoPool]
+    """Return the process-wide :class:`CourseRepoPool`, or *None* if
+    pooling is disabled by setting ``RELATE_COURSE_REPO_POOL_SIZE`` to 0.
+    """
+
+    global _COURSE_REPO_POOL
+
+    max_size = getattr(settings, "RELATE_COURSE_REPO_POOL_SIZE", 32)
+    if not max_size:
+        return None
+
+    if _COURSE_REPO_POOL is None:
+        _COURSE_REPO_POOL = CourseRepoPool(max_size=max_size)
+
+    return _COURSE_REPO_POOL
+
+
+def refresh_course_repo(course):
+    # type: (Course) -> None
+    pool = get_course_repo_pool()
+    if pool is not None:
+        pool.refresh(course.identifier)
+
+
 def get_course_repo(course):
     # type: (Course) -> Repo_ish
 
-    from dulwich.repo import Repo
-    repo = Repo(get_course_repo_path(course))
+    """Return a (possibly pooled) repository for *course*. The returned
+    object is shared and should not be closed by the caller.
+    """
+
+    pool = get_course_repo_pool()
+    if pool is not None:
+        repo = pool.get(course.identifier, get_course_repo_path(course))
+    else:
+        from dulwich.repo import Repo
+        repo = Repo(get_course_repo_path(course))
 
     if course.course_root_path:
         return SubdirRepoWrapper(repo, course.course_root_path)
@@ -207,6 +485,67 @@ def get_course_repo(course):
         return repo
 
 
+# {{{ path index
+
+_REPO_PATH_INDEX = None  # type: Optional[LRUCache]
+
+
+def get_repo_path_index():
+    # type: () -> LRUCache
+    """Return the process-wide index mapping
+    ``(repo control dir, commit_sha, path)`` to object SHAs.
+
+    Since commits are immutable, entries never become invalid. The size of
+    the index is bounded by ``RELATE_REPO_PATH_INDEX_SIZE``.
+    """
+
+    global _REPO_PATH_INDEX
+
+    if _REPO_PATH_INDEX is None:
+        _REPO_PATH_INDEX = LRUCache(
+                getattr(settings, "RELATE_REPO_PATH_INDEX_SIZE", 20000))
+
+    return _REPO_PATH_INDEX
+
+
+def prewarm_repo_path_index(repo, commit_sha):
+    # type: (Repo_ish, bytes) -> int
+    """Enter all paths in the tree of *commit_sha* into the path index,
+    up to the capacity of the index.
+
+    :returns: the number of paths entered.
+    """
+
+    dul_repo, unused_path = get_true_repo_and_path(repo, "")
+    index = get_repo_path_index()
+    controldir = dul_repo.controldir()
+
+    try:
+        tree_sha = dul_repo[commit_sha].tree
+    except KeyError:
+        raise ObjectDoesNotExist(
+                _("commit sha '%s' not found") % commit_sha.decode())
+
+    from stat import S_ISDIR
+
+    count = 0
+    queue = [("", tree_sha)]
+    while queue and count < index.max_entries:
+        prefix, tree_sha = queue.pop()
+
+        for entry in dul_repo[tree_sha].items():
+            path = prefix + entry.path.decode("utf-8", errors="replace")
+            index.put((controldir, commit_sha, path), entry.sha)
+            count += 1
+
+            if S_ISDIR(entry.mode):
+                queue.append((path + "/", entry.sha))
+
+    return count
+
+# }}}
+
+
 def get_repo_blob(repo, full_name, commit_sha, allow_tree=True):
     # type: (Repo_ish, Text, bytes, bool) -> dulwich.Blob
 
@@ -218,6 +557,28 @@ def get_repo_blob(repo, full_name, commit_sha, allow_tree=True):
 
     dul_repo, full_name = get_true_repo_and_path(repo, full_name)
 
+    # {{{ look up path index
+
+    path_index = get_repo_path_index()
+    index_key = (dul_repo.controldir(), commit_sha, full_name)
+    obj_sha = path_index.get(index_key)
+
+    if obj_sha is not None:
+        try:
+            result = dul_repo[obj_sha]
+        except KeyError:
+            # e.g. a submodule entry, let the full lookup below complain
+            pass
+        else:
+            if not allow_tree and not hasattr(result, "data"):
+                raise ObjectDoesNotExist(
+                        _("resource '%s' is a directory, not a file")
+                        % full_name)
+
+            return result
+
+    # }}}
+
     names = full_name.split("/")
 
     # Allow non-ASCII file name
@@ -261,6 +622,8 @@ def get_repo_blob(repo, full_name, commit_sha, allow_tree=True):
         mode, blob_sha = access_directory_content(tree, names[-1])
 
         result = dul_repo[blob_sha]
+        path_index.put(index_key, blob_sha)
+
         if not allow_tree and not hasattr(result, "data"):
             raise ObjectDoesNotExist(
                     _("resource '%s' is a directory, not a file") % full_name)
@@ -277,52 +640,30 @@ def get_repo_blob_data_cached(repo, full_name, commit_sha):
     :arg commit_sha: A byte string containing the commit hash
     """
 
-    if isinstance(commit_sha, six.binary_type):
-        from six.moves.urllib.parse import quote_plus
-        cache_key = "%s%R%1".join((
-            CACHE_KEY_ROOT,
-            quote_plus(repo.controldir()),
-            quote_plus(full_name),
-            commit_sha.decode(),
-            ".".join(str(s) for s in sys.version_info[:2]),
-            ))  # type: Optional[Text]
-    else:
-        cache_key = None
-
-    try:
-        import django.core.cache as cache
-    except ImproperlyConfigured:
-        cache_key = None
-
-    if cache_key is None:
+    if not isinstance(commit_sha, six.binary_type):
         result = get_repo_blob(repo, full_name, commit_sha,
                 allow_tree=False).data
         assert isinstance(result, six.binary_type)
         return result
 
-    # Byte string is wrapped in a tuple to force pickling because memcache's
-    # python wrapper appears to auto-decode/encode string values, thus trying
-    # to decode our byte strings. Grr.
-
-    def_cache = cache.caches["default"]
+    dul_repo, true_name = get_true_repo_and_path(repo, full_name)
+    cache_key = make_content_cache_key(
+            "blob", dul_repo.controldir(), true_name, commit_sha,
+            ".".join(str(s) for s in sys.version_info[:2]))
 
-    result = None
-    # Memcache is apparently limited to 250 characters.
-    if len(cache_key) < 240:
-        result = def_cache.get(cache_key)
+    content_cache = get_content_cache()
+    result = content_cache.get(cache_key)
     if result is not None:
-        (result,) = result
         assert isinstance(result, six.binary_type), cache_key
         return result
 
     result = get_repo_blob(repo, full_name, commit_sha,
             allow_tree=False).data
-
-    if len(result) <= getattr(settings, "RELATE_CACHE_MAX_BYTES", 0):
-        def_cache.add(cache_key, (result,), None)
-
     assert isinstance(result, six.binary_type)
 
+    content_cache.add(cache_key, result,
+            shared=len(result) <= getattr(settings, "RELATE_CACHE_MAX_BYTES", 0))
+
     return result
 
 
@@ -547,18 +888,12 @@ def get_raw_yaml_from_repo(repo, full_name, commit_sha):
     :arg commit_sha: A byte string containing the commit hash
     """
 
-    from six.moves.urllib.parse import quote_plus
-    cache_key = "%RAW%%2".join((
-        CACHE_KEY_ROOT,
-        quote_plus(repo.controldir()), quote_plus(full_name), commit_sha.decode(),
-        ))
-
-    import django.core.cache as cache
-    def_cache = cache.caches["default"]
-    result = None
-    # Memcache is apparently limited to 250 characters.
-    if len(cache_key) < 240:
-        result = def_cache.get(cache_key)
+    dul_repo, true_name = get_true_repo_and_path(repo, full_name)
+    cache_key = make_content_cache_key(
+            "rawyaml", dul_repo.controldir(), true_name, commit_sha)
+
+    content_cache = get_content_cache()
+    result = content_cache.get(cache_key)
     if result is not None:
         return result
 
@@ -568,7 +903,7 @@ def get_raw_yaml_from_repo(repo, full_name, commit_sha):
                 get_repo_blob(repo, full_name, commit_sha,
                     allow_tree=False).data))
 
-    def_cache.add(cache_key, result, None)
+    content_cache.add(cache_key, result)
 
     return result
 
@@ -584,18 +919,12 @@ def get_yaml_from_repo(repo, full_name, commit_sha, cached=True):
     """
 
     if cached:
-        from six.moves.urllib.parse import quote_plus
-        cache_key = "%%%2".join(
-                (CACHE_KEY_ROOT,
-                    quote_plus(repo.controldir()), quote_plus(full_name),
-                    commit_sha.decode()))
-
-        import django.core.cache as cache
-        def_cache = cache.caches["default"]
-        result = None
-        # Memcache is apparently limited to 250 characters.
-        if len(cache_key) < 240:
-            result = def_cache.get(cache_key)
+        dul_repo, true_name = get_true_repo_and_path(repo, full_name)
+        cache_key = make_content_cache_key(
+                "yaml", dul_repo.controldir(), true_name, commit_sha)
+
+        content_cache = get_content_cache()
+        result = content_cache.get(cache_key)
         if result is not None:
             return result
 
@@ -607,7 +936,7 @@ def get_yaml_from_repo(repo, full_name, commit_sha, cached=True):
     result = dict_to_struct(load_yaml(expanded))
 
     if cached:
-        def_cache.add(cache_key, result, None)
+        content_cache.add(cache_key, result)
 
     return result
 
@@ -867,21 +1196,14 @@ def markup_to_html(
         reverse_func = reverse
 
     if course is not None and not jinja_env:
-        try:
-            import django.core.cache as cache
-        except ImproperlyConfigured:
-            cache_key = None
-        else:
-            import hashlib
-            cache_key = ("markup:v6:%s:%d:%s:%s"
-                    % (CACHE_KEY_ROOT, course.id, str(commit_sha),
-                        hashlib.md5(text.encode("utf-8")).hexdigest()))
+        cache_key = make_content_cache_key(
+                "markup:v7", str(course.id), commit_sha, text)
 
-            def_cache = cache.caches["default"]
-            result = def_cache.get(cache_key)
-            if result is not None:
-                assert isinstance(result, six.text_type)
-                return result
+        content_cache = get_content_cache()
+        result = content_cache.get(cache_key)
+        if result is not None:
+            assert isinstance(result, six.text_type)
+            return result
 
         if text.lstrip().startswith(JINJA_PREFIX):
             text = remove_prefix(JINJA_PREFIX, text.lstrip())
@@ -919,7 +1241,7 @@ def markup_to_html(
 
     assert isinstance(result, six.text_type)
     if cache_key is not None:
-        def_cache.add(cache_key, result, None)
+        content_cache.add(cache_key, result)
 
     return result
 
@@ -1048,34 +1370,25 @@ DATESPEC_POSTPROCESSORS = [
         ]  # type: List[Any]
 
 
-def parse_date_spec(
-        course,  # type: Optional[Course]
-        datespec,  # type: Union[Text, datetime.date, datetime.datetime]
-        vctx=None,  # type: Optional[ValidationContext]
-        location=None,  # type: Optional[Text]
-        ):
-    # type: (...)  -> datetime.datetime
+_PARSED_DATESPEC_CACHE = None  # type: Optional[LRUCache]
 
-    if datespec is None:
-        return None
 
-    orig_datespec = datespec
+def _parse_datespec_str(datespec_str):
+    # type: (Text) -> Tuple[List[DatespecPostprocessor], Optional[datetime.date], bool, Text, Optional[int]]  # noqa
+    """
+    :returns: a tuple *(postprocs, date, is_end, event_kind, ordinal)*, where
+        *date* is not *None* if *datespec_str* names a literal date.
+    """
 
-    def localize_if_needed(d):
-        # type: (datetime.datetime) -> datetime.datetime
-        if d.tzinfo is None:
-            from relate.utils import localize_datetime
-            return localize_datetime(d)
-        else:
-            return d
+    global _PARSED_DATESPEC_CACHE
+    if _PARSED_DATESPEC_CACHE is None:
+        _PARSED_DATESPEC_CACHE = LRUCache(2000)
 
-    if isinstance(datespec, datetime.datetime):
-        return localize_if_needed(datespec)
-    if isinstance(datespec, datetime.date):
-        return localize_if_needed(
-                datetime.datetime.combine(datespec, datetime.time.min))
+    result = _PARSED_DATESPEC_CACHE.get(datespec_str)
+    if result is not None:
+        return result
 
-    datespec_str = cast(Text, datespec).strip()
+    orig_datespec_str = datespec_str
 
     # {{{ parse postprocessors
 
@@ -1096,12 +1409,10 @@ def parse_date_spec(
 
     # }}}
 
-    def apply_postprocs(dtime):
-        # type: (datetime.datetime) -> datetime.datetime
-        for postproc in postprocs:
-            dtime = postproc.apply(dtime)
-
-        return dtime
+    res_date = None  # type: Optional[datetime.date]
+    is_end = False
+    event_kind = datespec_str
+    ordinal = None  # type: Optional[int]
 
     match = DATE_RE.match(datespec_str)
     if match:
@@ -1109,26 +1420,121 @@ def parse_date_spec(
                 int(match.group(1)),
                 int(match.group(2)),
                 int(match.group(3)))
-        result = localize_if_needed(
-                datetime.datetime.combine(res_date, datetime.time.min))
-        return apply_postprocs(result)
 
-    is_end = datespec_str.startswith(END_PREFIX)
-    if is_end:
-        datespec_str = datespec_str[len(END_PREFIX):]
+    else:
+        is_end = datespec_str.startswith(END_PREFIX)
+        if is_end:
+            datespec_str = datespec_str[len(END_PREFIX):]
+
+        match = TRAILING_NUMERAL_RE.match(datespec_str)
+        if match:
+            # event with numeral
+
+            event_kind = match.group(1)
+            ordinal = int(match.group(2))
+
+        else:
+            # event without numeral
+
+            event_kind = datespec_str
+
+    result = (postprocs, res_date, is_end, event_kind, ordinal)
+    _PARSED_DATESPEC_CACHE.put(orig_datespec_str, result)
+    return result
+
+
+# {{{ event table
+
+_EVENT_TABLES = threading.local()
+
+
+def get_event_table(course):
+    # type: (Course) -> Dict[Tuple[Text, Optional[int]], Tuple[datetime.datetime, Optional[datetime.datetime]]]  # noqa
+    """Return a mapping ``(kind, ordinal) -> (time, end_time)`` of all
+    :class:`course.models.Event` instances of *course*.
+
+    The table is loaded with a single query and then kept for the current
+    thread until :func:`clear_event_tables` is called, which happens at
+    the start of each request and task, and whenever an event is saved or
+    deleted.
+    """
+
+    tables = getattr(_EVENT_TABLES, "tables", None)
+    if tables is None:
+        tables = _EVENT_TABLES.tables = {}
+
+    try:
+        return tables[course.id]
+    except KeyError:
+        pass
+
+    from course.models import Event
+    table = dict(
+            ((kind, ordinal), (time, end_time))
+            for kind, ordinal, time, end_time in (
+                Event.objects
+                .filter(course=course)
+                .values_list("kind", "ordinal", "time", "end_time")))
+
+    tables[course.id] = table
+    return table
 
-    match = TRAILING_NUMERAL_RE.match(datespec_str)
-    if match:
-        # event with numeral
 
-        event_kind = match.group(1)
-        ordinal = int(match.group(2))  # type: Optional[int]
+def clear_event_tables(course_id=None):
+    # type: (Optional[int]) -> None
+    tables = getattr(_EVENT_TABLES, "tables", None)
+    if tables is None:
+        return
 
+    if course_id is None:
+        tables.clear()
     else:
-        # event without numeral
+        tables.pop(course_id, None)
+
+# }}}
 
-        event_kind = datespec_str
-        ordinal = None
+
+def parse_date_spec(
+        course,  # type: Optional[Course]
+        datespec,  # type: Union[Text, datetime.date, datetime.datetime]
+        vctx=None,  # type: Optional[ValidationContext]
+        location=None,  # type: Optional[Text]
+        ):
+    # type: (...)  -> datetime.datetime
+
+    if datespec is None:
+        return None
+
+    orig_datespec = datespec
+
+    def localize_if_needed(d):
+        # type: (datetime.datetime) -> datetime.datetime
+        if d.tzinfo is None:
+            from relate.utils import localize_datetime
+            return localize_datetime(d)
+        else:
+            return d
+
+    if isinstance(datespec, datetime.datetime):
+        return localize_if_needed(datespec)
+    if isinstance(datespec, datetime.date):
+        return localize_if_needed(
+                datetime.datetime.combine(datespec, datetime.time.min))
+
+    postprocs, res_date, is_end, event_kind, ordinal = \
+            _parse_datespec_str(cast(Text, datespec).strip())
+
+    def apply_postprocs(dtime):
+        # type: (datetime.datetime) -> datetime.datetime
+        for postproc in postprocs:
+            dtime = postproc.apply(dtime)
+
+        return dtime
+
+    if res_date is not None:
+        result = localize_if_needed(
+                datetime.datetime.combine(res_date, datetime.time.min))
+        return apply_postprocs(result)
 
     if vctx is not None:
         from course.validation import validate_identifier
@@ -1137,15 +1543,11 @@ def parse_date_spec(
     if course is None:
         return now()
 
-    from course.models import Event
-
     try:
-        event_obj = Event.objects.get(
-            course=course,
-            kind=event_kind,
-            ordinal=ordinal)
+        event_time, event_end_time = get_event_table(course)[
+                (event_kind, ordinal)]
 
-    except ObjectDoesNotExist:
+    except KeyError:
         if vctx is not None:
             vctx.add_warning(
                     location,
@@ -1155,10 +1557,10 @@ def parse_date_spec(
         return now()
 
     if is_end:
-        if event_obj.end_time is not None:
-            result = event_obj.end_time
+        if event_end_time is not None:
+            result = event_end_time
         else:
-            result = event_obj.time
+            result = event_time
             if vctx is not None:
                 vctx.add_warning(
                         location,
@@ -1166,7 +1568,7 @@ def parse_date_spec(
                         % orig_datespec)
 
     else:
-        result = event_obj.time
+        result = event_time
 
     return apply_postprocs(result)
 
@@ -1322,26 +1724,76 @@ def normalize_flow_desc(flow_desc):
     return flow_desc
 
 
+def compile_flow_desc(flow_desc):
+    # type: (FlowDesc) -> FlowDesc
+    """Attach a page lookup index to a normalized *flow_desc*, so that
+    :func:`get_flow_page_desc` need not scan its groups.
+    """
+
+    flow_desc._page_index = dict(
+            ((grp.id, page.id), page)
+            for grp in flow_desc.groups
+            for page in grp.pages)
+
+    return flow_desc
+
+
+_FLOW_DESC_CACHE = None  # type: Optional[LRUCache]
+
+
 def get_flow_desc(repo, course, flow_id, commit_sha):
     # type: (Repo_ish, Course, Text, bytes) -> FlowDesc
 
+    """Return the normalized and compiled flow description for *flow_id*.
+
+    The result is memoized per process for each course, commit and flow,
+    and is shared between callers. It must not be modified.
+    """
+
+    global _FLOW_DESC_CACHE
+    if _FLOW_DESC_CACHE is None:
+        _FLOW_DESC_CACHE = LRUCache(
+                getattr(settings, "RELATE_FLOW_DESC_CACHE_SIZE", 200))
+
+    cache_key = (
+            course.id if course is not None else None,
+            repo.controldir(),
+            getattr(repo, "subdir", None),
+            commit_sha, flow_id)
+
+    flow_desc = _FLOW_DESC_CACHE.get(cache_key)
+    if flow_desc is not None:
+        return flow_desc
+
     flow_desc = get_yaml_from_repo(repo, "flows/%s.yml" % flow_id, commit_sha)
 
     flow_desc = normalize_flow_desc(flow_desc)
 
     flow_desc.description_html = markup_to_html(
             course, repo, commit_sha, getattr(flow_desc, "description", None))
+
+    flow_desc = compile_flow_desc(flow_desc)
+
+    _FLOW_DESC_CACHE.put(cache_key, flow_desc)
     return flow_desc
 
 
 def get_flow_page_desc(flow_id, flow_desc, group_id, page_id):
     # type: (Text, FlowDesc, Text, Text) -> FlowPageDesc
 
-    for grp in flow_desc.groups:
-        if grp.id == group_id:
-            for page in grp.pages:
-                if page.id == page_id:
-                    return page
+    page_index = getattr(flow_desc, "_page_index", None)
+    if page_index is not None:
+        try:
+            return page_index[(group_id, page_id)]
+        except KeyError:
+            pass
+
+    else:
+        for grp in flow_desc.groups:
+            if grp.id == group_id:
+                for page in grp.pages:
+                    if page.id == page_id:
+                        return page
 
     raise ObjectDoesNotExist(
             _("page '%(group_id)s/%(page_id)s' in flow '%(flow_id)s'") % {
@@ -76,6 +76,7 @@ from course.utils import (
         get_session_access_rule,
         get_session_grading_rule,
         FlowSessionGradingRule,
+        FlowRuleParticipationData,
         )
 from course.exam import get_login_exam_ticket
 from course.page import InvalidPageData
@@ -84,7 +85,7 @@ from relate.utils import retry_transaction_decorator
 
 # {{{ mypy
 
-from typing import Any, Optional, Iterable, Tuple, Text  # noqa
+from typing import Any, Optional, Iterable, Tuple, Text, List, Dict  # noqa
 import datetime  # noqa
 from course.models import (  # noqa
         Course,
@@ -109,6 +110,32 @@ from relate.utils import Repo_ish  # noqa
 
 # {{{ page data wrangling
 
+def _bulk_update_page_data(fpds):
+    # type: (List[FlowPageData]) -> None
+
+    """Write the *ordinal* and *title* of each of *fpds* to the database,
+    using one UPDATE statement per chunk of pages.
+    """
+
+    from django.db.models import Case, When, Value, IntegerField, CharField
+
+    chunk_size = 100
+    for i in range(0, len(fpds), chunk_size):
+        chunk = fpds[i:i+chunk_size]
+
+        (FlowPageData.objects
+                .filter(pk__in=[fpd.pk for fpd in chunk])
+                .update(
+                    ordinal=Case(
+                        *[When(pk=fpd.pk, then=Value(fpd.ordinal))
+                            for fpd in chunk],
+                        output_field=IntegerField()),
+                    title=Case(
+                        *[When(pk=fpd.pk, then=Value(fpd.title))
+                            for fpd in chunk],
+                        output_field=CharField())))
+
+
 @retry_transaction_decorator(serializable=True)
 def _adjust_flow_session_page_data_inner(repo, flow_session,
         course_identifier, flow_desc, commit_sha):
@@ -121,12 +148,22 @@ def _adjust_flow_session_page_data_inner(repo, flow_session,
             in_sandbox=False,
             page_uri=None)
 
-    from course.models import FlowPageData
+    # The target layout is computed in memory against the existing page
+    # data. Changes are then written back in bulk.
+
+    all_fpds = list(FlowPageData.objects.filter(flow_session=flow_session))
+
+    new_fpds = []  # type: List[FlowPageData]
+    changed_fpds = {}  # type: Dict[int, FlowPageData]
+
+    def set_ordinal(fpd, new_ordinal):
+        if fpd.ordinal != new_ordinal:
+            fpd.ordinal = new_ordinal
+            if fpd.pk is not None:
+                changed_fpds[fpd.pk] = fpd
 
     def remove_page(fpd):
-        if fpd.ordinal is not None:
-            fpd.ordinal = None
-            fpd.save()
+        set_ordinal(fpd, None)
 
     desc_group_ids = []
 
@@ -142,35 +179,37 @@ def _adjust_flow_session_page_data_inner(repo, flow_session,
         if max_page_count is None:
             max_page_count = len(available_page_ids)
 
+        group_fpds = [fpd for fpd in all_fpds if fpd.group_id == grp.id]
         group_pages = []
 
         # {{{ helper functions
 
         def find_page_desc(page_id):
-            new_page_desc = None
-
-            for page_desc in grp.pages:
-                if page_desc.id == page_id:
-                    new_page_desc = page_desc
-                    break
-
-            assert new_page_desc is not None
+            from course.content import get_flow_page_desc
+            return get_flow_page_desc(
+                    flow_session.flow_id, flow_desc, grp.id, page_id)
 
-            return new_page_desc
+        page_instances = {}
 
         def instantiate_page(page_desc):
+            try:
+                return page_instances[page_desc.id]
+            except KeyError:
+                pass
+
             from course.content import instantiate_flow_page
-            return instantiate_flow_page(
+            page = page_instances[page_desc.id] = instantiate_flow_page(
                     "course '%s', flow '%s', page '%s/%s'"
                     % (course_identifier, flow_session.flow_id,
                         grp.id, page_desc.id),
                     repo, page_desc, commit_sha)
+            return page
 
         def create_fpd(new_page_desc):
             page = instantiate_page(new_page_desc)
 
             data = page.initialize_page_data(pctx)
-            return FlowPageData(
+            fpd = FlowPageData(
                     flow_session=flow_session,
                     ordinal=None,
                     page_type=new_page_desc.type,
@@ -178,19 +217,20 @@ def _adjust_flow_session_page_data_inner(repo, flow_session,
                     page_id=new_page_desc.id,
                     data=data,
                     title=page.title(pctx, data))
+            new_fpds.append(fpd)
+            return fpd
 
         def add_page(fpd):
-            if fpd.ordinal != ordinal[0]:
-                fpd.ordinal = ordinal[0]
-                fpd.save()
+            set_ordinal(fpd, ordinal[0])
 
-            page_desc = find_page_desc(fpd.page_id)
-            page = instantiate_page(page_desc)
-            title = page.title(pctx, fpd.data)
+            if fpd.pk is not None:
+                page_desc = find_page_desc(fpd.page_id)
+                page = instantiate_page(page_desc)
+                title = page.title(pctx, fpd.data)
 
-            if fpd.title != title:
-                fpd.title = title
-                fpd.save()
+                if fpd.title != title:
+                    fpd.title = title
+                    changed_fpds[fpd.pk] = fpd
 
             ordinal[0] += 1
             available_page_ids.remove(fpd.page_id)
@@ -201,12 +241,9 @@ def _adjust_flow_session_page_data_inner(repo, flow_session,
 
         if shuffle:
             # maintain order of existing pages as much as possible
-            for fpd in (FlowPageData.objects
-                    .filter(
-                        flow_session=flow_session,
-                        group_id=grp.id,
-                        ordinal__isnull=False)
-                    .order_by("ordinal")):
+            for fpd in sorted(
+                    (fpd for fpd in group_fpds if fpd.ordinal is not None),
+                    key=lambda fpd: fpd.ordinal):
 
                 if (fpd.page_id in available_page_ids
                         and len(group_pages) < max_page_count):
@@ -216,21 +253,18 @@ def _adjust_flow_session_page_data_inner(repo, flow_session,
 
             assert len(group_pages) <= max_page_count
 
+            page_id_to_fpd = dict(
+                    (fpd.page_id, fpd) for fpd in group_fpds)
+
             from random import choice
 
             # then add randomly chosen new pages
             while len(group_pages) < max_page_count and available_page_ids:
                 new_page_id = choice(available_page_ids)
 
-                new_page_fpds = (FlowPageData.objects
-                        .filter(
-                            flow_session=flow_session,
-                            group_id=grp.id,
-                            page_id=new_page_id))
-
-                if new_page_fpds.count():
+                if new_page_id in page_id_to_fpd:
                     # We already have FlowPageData for this page, revive it
-                    new_page_fpd, = new_page_fpds
+                    new_page_fpd = page_id_to_fpd[new_page_id]
                     assert new_page_fpd.page_id == new_page_id
                 else:
                     # Make a new FlowPageData instance
@@ -245,17 +279,17 @@ def _adjust_flow_session_page_data_inner(repo, flow_session,
             # reorder pages to order in flow
             id_to_fpd = dict(
                     ((fpd.group_id, fpd.page_id), fpd)
-                    for fpd in FlowPageData.objects.filter(
-                        flow_session=flow_session,
-                        group_id=grp.id))
+                    for fpd in group_fpds)
 
             for page_desc in grp.pages:
                 key = (grp.id, page_desc.id)
 
                 if key in id_to_fpd:
                     fpd = id_to_fpd.pop(key)
-                else:
+                elif len(group_pages) < max_page_count:
                     fpd = create_fpd(page_desc)
+                else:
+                    continue
 
                 if len(group_pages) < max_page_count:
                     add_page(fpd)
@@ -265,17 +299,18 @@ def _adjust_flow_session_page_data_inner(repo, flow_session,
 
     # {{{ remove pages orphaned because of group renames
 
-    for fpd in (
-            FlowPageData.objects
-            .filter(
-                flow_session=flow_session,
-                ordinal__isnull=False)
-            .exclude(group_id__in=desc_group_ids)
-            ):
-        remove_page(fpd)
+    for fpd in all_fpds:
+        if fpd.ordinal is not None and fpd.group_id not in desc_group_ids:
+            remove_page(fpd)
 
     # }}}
 
+    if new_fpds:
+        FlowPageData.objects.bulk_create(new_fpds)
+
+    if changed_fpds:
+        _bulk_update_page_data(list(changed_fpds.values()))
+
     return ordinal[0]  # new page count
 
 
@@ -306,30 +341,28 @@ def adjust_flow_session_page_data(repo, flow_session,
             commit_sha)
 
     # These are idempotent, so they don't need to be guarded by a seqcst
-    # transaction.
+    # transaction. Only write these fields, so as not to undo concurrent
+    # changes to the session (e.g. it being finished) made meanwhile.
     flow_session.page_count = new_page_count
     flow_session.page_data_at_revision_key = revision_key
-    flow_session.save()
+    flow_session.save(update_fields=["page_count", "page_data_at_revision_key"])
 
 # }}}
 
 
 # {{{ grade page visit
 
-def grade_page_visit(visit, visit_grade_model=FlowPageVisitGrade,
-        grade_data=None, respect_preview=True):
-    # type: (FlowPageVisit, type, Any, bool) -> None
-    if not visit.is_submitted_answer:
-        raise RuntimeError(_("cannot grade ungraded answer"))
+def _get_visit_grading_page(visit, respect_preview):
+    # type: (FlowPageVisit, bool) -> Tuple[PageBase, Any, bytes]
+
+    """
+    :returns: a tuple ``(page, grading_page_context, course_commit_sha)``
+    """
 
     flow_session = visit.flow_session
     course = flow_session.course
     page_data = visit.page_data
 
-    most_recent_grade = visit.get_most_recent_grade()  # type: Optional[FlowPageVisitGrade]  # noqa
-    if most_recent_grade is not None and grade_data is None:
-        grade_data = most_recent_grade.grade_data
-
     from course.content import (
             get_course_repo,
             get_course_commit_sha,
@@ -356,10 +389,6 @@ def grade_page_visit(visit, visit_grade_model=FlowPageVisitGrade,
             repo=repo, page_desc=page_desc,
             commit_sha=course_commit_sha)
 
-    assert page.expects_answer()
-    if not page.is_answer_gradable():
-        return
-
     from course.page import PageContext
     grading_page_context = PageContext(
             course=course,
@@ -367,6 +396,49 @@ def grade_page_visit(visit, visit_grade_model=FlowPageVisitGrade,
             commit_sha=course_commit_sha,
             flow_session=flow_session)
 
+    return page, grading_page_context, course_commit_sha
+
+
+def grade_page_visit(visit, visit_grade_model=FlowPageVisitGrade,
+        grade_data=None, respect_preview=True, grading_data=None,
+        grading_page=None):
+    # type: (FlowPageVisit, type, Any, bool, Optional[SessionGradingData], Optional[Tuple[PageBase, Any, bytes]]) -> Optional[FlowPageVisitGrade]  # noqa
+
+    """
+    :arg grading_data: if given, a :class:`SessionGradingData` for the
+        visit's session. It is used to look up the most recent grade and
+        is updated with the new grade.
+    :arg grading_page: if given, what :func:`_get_visit_grading_page`
+        returns for *visit*, so that the page is not instantiated again.
+    :returns: the new :class:`course.models.FlowPageVisitGrade`, or *None*
+        if the page is not gradable.
+    """
+
+    if not visit.is_submitted_answer:
+        raise RuntimeError(_("cannot grade ungraded answer"))
+
+    page_data = visit.page_data
+
+    if grading_data is not None:
+        most_recent_grade = grading_data.get_most_recent_grade(visit)  # type: Optional[FlowPageVisitGrade]  # noqa
+    else:
+        most_recent_grade = visit.get_most_recent_grade()
+    if most_recent_grade is not None and grade_data is None:
+        grade_data = most_recent_grade.grade_data
+
+    if grading_page is None:
+        grading_page = _get_visit_grading_page(visit, respect_preview)
+
+    page, grading_page_context, course_commit_sha = grading_page
+
+    from course.analytics import update_page_statistics
+
+    assert page.expects_answer()
+    if not page.is_answer_gradable():
+        update_page_statistics(visit, page, grading_page_context,
+                correctness=None)
+        return None
+
     with translation.override(settings.RELATE_ADMIN_EMAIL_LOCALE):
         answer_feedback = page.grade(
                 grading_page_context, visit.page_data.data,
@@ -382,11 +454,79 @@ def grade_page_visit(visit, visit_grade_model=FlowPageVisitGrade,
     if answer_feedback is not None:
         grade.correctness = answer_feedback.correctness
         grade.feedback, bulk_feedback_json = answer_feedback.as_json()
+        grade.resource_usage = answer_feedback.resource_usage
 
     grade.save()
 
     update_bulk_feedback(page_data, grade, bulk_feedback_json)
 
+    if grading_data is not None:
+        grading_data.record_grade(visit, grade, bulk_feedback_json)
+
+    update_page_statistics(visit, page, grading_page_context,
+            correctness=grade.correctness)
+
+    return grade
+
+
+def get_python_run_requests(visits, respect_preview=True, grading_pages=None):
+    # type: (List[FlowPageVisit], bool, Optional[List[Tuple[PageBase, Any, bytes]]]) -> List[Tuple[Dict, float]]  # noqa
+
+    """
+    :arg grading_pages: if given, what :func:`_get_visit_grading_page`
+        returns for each of *visits*.
+    :returns: a list of the code runs that grading *visits* requires, in
+        the form accepted by :class:`course.page.code.prefetched_python_runs`.
+    """
+
+    if grading_pages is None:
+        grading_pages = [
+                _get_visit_grading_page(visit, respect_preview)
+                for visit in visits]
+
+    run_requests = []
+    for visit, (page, grading_page_context, _unused_sha) in zip(
+            visits, grading_pages):
+
+        if not page.is_answer_gradable():
+            continue
+
+        get_python_run_request = getattr(page, "get_python_run_request", None)
+        if get_python_run_request is None:
+            continue
+
+        run_request = get_python_run_request(grading_page_context, visit.answer)
+        if run_request is not None:
+            run_requests.append(run_request)
+
+    return run_requests
+
+
+def grade_page_visits_concurrently(visits, respect_preview=True,
+        grading_data=None):
+    # type: (List[FlowPageVisit], bool, Optional[SessionGradingData]) -> None
+
+    """Grade each of *visits* as :func:`grade_page_visit` would. Code runs
+    needed by the grading are carried out up front, concurrently, using
+    :class:`course.page.code.prefetched_python_runs`. The grades themselves
+    are created in order on the calling thread.
+
+    Each page is instantiated once, and grading reuses the run requests
+    built for prefetching, see
+    :meth:`course.page.code.PythonCodeQuestion.get_python_run_request`.
+    """
+
+    grading_pages = [
+            _get_visit_grading_page(visit, respect_preview)
+            for visit in visits]
+
+    from course.page.code import prefetched_python_runs
+    with prefetched_python_runs(
+            get_python_run_requests(visits, respect_preview, grading_pages)):
+        for visit, grading_page in zip(visits, grading_pages):
+            grade_page_visit(visit, respect_preview=respect_preview,
+                    grading_data=grading_data, grading_page=grading_page)
+
 # }}}
 
 
@@ -564,6 +704,7 @@ def assemble_answer_visits(flow_session):
 
     answer_page_visits = (
             get_flow_session_graded_answers_qset(flow_session)
+            .select_related("page_data")
             .order_by("visit_time"))
 
     for page_visit in answer_page_visits:
@@ -576,6 +717,146 @@ def assemble_answer_visits(flow_session):
     return answer_visits
 
 
+class SessionGradingData(object):
+    """The grading-relevant state of one flow session, as loaded by
+    :func:`get_sessions_grading_data`.
+
+    .. attribute:: flow_session
+
+    .. attribute:: page_data
+
+        A list of :class:`course.models.FlowPageData`, indexed by ordinal.
+
+    .. attribute:: answer_visits
+
+        A list indexed by ordinal, as returned by
+        :func:`assemble_answer_visits`.
+    """
+
+    def __init__(self, flow_session):
+        # type: (FlowSession) -> None
+        self.flow_session = flow_session
+        self.page_data = []  # type: List[FlowPageData]
+        self.answer_visits = [None] * flow_session.page_count  # type: List[Optional[FlowPageVisit]]  # noqa
+
+        self.visit_id_to_grade = {}  # type: Dict[int, FlowPageVisitGrade]
+
+        # page data id -> (grade id, bulk feedback json)
+        self.page_data_id_to_bulk_feedback = {}  # type: Dict[int, Tuple[int, Any]]  # noqa
+
+    def get_most_recent_grade(self, visit):
+        # type: (FlowPageVisit) -> Optional[FlowPageVisitGrade]
+        return self.visit_id_to_grade.get(visit.id)
+
+    def get_feedback_for_grade(self, grade):
+        # type: (FlowPageVisitGrade) -> Optional[AnswerFeedback]
+
+        bulk_feedback_json = None
+        bulk_feedback_entry = self.page_data_id_to_bulk_feedback.get(
+                grade.visit.page_data_id)
+        if bulk_feedback_entry is not None:
+            bulk_feedback_grade_id, bulk_feedback_json = bulk_feedback_entry
+            if bulk_feedback_grade_id != grade.id:
+                bulk_feedback_json = None
+
+        from course.page.base import AnswerFeedback
+        return AnswerFeedback.from_json(grade.feedback, bulk_feedback_json)
+
+    def record_visit(self, visit):
+        # type: (FlowPageVisit) -> None
+        self.answer_visits[visit.page_data.ordinal] = visit
+
+    def record_grade(self, visit, grade, bulk_feedback_json):
+        # type: (FlowPageVisit, FlowPageVisitGrade, Any) -> None
+        self.visit_id_to_grade[visit.id] = grade
+        self.page_data_id_to_bulk_feedback[visit.page_data_id] = (
+                grade.id, bulk_feedback_json)
+
+
+def get_sessions_grading_data(flow_sessions):
+    # type: (List[FlowSession]) -> List[SessionGradingData]
+
+    """Load page data, answer visits, most recent grades and bulk feedback
+    for all of *flow_sessions* in a constant number of queries.
+
+    :returns: a list of :class:`SessionGradingData`, one per entry of
+        *flow_sessions*.
+    """
+
+    result = [SessionGradingData(fsess) for fsess in flow_sessions]
+    if not flow_sessions:
+        return result
+
+    id_to_data = dict(
+            (data.flow_session.id, data) for data in result)
+
+    page_data_by_id = {}  # type: Dict[int, FlowPageData]
+    for page_data in (FlowPageData.objects
+            .filter(
+                flow_session__in=flow_sessions,
+                ordinal__isnull=False)
+            .order_by("flow_session__id", "ordinal")):
+        data = id_to_data[page_data.flow_session_id]
+        page_data.flow_session = data.flow_session
+        data.page_data.append(page_data)
+        page_data_by_id[page_data.id] = page_data
+
+    visit_ids = set()
+    for page_visit in (
+            get_multiple_flow_session_graded_answers_qset(flow_sessions)
+            .order_by("visit_time")):
+        page_data = page_data_by_id.get(page_visit.page_data_id)
+        if page_data is None:
+            # page data without an ordinal
+            continue
+
+        data = id_to_data[page_visit.flow_session_id]
+        page_visit.flow_session = data.flow_session
+        page_visit.page_data = page_data
+        data.record_visit(page_visit)
+        visit_ids.add(page_visit.id)
+
+        if not data.flow_session.in_progress:
+            assert page_visit.is_submitted_answer is True
+
+    visits_by_id = dict(
+            (visit.id, visit)
+            for data in result
+            for visit in data.answer_visits
+            if visit is not None)
+
+    for grade in (FlowPageVisitGrade.objects
+            .filter(visit__flow_session__in=flow_sessions)
+            .order_by("grade_time")):
+        visit = visits_by_id.get(grade.visit_id)
+        if visit is None:
+            continue
+
+        grade.visit = visit
+        id_to_data[visit.flow_session_id].visit_id_to_grade[visit.id] = grade
+
+    from course.models import FlowPageBulkFeedback
+    for page_data_id, grade_id, bulk_feedback_json in (
+            FlowPageBulkFeedback.objects
+            .filter(page_data__flow_session__in=flow_sessions)
+            .values_list("page_data_id", "grade_id", "bulk_feedback")):
+        page_data = page_data_by_id.get(page_data_id)
+        if page_data is None:
+            continue
+
+        (id_to_data[page_data.flow_session_id]
+                .page_data_id_to_bulk_feedback[page_data_id]) = (
+                        grade_id, bulk_feedback_json)
+
+    return result
+
+
+def get_session_grading_data(flow_session):
+    # type: (FlowSession) -> SessionGradingData
+    data, = get_sessions_grading_data([flow_session])
+    return data
+
+
 def get_all_page_data(flow_session):
     # type: (FlowSession) -> Iterable[FlowPageData]
 
@@ -747,13 +1028,19 @@ def gather_grade_info(
         flow_session,  # type: FlowSession
         grading_rule,  # type: FlowSessionGradingRule
         answer_visits,  # type: List[Optional[FlowPageVisit]]
+        grading_data=None,  # type: Optional[SessionGradingData]
         ):
     # type: (...) -> GradeInfo
     """
+    :arg grading_data: a :class:`SessionGradingData` for *flow_session*.
+        Loaded if not given.
     :returns: a :class:`GradeInfo`
     """
 
-    all_page_data = get_all_page_data(flow_session)
+    if grading_data is None:
+        grading_data = get_session_grading_data(flow_session)
+
+    all_page_data = grading_data.page_data
 
     bonus_points = grading_rule.bonus_points
     points = bonus_points
@@ -784,10 +1071,10 @@ def gather_grade_info(
         if not page.is_answer_gradable():
             continue
 
-        grade = av.get_most_recent_grade()
+        grade = grading_data.get_most_recent_grade(av)
         assert grade is not None
 
-        feedback = get_feedback_for_grade(grade)
+        feedback = grading_data.get_feedback_for_grade(grade)
 
         max_points += grade.max_points
 
@@ -851,17 +1138,36 @@ def grade_page_visits(
         answer_visits,  # type: List[Optional[FlowPageVisit]]
         force_regrade=False,  # type: bool
         respect_preview=True,  # type: bool
+        grading_data=None,  # type: Optional[SessionGradingData]
         ):
     # type: (...) -> None
-    for i in range(len(answer_visits)):
-        answer_visit = answer_visits[i]
 
-        if answer_visit is not None:
+    """
+    :arg grading_data: a :class:`SessionGradingData` for *flow_session*
+        whose :attr:`SessionGradingData.answer_visits` is *answer_visits*.
+        Loaded if not given. Updated with the new visits and grades.
+    """
+
+    if grading_data is None:
+        grading_data = get_session_grading_data(flow_session)
+
+    unsubmitted_visits = [
+            answer_visit for answer_visit in answer_visits
+            if answer_visit is not None and not answer_visit.is_submitted_answer]
+    if unsubmitted_visits:
+        (FlowPageVisit.objects
+                .filter(pk__in=[visit.pk for visit in unsubmitted_visits])
+                .update(is_submitted_answer=True))
+        for answer_visit in unsubmitted_visits:
             answer_visit.is_submitted_answer = True
-            answer_visit.save()
 
-        else:
-            page_data = flow_session.page_data.get(ordinal=i)
+    visits_to_grade = []
+
+    for i in range(len(answer_visits)):
+        answer_visit = answer_visits[i]
+
+        if answer_visit is None:
+            page_data = grading_data.page_data[i]
             page = instantiate_flow_page_with_ctx(fctx, page_data)
 
             if not page.expects_answer():
@@ -883,8 +1189,12 @@ def grade_page_visits(
                 continue
 
         if answer_visit is not None:
-            if not answer_visit.grades.count() or force_regrade:  # type: ignore
-                grade_page_visit(answer_visit, respect_preview=respect_preview)
+            if (grading_data.get_most_recent_grade(answer_visit) is None
+                    or force_regrade):
+                visits_to_grade.append(answer_visit)
+
+    grade_page_visits_concurrently(visits_to_grade,
+            respect_preview=respect_preview, grading_data=grading_data)
 
 
 @retry_transaction_decorator()
@@ -905,11 +1215,13 @@ def finish_flow_session(fctx, flow_session, grading_rule,
         from django.utils.timezone import now
         now_datetime = now()
 
-    answer_visits = assemble_answer_visits(flow_session)
+    grading_data = get_session_grading_data(flow_session)
+    answer_visits = grading_data.answer_visits
 
     grade_page_visits(fctx, flow_session, answer_visits,
             force_regrade=force_regrade,
-            respect_preview=respect_preview)
+            respect_preview=respect_preview,
+            grading_data=grading_data)
 
     # ORDERING RESTRICTION: Must grade pages before gathering grade info
 
@@ -929,7 +1241,7 @@ def finish_flow_session(fctx, flow_session, grading_rule,
     flow_session.save()
 
     return grade_flow_session(fctx, flow_session, grading_rule,
-            answer_visits)
+            answer_visits, grading_data=grading_data)
 
 
 def expire_flow_session(
@@ -938,6 +1250,7 @@ def expire_flow_session(
         grading_rule,  # type: FlowSessionGradingRule
         now_datetime,  # type: datetime.datetime
         past_due_only=False,  # type:bool
+        rule_data=None,  # type: Optional[FlowRuleParticipationData]
         ):
     # type: (...) -> bool
 
@@ -964,7 +1277,7 @@ def expire_flow_session(
         session_start_rule = get_session_start_rule(
                 flow_session.course, flow_session.participation,
                 flow_session.flow_id, fctx.flow_desc, now_datetime,
-                for_rollover=True)
+                for_rollover=True, rule_data=rule_data)
 
         if not session_start_rule.may_start_new_session:
             # No new session allowed: finish.
@@ -977,7 +1290,8 @@ def expire_flow_session(
             # {{{ FIXME: This is weird and should probably not exist.
 
             access_rule = get_session_access_rule(
-                    flow_session, fctx.flow_desc, now_datetime)
+                    flow_session, fctx.flow_desc, now_datetime,
+                    rule_data=rule_data)
 
             if session_start_rule.default_expiration_mode is not None:
                 flow_session.expiration_mode = \
@@ -1009,6 +1323,7 @@ def grade_flow_session(
         flow_session,  # type: FlowSession
         grading_rule,  # type: FlowSessionGradingRule
         answer_visits=None,  # type: Optional[List[Optional[FlowPageVisit]]]
+        grading_data=None,  # type: Optional[SessionGradingData]
         ):
     # type: (...) -> GradeInfo
 
@@ -1016,10 +1331,14 @@ def grade_flow_session(
     grade change with the grade records subsystem.
     """
 
+    if grading_data is None:
+        grading_data = get_session_grading_data(flow_session)
+
     if answer_visits is None:
-        answer_visits = assemble_answer_visits(flow_session)
+        answer_visits = grading_data.answer_visits
 
-    grade_info = gather_grade_info(fctx, flow_session, grading_rule, answer_visits)
+    grade_info = gather_grade_info(fctx, flow_session, grading_rule, answer_visits,
+            grading_data=grading_data)
     assert grade_info is not None
 
     comment = None
@@ -1130,9 +1449,19 @@ def finish_flow_session_standalone(
         now_datetime=None,  # type: Optional[datetime.datetime]
         past_due_only=False,  # type: bool
         respect_preview=True,  # type:bool
+        grading_rule=None,  # type: Optional[FlowSessionGradingRule]
+        rule_data=None,  # type: Optional[FlowRuleParticipationData]
         ):
     # type: (...) -> bool
 
+    """
+    :arg grading_rule: if given, the grading rule already determined for
+        *session* at *now_datetime*, e.g. by
+        :func:`course.utils.get_session_grading_rules`.
+    :arg rule_data: if given, a :class:`course.utils.FlowRuleParticipationData`
+        for the session's participation.
+    """
+
     # Do not be tempted to call adjust_flow_session_page_data in here.
     # This function may be called from within a transaction.
 
@@ -1146,8 +1475,9 @@ def finish_flow_session_standalone(
 
     fctx = FlowContext(repo, course, session.flow_id)
 
-    grading_rule = get_session_grading_rule(session, fctx.flow_desc,
-            now_datetime_filled)
+    if grading_rule is None:
+        grading_rule = get_session_grading_rule(session, fctx.flow_desc,
+                now_datetime_filled, rule_data=rule_data)
 
     if grading_rule.due is not None:
         if (
@@ -1169,22 +1499,32 @@ def expire_flow_session_standalone(
         session,  # type: FlowSession
         now_datetime,  # type: datetime.datetime
         past_due_only=False,  # type: bool
+        grading_rule=None,  # type: Optional[FlowSessionGradingRule]
+        rule_data=None,  # type: Optional[FlowRuleParticipationData]
         ):
     # type: (...) -> bool
+
+    """See :func:`finish_flow_session_standalone` for *grading_rule* and
+    *rule_data*.
+    """
+
     assert session.participation is not None
 
     fctx = FlowContext(repo, course, session.flow_id)
 
-    grading_rule = get_session_grading_rule(session, fctx.flow_desc, now_datetime)
+    if grading_rule is None:
+        grading_rule = get_session_grading_rule(session, fctx.flow_desc,
+                now_datetime, rule_data=rule_data)
 
     return expire_flow_session(fctx, session, grading_rule, now_datetime,
-            past_due_only=past_due_only)
+            past_due_only=past_due_only, rule_data=rule_data)
 
 
 def regrade_session(
         repo,  # type: Repo_ish
         course,  # type: Course
         session,  # type: FlowSession
+        rule_data=None,  # type: Optional[FlowRuleParticipationData]
         ):
     # type: (...) -> None
     adjust_flow_session_page_data(repo, session, course.identifier,
@@ -1192,15 +1532,15 @@ def regrade_session(
 
     if session.in_progress:
         with transaction.atomic():
-            answer_visits = assemble_answer_visits(session)  # type: List[Optional[FlowPageVisit]]  # noqa
-
-            for i in range(len(answer_visits)):
-                answer_visit = answer_visits[i]
-
-                if answer_visit is not None:
-                    if answer_visit.get_most_recent_grade():
-                        # Only make a new grade if there already is one.
-                        grade_page_visit(answer_visit, respect_preview=False)
+            grading_data = get_session_grading_data(session)
+
+            # Only make a new grade if there already is one.
+            grade_page_visits_concurrently([
+                    answer_visit
+                    for answer_visit in grading_data.answer_visits
+                    if answer_visit is not None
+                    and grading_data.get_most_recent_grade(answer_visit)],
+                    respect_preview=False, grading_data=grading_data)
     else:
         prev_completion_time = session.completion_time
 
@@ -1215,11 +1555,11 @@ def regrade_session(
             finish_flow_session_standalone(
                     repo, course, session, force_regrade=True,
                     now_datetime=prev_completion_time,
-                    respect_preview=False)
+                    respect_preview=False, rule_data=rule_data)
 
 
-def recalculate_session_grade(repo, course, session):
-    # type: (Repo_ish, Course, FlowSession) -> None
+def recalculate_session_grade(repo, course, session, rule_data=None):
+    # type: (Repo_ish, Course, FlowSession, Optional[FlowRuleParticipationData]) -> None  # noqa
 
     """Only redoes the final grade determination without regrading
     individual pages.
@@ -1244,7 +1584,7 @@ def recalculate_session_grade(repo, course, session):
         finish_flow_session_standalone(
                 repo, course, session, force_regrade=False,
                 now_datetime=prev_completion_time,
-                respect_preview=False)
+                respect_preview=False, rule_data=rule_data)
 
 # }}}
 
@@ -1277,11 +1617,15 @@ def view_start_flow(pctx, flow_id):
     if request.method == "POST":
         return post_start_flow(pctx, fctx, flow_id)
     else:
+        rule_data = FlowRuleParticipationData(
+                pctx.course, pctx.participation, flow_id)
+
         session_start_rule = get_session_start_rule(
                 pctx.course, pctx.participation,
                 flow_id, fctx.flow_desc, now_datetime,
                 facilities=pctx.request.relate_facilities,
-                login_exam_ticket=login_exam_ticket)
+                login_exam_ticket=login_exam_ticket,
+                rule_data=rule_data)
 
         if session_start_rule.may_list_existing_sessions:
             past_sessions = (FlowSession.objects
@@ -1301,9 +1645,11 @@ def view_start_flow(pctx, flow_id):
                 access_rule = get_session_access_rule(
                         session, fctx.flow_desc, now_datetime,
                         facilities=pctx.request.relate_facilities,
-                        login_exam_ticket=login_exam_ticket)
+                        login_exam_ticket=login_exam_ticket,
+                        rule_data=rule_data)
                 grading_rule = get_session_grading_rule(
-                        session, fctx.flow_desc, now_datetime)
+                        session, fctx.flow_desc, now_datetime,
+                        rule_data=rule_data)
 
                 session_properties = SessionProperties(
                         may_view=flow_permission.view in access_rule.permissions,
@@ -1335,7 +1681,8 @@ def view_start_flow(pctx, flow_id):
             access_rules_tag=session_start_rule.tag_session)
 
         new_session_grading_rule = get_session_grading_rule(
-                potential_session, fctx.flow_desc, now_datetime)
+                potential_session, fctx.flow_desc, now_datetime,
+                rule_data=rule_data)
 
         start_may_decrease_grade = (
                 bool(past_sessions_and_properties)
@@ -2073,6 +2420,7 @@ def post_flow_page(
                 if feedback is not None:
                     grade.correctness = feedback.correctness
                     grade.feedback, bulk_feedback_json = feedback.as_json()
+                    grade.resource_usage = feedback.resource_usage
 
                 grade.save()
 
@@ -2082,6 +2430,13 @@ def post_flow_page(
         else:
             feedback = None
 
+        if answer_visit.is_submitted_answer:
+            from course.analytics import update_page_statistics
+            update_page_statistics(answer_visit, fpctx.page, page_context,
+                    correctness=(
+                        feedback.correctness if feedback is not None
+                        else None))
+
         if (pressed_button == "save_and_next"
                 and not will_receive_feedback(permissions)):
             return redirect("relate-view_flow_page",
@@ -48,8 +48,8 @@ from bootstrap3_datetime.widgets import DateTimePicker
 from course.utils import course_view, render_course_page
 from course.models import (
         Participation, participation_status,
-        GradingOpportunity, GradeChange, GradeStateMachine,
-        grade_state_change_types,
+        GradingOpportunity, GradeChange, GradeStateMachine, GradeCell,
+        rebuild_grade_cells, grade_state_change_types,
         FlowSession, FlowPageVisit)
 from course.flow import adjust_flow_session_page_data
 from course.views import get_now_or_fake_time
@@ -59,10 +59,11 @@ from course.constants import (
 
 # {{{ for mypy
 
-from typing import cast, Tuple, Text, Optional, Any, Iterable  # noqa
+from typing import cast, Tuple, Text, Optional, Any, Iterable, Dict, List  # noqa
 from course.utils import CoursePageContext  # noqa
 from course.content import FlowDesc  # noqa
-from course.models import Course, FlowPageVisitGrade  # noqa
+from course.models import (  # noqa
+        Course, FlowPageVisitGrade, GradeStateDisplayMixin)
 
 # }}}
 
@@ -85,8 +86,6 @@ def view_participant_grades(pctx, participation_id=None):
         if not is_privileged_view:
             raise PermissionDenied(_("may not view other people's grades"))
 
-    # NOTE: It's important that these two queries are sorted consistently,
-    # also consistently with the code below.
     grading_opps = list((GradingOpportunity.objects
             .filter(
                 course=pctx.course,
@@ -94,20 +93,8 @@ def view_participant_grades(pctx, participation_id=None):
                 )
             .order_by("identifier")))
 
-    grade_changes = list(GradeChange.objects
-            .filter(
-                participation=grade_participation,
-                opportunity__course=pctx.course,
-                opportunity__shown_in_grade_book=True)
-            .order_by(
-                "participation__id",
-                "opportunity__identifier",
-                "grade_time")
-            .select_related("participation")
-            .select_related("participation__user")
-            .select_related("opportunity"))
-
-    idx = 0
+    grade_cells = get_grade_cells(pctx.course,
+            GradeCell.objects.filter(participation=grade_participation))
 
     grade_table = []
     for opp in grading_opps:
@@ -119,26 +106,11 @@ def view_participant_grades(pctx, participation_id=None):
             if not opp.shown_in_grade_book:
                 continue
 
-        while (
-                idx < len(grade_changes)
-                and grade_changes[idx].opportunity.identifier < opp.identifier
-                ):
-            idx += 1
-
-        my_grade_changes = []
-        while (
-                idx < len(grade_changes)
-                and grade_changes[idx].opportunity.pk == opp.pk):
-            my_grade_changes.append(grade_changes[idx])
-            idx += 1
-
-        state_machine = GradeStateMachine()
-        state_machine.consume(my_grade_changes)
-
         grade_table.append(
                 GradeInfo(
                     opportunity=opp,
-                    grade_state_machine=state_machine))
+                    grade_state_machine=get_grade_cell(
+                        grade_cells, grade_participation, opp)))
 
     return render_course_page(pctx, "course/gradebook-participant.html", {
         "grade_table": grade_table,
@@ -195,16 +167,48 @@ def view_grading_opportunity_list(pctx):
 
 class GradeInfo:
     def __init__(self, opportunity, grade_state_machine):
-        # type: (GradingOpportunity, GradeStateMachine) -> None
+        # type: (GradingOpportunity, GradeStateDisplayMixin) -> None
+
+        # *grade_state_machine* may also be a GradeCell, which displays the
+        # same way.
         self.opportunity = opportunity
         self.grade_state_machine = grade_state_machine
 
 
+def get_grade_cells(course, queryset=None):
+    # type: (Course, Optional[Any]) -> Dict[Tuple[int, int], GradeCell]
+
+    """
+    :arg queryset: if given, a query set of :class:`course.models.GradeCell`
+        to restrict the result to.
+    :returns: a dictionary mapping ``(participation_id, opportunity_id)`` to
+        the :class:`course.models.GradeCell` of all opportunities of
+        *course* shown in the grade book.
+    """
+
+    if queryset is None:
+        queryset = GradeCell.objects.all()
+
+    return dict(
+            ((cell.participation_id, cell.opportunity_id), cell)
+            for cell in queryset.filter(
+                opportunity__course=course,
+                opportunity__shown_in_grade_book=True))
+
+
+def get_grade_cell(grade_cells, participation, opportunity):
+    # type: (Dict[Tuple[int, int], GradeCell], Participation, GradingOpportunity) -> GradeCell  # noqa
+
+    try:
+        return grade_cells[participation.id, opportunity.id]
+    except KeyError:
+        # no grade changes yet
+        return GradeCell(participation=participation, opportunity=opportunity)
+
+
 def get_grade_table(course):
     # type: (Course) -> Tuple[List[Participation], List[GradingOpportunity], List[List[GradeInfo]]]  # noqa
 
-    # NOTE: It's important that these queries are sorted consistently,
-    # also consistently with the code below.
     grading_opps = list((GradingOpportunity.objects
             .filter(
                 course=course,
@@ -219,53 +223,18 @@ def get_grade_table(course):
             .order_by("id")
             .select_related("user"))
 
-    grade_changes = list(GradeChange.objects
-            .filter(
-                opportunity__course=course,
-                opportunity__shown_in_grade_book=True)
-            .order_by(
-                "participation__id",
-                "opportunity__identifier",
-                "grade_time")
-            .select_related("participation")
-            .select_related("participation__user")
-            .select_related("opportunity"))
-
-    idx = 0
+    grade_cells = get_grade_cells(course,
+            GradeCell.objects.filter(
+                participation__status=participation_status.active))
 
-    grade_table = []
-    for participation in participations:
-        while (
-                idx < len(grade_changes)
-                and grade_changes[idx].participation.id < participation.id):
-            idx += 1
-
-        grade_row = []
-        for opp in grading_opps:
-            while (
-                    idx < len(grade_changes)
-                    and grade_changes[idx].participation.pk == participation.pk
-                    and grade_changes[idx].opportunity.identifier < opp.identifier
-                    ):
-                idx += 1
-
-            my_grade_changes = []
-            while (
-                    idx < len(grade_changes)
-                    and grade_changes[idx].opportunity.pk == opp.pk
-                    and grade_changes[idx].participation.pk == participation.pk):
-                my_grade_changes.append(grade_changes[idx])
-                idx += 1
-
-            state_machine = GradeStateMachine()
-            state_machine.consume(my_grade_changes)
-
-            grade_row.append(
-                    GradeInfo(
-                        opportunity=opp,
-                        grade_state_machine=state_machine))
-
-        grade_table.append(grade_row)
+    grade_table = [
+            [
+                GradeInfo(
+                    opportunity=opp,
+                    grade_state_machine=get_grade_cell(
+                        grade_cells, participation, opp))
+                for opp in grading_opps]
+            for participation in participations]
 
     return participations, grading_opps, grade_table
 
@@ -1300,6 +1269,12 @@ def import_grades(pctx):
 
                 if is_import:
                     GradeChange.objects.bulk_create(grade_changes)
+
+                    # bulk_create does not send post_save, so the grade
+                    # cells are not updated one by one.
+                    rebuild_grade_cells(
+                            opportunity=form.cleaned_data["grading_opportunity"])
+
                     form_text = render_to_string(
                             "course/grade-import-preview.html", {
                                 "show_grade_changes": False,
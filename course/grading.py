@@ -345,6 +345,10 @@ def _save_grade(
             most_recent_grade,
             bulk_feedback_json)
 
+    from course.analytics import update_page_statistics
+    update_page_statistics(fpctx.prev_answer_visit, fpctx.page,
+            fpctx.page_context, correctness=most_recent_grade.correctness)
+
     grading_rule = get_session_grading_rule(
             flow_session, fpctx.flow_desc, now_datetime)
 
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0099_alter_gradingopportunity_identifier'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='flowpagevisitgrade',
+            name='resource_usage',
+            field=jsonfield.fields.JSONField(blank=True, null=True, verbose_name='Resource usage'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0100_flowpagevisitgrade_resource_usage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlowPageStatistics',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('flow_id', models.CharField(max_length=200, verbose_name='Flow ID')),
+                ('group_id', models.CharField(max_length=200, verbose_name='Group ID')),
+                ('page_id', models.CharField(max_length=200, verbose_name='Page ID')),
+                ('attempt_mode', models.CharField(choices=[('latest', 'Latest answer in each session'), ('first', 'First answer of each participant')], max_length=20, verbose_name='Attempt mode')),
+                ('total_count', models.IntegerField(default=0, verbose_name='Total count')),
+                ('answer_count', models.IntegerField(default=0, verbose_name='Answer count')),
+                ('empty_count', models.IntegerField(default=0, verbose_name='Empty count')),
+                ('graded_count', models.IntegerField(default=0, verbose_name='Graded count')),
+                ('correctness_sum', models.FloatField(default=0, verbose_name='Correctness sum')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='course.Course', verbose_name='Course')),
+            ],
+            options={
+                'verbose_name': 'Flow page statistics',
+                'verbose_name_plural': 'Flow page statistics',
+            },
+        ),
+        migrations.CreateModel(
+            name='FlowPageStatisticsEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.IntegerField(verbose_name='Slot')),
+                ('visit_time', models.DateTimeField(verbose_name='Visit time')),
+                ('has_answer', models.BooleanField(verbose_name='Has answer')),
+                ('correctness', models.FloatField(blank=True, null=True, verbose_name='Correctness')),
+                ('normalized_answer', models.TextField(blank=True, null=True, verbose_name='Normalized answer')),
+                ('statistics', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entries', to='course.FlowPageStatistics', verbose_name='Statistics')),
+                ('visit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='course.FlowPageVisit', verbose_name='Visit')),
+            ],
+            options={
+                'verbose_name': 'Flow page statistics entry',
+                'verbose_name_plural': 'Flow page statistics entries',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='flowpagestatisticsentry',
+            unique_together=set([('statistics', 'slot')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='flowpagestatistics',
+            unique_together=set([('course', 'flow_id', 'group_id', 'page_id', 'attempt_mode')]),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0101_flowpagestatistics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GradeCell',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('state', models.CharField(blank=True, choices=[('grading_started', 'Grading started'), ('graded', 'Graded'), ('retrieved', 'Retrieved'), ('unavailable', 'Unavailable'), ('extension', 'Extension'), ('report_sent', 'Report sent'), ('do_over', 'Do-over'), ('exempt', 'Exempt')], max_length=50, null=True, verbose_name='State')),
+                ('aggregated_percentage', models.FloatField(blank=True, null=True, verbose_name='Aggregated percentage')),
+                ('attempt_count', models.IntegerField(default=0, verbose_name='Attempt count')),
+                ('last_graded_time', models.DateTimeField(blank=True, null=True, verbose_name='Last graded time')),
+                ('last_grade_change_time', models.DateTimeField(blank=True, null=True, verbose_name='Last grade change time')),
+                ('opportunity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='course.GradingOpportunity', verbose_name='Grading opportunity')),
+                ('participation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='course.Participation', verbose_name='Participation')),
+            ],
+            options={
+                'verbose_name': 'Grade cell',
+                'verbose_name_plural': 'Grade cells',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='gradecell',
+            unique_together=set([('participation', 'opportunity')]),
+        ),
+    ]
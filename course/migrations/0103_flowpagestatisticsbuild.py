@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0102_gradecell'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FlowPageStatisticsBuild',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('flow_id', models.CharField(max_length=200, verbose_name='Flow ID')),
+                ('build_time', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Build time')),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='course.Course', verbose_name='Course')),
+            ],
+            options={
+                'verbose_name': 'Flow page statistics build',
+                'verbose_name_plural': 'Flow page statistics builds',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='flowpagestatisticsbuild',
+            unique_together=set([('course', 'flow_id')]),
+        ),
+    ]
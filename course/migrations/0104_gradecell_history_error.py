@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def compute_grade_cell(opportunity, grade_changes):
+    # A frozen copy of the rules of GradeStateMachine (and of
+    # GradeCell.set_from_grade_changes) as of this migration, so that later
+    # changes to the models do not affect it.
+
+    def get_percentage(gchange):
+        if (gchange.max_points is not None
+                and gchange.points is not None
+                and gchange.max_points != 0):
+            return 100*gchange.points/gchange.max_points
+        else:
+            return None
+
+    def consume():
+        state = None
+        percentages = []
+        attempt_id_to_gchange = {}
+        last_graded_time = None
+
+        for gchange in grade_changes:
+            if gchange.state == "graded":
+                if state == "unavailable":
+                    raise ValueError("cannot accept grade once opportunity "
+                            "has been marked 'unavailable'")
+                if state == "exempt":
+                    raise ValueError("cannot accept grade once opportunity "
+                            "has been marked 'exempt'")
+
+                state = gchange.state
+                if gchange.attempt_id is not None:
+                    attempt_id_to_gchange[gchange.attempt_id] = gchange
+                else:
+                    percentages.append(get_percentage(gchange))
+
+                last_graded_time = gchange.grade_time
+
+            elif gchange.state in ["unavailable", "do_over", "exempt"]:
+                percentages = []
+                attempt_id_to_gchange = {}
+                state = None if gchange.state == "do_over" else gchange.state
+
+            elif gchange.state in [
+                    "report_sent", "extension", "grading_started",
+                    "retrieved"]:
+                pass
+
+            else:
+                raise RuntimeError(
+                        "invalid grade change state '%s'" % gchange.state)
+
+        percentages.extend(
+                get_percentage(gchange)
+                for gchange in sorted(
+                    (gchange
+                        for gchange in attempt_id_to_gchange.values()
+                        if get_percentage(gchange) is not None),
+                    key=lambda gchange: gchange.grade_time))
+
+        aggregated_percentage = None
+        if percentages:
+            strategy = opportunity.aggregation_strategy
+            if strategy == "max_grade":
+                aggregated_percentage = max(percentages)
+            elif strategy == "min_grade":
+                aggregated_percentage = min(percentages)
+            elif strategy == "avg_grade":
+                aggregated_percentage = sum(percentages)/len(percentages)
+            elif strategy == "use_earliest":
+                aggregated_percentage = percentages[0]
+            elif strategy == "use_latest":
+                aggregated_percentage = percentages[-1]
+            else:
+                raise ValueError(
+                        "invalid grade aggregation strategy '%s'" % strategy)
+
+        return dict(
+                state=state,
+                aggregated_percentage=(
+                    float(aggregated_percentage)
+                    if aggregated_percentage is not None else None),
+                attempt_count=len(percentages),
+                last_graded_time=last_graded_time,
+                history_error=None)
+
+    try:
+        result = consume()
+    except Exception as e:
+        result = dict(
+                state=None,
+                aggregated_percentage=None,
+                attempt_count=0,
+                last_graded_time=None,
+                history_error="%s: %s" % (type(e).__name__, e))
+
+    result["last_grade_change_time"] = grade_changes[-1].grade_time
+    return result
+
+
+def build_grade_cells(apps, schema_editor):
+    GradingOpportunity = apps.get_model("course", "GradingOpportunity")  # noqa
+    GradeChange = apps.get_model("course", "GradeChange")  # noqa
+    GradeCell = apps.get_model("course", "GradeCell")  # noqa
+
+    from itertools import groupby
+
+    for opp in GradingOpportunity.objects.all():
+        GradeCell.objects.filter(opportunity=opp).delete()
+
+        grade_changes = (GradeChange.objects
+                .filter(opportunity=opp)
+                .order_by("participation_id", "grade_time")
+                .only(
+                    "participation_id", "state", "attempt_id", "points",
+                    "max_points", "grade_time"))
+
+        GradeCell.objects.bulk_create([
+            GradeCell(
+                opportunity=opp,
+                participation_id=participation_id,
+                **compute_grade_cell(opp, list(cell_grade_changes)))
+            for participation_id, cell_grade_changes in groupby(
+                grade_changes, lambda gchange: gchange.participation_id)])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0103_flowpagestatisticsbuild'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gradecell',
+            name='history_error',
+            field=models.TextField(blank=True, null=True, verbose_name='History error'),
+        ),
+        migrations.RunPython(build_grade_cells, migrations.RunPython.noop),
+    ]
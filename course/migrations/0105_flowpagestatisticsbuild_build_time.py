@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('course', '0104_gradecell_history_error'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='flowpagestatisticsbuild',
+            name='build_time',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Build time'),
+        ),
+    ]
@@ -24,7 +24,7 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-from typing import cast, Any, Optional, Text, Iterable  # noqa
+from typing import cast, Any, Optional, Text, Iterable, List  # noqa
 
 import six
 
@@ -35,7 +35,7 @@ from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.utils.translation import (
         ugettext_lazy as _, pgettext_lazy, string_concat)
 from django.core.validators import RegexValidator
-from django.db.models.signals import post_save
+from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 
 from django.conf import settings
@@ -50,12 +50,16 @@ from course.constants import (  # noqa
         flow_rule_kind, FLOW_RULE_KIND_CHOICES,
         exam_ticket_states, EXAM_TICKET_STATE_CHOICES,
         participation_permission, PARTICIPATION_PERMISSION_CHOICES,
+        PAGE_STATISTICS_ATTEMPT_MODE_CHOICES,
 
         COURSE_ID_REGEX, GRADING_OPP_ID_REGEX
         )
 
 from course.page.base import AnswerFeedback
 
+import logging
+logger = logging.getLogger(__name__)
+
 
 # {{{ mypy
 
@@ -1040,6 +1044,14 @@ class FlowPageVisitGrade(models.Model):
             # Translators: "Feedback" stands for the feedback of answers.
             verbose_name=_('Feedback'))
 
+    # Resources used to compute this grade, see
+    # :attr:`course.page.AnswerFeedback.resource_usage`. For code questions,
+    # this has the CPU time, peak resident set size and output size of
+    # the grading run.
+
+    resource_usage = JSONField(null=True, blank=True,
+            verbose_name=_('Resource usage'))
+
     def percentage(self):
         if self.correctness is not None:
             return 100*self.correctness
@@ -1113,6 +1125,127 @@ def get_feedback_for_grade(grade):
 # }}}
 
 
+# {{{ flow page statistics
+
+class FlowPageStatisticsBuild(models.Model):
+    """Marks that the :class:`FlowPageStatistics` of a flow are being, or
+    have been, computed from its full answer history. Until it exists, graded
+    answers are not counted incrementally, see
+    :func:`course.analytics.update_page_statistics`. Both lock it, see
+    :func:`course.analytics.rebuild_page_statistics`.
+    """
+
+    course = models.ForeignKey(Course,
+            verbose_name=_('Course'), on_delete=models.CASCADE)
+    flow_id = models.CharField(max_length=200,
+            verbose_name=_('Flow ID'))
+
+    # *None* until the statistics have been computed
+    build_time = models.DateTimeField(null=True, blank=True,
+            verbose_name=_('Build time'))
+
+    class Meta:
+        verbose_name = _("Flow page statistics build")
+        verbose_name_plural = _("Flow page statistics builds")
+        unique_together = (("course", "flow_id"),)
+
+
+class FlowPageStatistics(models.Model):
+    """Answer statistics for one page of a flow, counting the answers of
+    participants included in grade statistics. Kept up to date as answers
+    are graded, see :func:`course.analytics.update_page_statistics`.
+    """
+
+    course = models.ForeignKey(Course,
+            verbose_name=_('Course'), on_delete=models.CASCADE)
+    flow_id = models.CharField(max_length=200,
+            verbose_name=_('Flow ID'))
+    group_id = models.CharField(max_length=200,
+            verbose_name=_('Group ID'))
+    page_id = models.CharField(max_length=200,
+            verbose_name=_('Page ID'))
+    attempt_mode = models.CharField(max_length=20,
+            choices=PAGE_STATISTICS_ATTEMPT_MODE_CHOICES,
+            verbose_name=_('Attempt mode'))
+
+    total_count = models.IntegerField(default=0,
+            verbose_name=_('Total count'))
+    answer_count = models.IntegerField(default=0,
+            verbose_name=_('Answer count'))
+    empty_count = models.IntegerField(default=0,
+            verbose_name=_('Empty count'))
+    graded_count = models.IntegerField(default=0,
+            verbose_name=_('Graded count'))
+    correctness_sum = models.FloatField(default=0,
+            verbose_name=_('Correctness sum'))
+
+    class Meta:
+        verbose_name = _("Flow page statistics")
+        verbose_name_plural = _("Flow page statistics")
+        unique_together = (
+                ("course", "flow_id", "group_id", "page_id", "attempt_mode"),)
+
+
+class FlowPageStatisticsEntry(models.Model):
+    """The answer currently counted in a :class:`FlowPageStatistics` for one
+    flow session (attempt mode ``latest``) or participation (``first``).
+    Grouping these by normalized answer and correctness yields the
+    statistics' answer histogram.
+    """
+
+    statistics = models.ForeignKey(FlowPageStatistics,
+            related_name="entries",
+            verbose_name=_('Statistics'), on_delete=models.CASCADE)
+
+    # the ID of the page data or participation, depending on attempt mode
+    slot = models.IntegerField(verbose_name=_('Slot'))
+
+    visit = models.ForeignKey(FlowPageVisit,
+            verbose_name=_('Visit'), on_delete=models.CASCADE)
+    visit_time = models.DateTimeField(
+            verbose_name=_('Visit time'))
+    has_answer = models.BooleanField(
+            verbose_name=_('Has answer'))
+    correctness = models.FloatField(null=True, blank=True,
+            verbose_name=_('Correctness'))
+    normalized_answer = models.TextField(null=True, blank=True,
+            verbose_name=_('Normalized answer'))
+
+    class Meta:
+        verbose_name = _("Flow page statistics entry")
+        verbose_name_plural = _("Flow page statistics entries")
+        unique_together = (("statistics", "slot"),)
+
+    def get_counts(self):
+        """
+        :returns: a dictionary of the amounts by which this entry contributes
+            to the counts in its :class:`FlowPageStatistics`.
+        """
+
+        graded = self.correctness is not None
+        return {
+                "total_count": 1,
+                "answer_count": int(self.has_answer),
+                "empty_count": int(not self.has_answer),
+                "graded_count": int(graded),
+                "correctness_sum": (
+                    self.correctness
+                    if graded and self.has_answer else 0),
+                }
+
+
+@receiver(post_delete, sender=FlowPageStatisticsEntry)
+def _uncount_page_statistics_entry(sender, instance, using, **kwargs):
+    # e.g. when the visit is deleted along with its flow session
+    from django.db.models import F
+    FlowPageStatistics.objects.using(using).filter(
+            id=instance.statistics_id).update(**dict(
+                (name, F(name) - value)
+                for name, value in six.iteritems(instance.get_counts())))
+
+# }}}
+
+
 # {{{ flow access
 
 def validate_stipulations(stip):
@@ -1490,7 +1623,52 @@ class GradeChange(models.Model):
 
 # {{{ grade state machine
 
-class GradeStateMachine(object):
+class GradeStateDisplayMixin(object):
+    """Formatting of a grade state, shared by :class:`GradeStateMachine` and
+    :class:`GradeCell`. Relies on :attr:`state`, :meth:`percentage` and
+    :meth:`valid_grade_count`.
+    """
+
+    def stringify_state(self):
+        if self.state is None:
+            return u"- ∅ -"
+        elif self.state == grade_state_change_types.exempt:
+            return "_((exempt))"
+        elif self.state == grade_state_change_types.graded:
+            if self.valid_grade_count():
+                result = "%.1f%%" % self.percentage()
+                if self.valid_grade_count() > 1:
+                    result += " (/%d)" % self.valid_grade_count()
+                return result
+            else:
+                return u"- ∅ -"
+        else:
+            return "_((other state))"
+
+    def stringify_machine_readable_state(self):
+        if self.state is None:
+            return u"NONE"
+        elif self.state == grade_state_change_types.exempt:
+            return "EXEMPT"
+        elif self.state == grade_state_change_types.graded:
+            if self.valid_grade_count():
+                return "%.3f" % self.percentage()
+            else:
+                return u"NONE"
+        else:
+            return u"OTHER_STATE"
+
+    def stringify_percentage(self):
+        if self.state == grade_state_change_types.graded:
+            if self.valid_grade_count():
+                return "%.1f" % self.percentage()
+            else:
+                return u""
+        else:
+            return ""
+
+
+class GradeStateMachine(GradeStateDisplayMixin):
     def __init__(self):
         # type: () -> None
         self.opportunity = None
@@ -1627,43 +1805,269 @@ class GradeStateMachine(object):
             raise ValueError(
                     _("invalid grade aggregation strategy '%s'") % strategy)
 
+    def valid_grade_count(self):
+        # type: () -> int
+        return len(self.valid_percentages)
+
+# }}}
+
+
+# {{{ grade cells
+
+class GradeCell(GradeStateDisplayMixin, models.Model):
+    """The outcome of feeding all :class:`GradeChange` objects of one
+    participant and grading opportunity to a :class:`GradeStateMachine`,
+    kept up to date as grade changes are saved and deleted, so that grade
+    books need not replay the grade history.
+    """
+
+    opportunity = models.ForeignKey(GradingOpportunity,
+            verbose_name=_('Grading opportunity'), on_delete=models.CASCADE)
+    participation = models.ForeignKey(Participation,
+            verbose_name=_('Participation'), on_delete=models.CASCADE)
+
+    state = models.CharField(max_length=50, null=True, blank=True,
+            choices=GRADE_STATE_CHANGE_CHOICES,
+            verbose_name=_('State'))
+    aggregated_percentage = models.FloatField(null=True, blank=True,
+            verbose_name=_('Aggregated percentage'))
+    attempt_count = models.IntegerField(default=0,
+            # Translators: number of grades that are aggregated
+            verbose_name=_('Attempt count'))
+    last_graded_time = models.DateTimeField(null=True, blank=True,
+            verbose_name=_('Last graded time'))
+    last_grade_change_time = models.DateTimeField(null=True, blank=True,
+            verbose_name=_('Last grade change time'))
+
+    # why the grade state machine refused this cell's grade history, if it
+    # did. The cell then counts as having no grade.
+    history_error = models.TextField(null=True, blank=True,
+            verbose_name=_('History error'))
+
+    class Meta:
+        verbose_name = _("Grade cell")
+        verbose_name_plural = _("Grade cells")
+        unique_together = (("participation", "opportunity"),)
+
+    def __unicode__(self):
+        return _("%(participation)s on %(opportunityname)s") % {
+            'participation': self.participation,
+            'opportunityname': self.opportunity.name}
+
+    if six.PY3:
+        __str__ = __unicode__
+
+    def percentage(self):
+        # type: () -> Optional[float]
+        return self.aggregated_percentage
+
+    def valid_grade_count(self):
+        # type: () -> int
+        return self.attempt_count
+
     def stringify_state(self):
-        if self.state is None:
-            return u"- ∅ -"
-        elif self.state == grade_state_change_types.exempt:
-            return "_((exempt))"
-        elif self.state == grade_state_change_types.graded:
-            if self.valid_percentages:
-                result = "%.1f%%" % self.percentage()
-                if len(self.valid_percentages) > 1:
-                    result += " (/%d)" % len(self.valid_percentages)
-                return result
-            else:
-                return u"- ∅ -"
-        else:
-            return "_((other state))"
+        if self.history_error is not None:
+            return "_((invalid grade history))"
+        return super(GradeCell, self).stringify_state()
 
     def stringify_machine_readable_state(self):
-        if self.state is None:
-            return u"NONE"
-        elif self.state == grade_state_change_types.exempt:
-            return "EXEMPT"
-        elif self.state == grade_state_change_types.graded:
-            if self.valid_percentages:
-                return "%.3f" % self.percentage()
-            else:
-                return u"NONE"
-        else:
-            return u"OTHER_STATE"
+        if self.history_error is not None:
+            return u"INVALID"
+        return super(GradeCell, self).stringify_machine_readable_state()
 
-    def stringify_percentage(self):
-        if self.state == grade_state_change_types.graded:
-            if self.valid_percentages:
-                return "%.1f" % self.percentage()
-            else:
-                return u""
+    def set_from_grade_changes(self, grade_changes):
+        # type: (List[GradeChange]) -> None
+        """
+        :arg grade_changes: all :class:`GradeChange` objects of this cell,
+            sorted by their :attr:`GradeChange.grade_time`.
+
+        If the grade state machine refuses *grade_changes*, the cell gets no
+        grade and the reason is kept in :attr:`history_error`, so that
+        saving grade changes never fails because of their history.
+        """
+
+        try:
+            machine = GradeStateMachine().consume(grade_changes)
+            percentage = machine.percentage()
+        except Exception as e:
+            self.state = None
+            self.aggregated_percentage = None
+            self.attempt_count = 0
+            self.last_graded_time = None
+            self.history_error = "%s: %s" % (type(e).__name__, e)
         else:
-            return ""
+            self.state = machine.state
+            self.aggregated_percentage = (
+                    float(percentage) if percentage is not None else None)
+            self.attempt_count = machine.valid_grade_count()
+            self.last_graded_time = machine.last_graded_time
+            self.history_error = None
+
+        self.last_grade_change_time = (
+                grade_changes[-1].grade_time if grade_changes else None)
+
+
+def update_grade_cell(participation_id, opportunity_id, using=None):
+    # type: (int, int, Optional[Text]) -> None
+
+    """Bring the :class:`GradeCell` of *participation_id* and
+    *opportunity_id* up to date with its grade changes.
+    """
+
+    from django.db import transaction
+
+    def get_grade_changes():
+        return list(GradeChange.objects.using(using)
+                .filter(
+                    participation_id=participation_id,
+                    opportunity_id=opportunity_id)
+                .order_by("grade_time")
+                .select_related("opportunity"))
+
+    with transaction.atomic(using=using):
+        if not get_grade_changes():
+            # e.g. while the participation is being deleted
+            GradeCell.objects.using(using).filter(
+                    participation_id=participation_id,
+                    opportunity_id=opportunity_id).delete()
+            return
+
+        GradeCell.objects.using(using).get_or_create(
+                participation_id=participation_id,
+                opportunity_id=opportunity_id)
+
+        # Lock the cell before reading the grade changes, so that concurrent
+        # updates of the same cell see each other's grade changes.
+        cell = (GradeCell.objects.using(using)
+                .select_for_update()
+                .get(
+                    participation_id=participation_id,
+                    opportunity_id=opportunity_id))
+
+        cell.set_from_grade_changes(get_grade_changes())
+        cell.save(using=using)
+
+
+def rebuild_grade_cells(course=None, opportunity=None):
+    # type: (Optional[Course], Optional[GradingOpportunity]) -> None
+
+    """Recompute all :class:`GradeCell` objects (of *course* or
+    *opportunity*, if given) from the grade history, one opportunity at a
+    time. Cells whose history the grade state machine refuses are logged,
+    see :attr:`GradeCell.history_error`.
+    """
+
+    from django.db import transaction
+
+    opps = GradingOpportunity.objects.all()
+    if course is not None:
+        opps = opps.filter(course=course)
+    if opportunity is not None:
+        opps = opps.filter(id=opportunity.id)
+
+    for opp in opps:
+        with transaction.atomic():
+            GradeCell.objects.filter(opportunity=opp).delete()
+
+            # Only load what the grade state machine needs.
+            grade_changes = list(GradeChange.objects
+                    .filter(opportunity=opp)
+                    .order_by("participation_id", "grade_time")
+                    .only(
+                        "opportunity_id", "participation_id", "state",
+                        "attempt_id", "points", "max_points", "due_time",
+                        "grade_time"))
+
+            cells = []
+            from itertools import groupby
+            for participation_id, cell_grade_changes in groupby(
+                    grade_changes, lambda gchange: gchange.participation_id):
+                cell_grade_changes = list(cell_grade_changes)
+                for gchange in cell_grade_changes:
+                    gchange.opportunity = opp
+
+                cell = GradeCell(
+                        opportunity=opp,
+                        participation_id=participation_id)
+                cell.set_from_grade_changes(cell_grade_changes)
+                cells.append(cell)
+
+                if cell.history_error is not None:
+                    logger.warning("invalid grade history of participation "
+                            "%d in grading opportunity %d: %s",
+                            participation_id, opp.id, cell.history_error)
+
+            GradeCell.objects.bulk_create(cells)
+
+
+@receiver(pre_save, sender=GradeChange,
+        dispatch_uid="remember_grade_cell")
+def _remember_grade_cell(sender, instance, raw, using, update_fields,
+        **kwargs):
+    # If an existing grade change is moved to another participation or
+    # opportunity (e.g. in the admin), the cell it leaves must be updated.
+    instance._previous_grade_cell = None
+
+    if raw or instance.pk is None:
+        return
+
+    instance._previous_grade_cell = (GradeChange.objects.using(using)
+            .filter(pk=instance.pk)
+            .values_list("participation_id", "opportunity_id")
+            .first())
+
+
+@receiver(post_save, sender=GradeChange, dispatch_uid="update_grade_cell")
+def _update_grade_cell_on_save(sender, instance, created, raw, using,
+        update_fields, **kwargs):
+    if raw:
+        return
+
+    update_grade_cell(instance.participation_id, instance.opportunity_id,
+            using=using)
+
+    previous_cell = getattr(instance, "_previous_grade_cell", None)
+    if (previous_cell is not None
+            and previous_cell != (
+                instance.participation_id, instance.opportunity_id)):
+        update_grade_cell(*previous_cell, using=using)
+
+
+@receiver(post_delete, sender=GradeChange,
+        dispatch_uid="update_grade_cell_on_delete")
+def _update_grade_cell_on_delete(sender, instance, using, **kwargs):
+    update_grade_cell(instance.participation_id, instance.opportunity_id,
+            using=using)
+
+
+@receiver(pre_save, sender=GradingOpportunity,
+        dispatch_uid="remember_aggregation_strategy")
+def _remember_aggregation_strategy(sender, instance, raw, using,
+        update_fields, **kwargs):
+    instance._aggregation_strategy_changed = False
+
+    if (raw
+            or instance.pk is None
+            or (update_fields is not None
+                and "aggregation_strategy" not in update_fields)):
+        return
+
+    stored_strategy = (GradingOpportunity.objects.using(using)
+            .filter(pk=instance.pk)
+            .values_list("aggregation_strategy", flat=True)
+            .first())
+    instance._aggregation_strategy_changed = (
+            stored_strategy != instance.aggregation_strategy)
+
+
+@receiver(post_save, sender=GradingOpportunity,
+        dispatch_uid="update_grade_cells")
+def _update_grade_cells(sender, instance, created, raw, using, update_fields,
+        **kwargs):
+    # Cells only depend on the opportunity through its aggregation strategy.
+    if getattr(instance, "_aggregation_strategy_changed", False):
+        rebuild_grade_cells(opportunity=instance)
+
 # }}}
 
 
@@ -1691,7 +2095,7 @@ def get_flow_grading_opportunity(course, flow_id, flow_desc,
     if not created:
         if gopp.name != default_name:
             gopp.name = default_name
-            gopp.save()
+            gopp.save(update_fields=["name"])
 
     return gopp
 
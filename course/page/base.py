@@ -44,7 +44,7 @@ from django.conf import settings
 
 # {{{ mypy
 
-from typing import Text, Optional, Any, Tuple  # noqa
+from typing import Text, Optional, Any, Tuple, Dict  # noqa
 from django import http  # noqa
 
 if False:
@@ -185,10 +185,18 @@ class AnswerFeedback(object):
         is generated from :attr:`correctness`.
 
     .. attribute:: bulk_feedback
+
+    .. attribute:: resource_usage
+
+        A dictionary describing the resources used to compute this
+        feedback (e.g. by running code), or *None*. Stored as
+        :attr:`course.models.FlowPageVisitGrade.resource_usage`, not as part
+        of the feedback.
     """
 
-    def __init__(self, correctness, feedback=None, bulk_feedback=None):
-        # type: (Optional[float], Optional[Text], Optional[Text]) -> None
+    def __init__(self, correctness, feedback=None, bulk_feedback=None,
+            resource_usage=None):
+        # type: (Optional[float], Optional[Text], Optional[Text], Optional[Dict[Text, Any]]) -> None  # noqa
 
         if correctness is not None:
             # allow for extra credit
@@ -201,6 +209,7 @@ class AnswerFeedback(object):
         self.correctness = correctness
         self.feedback = feedback
         self.bulk_feedback = bulk_feedback
+        self.resource_usage = resource_usage
 
     def as_json(self):
         # type: () -> Tuple[Dict[Text, Any], Dict[Text, Any]]
@@ -291,6 +300,8 @@ class PageBase(object):
     .. automethod:: grade
     .. automethod:: correct_answer
     .. automethod:: normalized_answer
+    .. automethod:: normalized_answer_key
+    .. automethod:: normalized_answers
     .. automethod:: normalized_bytes_answer
     """
 
@@ -666,6 +677,49 @@ class PageBase(object):
         """
         return None
 
+    def normalized_answer_key(self, page_context, page_data, answer_data):
+        """A cheaply computed, hashable value that is equal for two answers
+        exactly if their :meth:`normalized_answer` is, or *None* if no such
+        value is available.
+        """
+        return None
+
+    def normalized_answers(self, page_context, page_data_list, answer_data_list):
+        """Compute :meth:`normalized_answer` for many answers at once.
+        Answers with the same :meth:`normalized_answer_key` are only
+        normalized once.
+
+        :returns: a list of normalized answers corresponding to
+            *answer_data_list*.
+        """
+
+        key_to_normalized_answer = {}  # type: Dict[Any, Any]
+
+        result = []
+        for page_data, answer_data in zip(page_data_list, answer_data_list):
+            if answer_data is None:
+                result.append(None)
+                continue
+
+            key = self.normalized_answer_key(
+                    page_context, page_data, answer_data)
+            if key is None:
+                result.append(
+                        self.normalized_answer(
+                            page_context, page_data, answer_data))
+                continue
+
+            try:
+                normalized_answer = key_to_normalized_answer[key]
+            except KeyError:
+                normalized_answer = key_to_normalized_answer[key] = \
+                        self.normalized_answer(
+                                page_context, page_data, answer_data)
+
+            result.append(normalized_answer)
+
+        return result
+
     def normalized_bytes_answer(self, page_context, page_data, answer_data):
         """An answer to be used for batch download, given as a batch of bytes
         to be stuffed in a zip file.
@@ -311,6 +311,9 @@ class ChoiceQuestion(ChoiceQuestionBase):
         return self.process_choice_string(
                 page_context,
                 self.page_desc.choices[permutation[choice]])
+
+    def normalized_answer_key(self, page_context, page_data, answer_data):
+        return page_data["permutation"][answer_data["choice"]]
 # }}}
 
 
@@ -551,6 +554,11 @@ class MultipleChoiceQuestion(ChoiceQuestionBase):
             [permutation[idx] for idx in choice],
             unpermute=True)
 
+    def normalized_answer_key(self, page_context, page_data, answer_data):
+        permutation = page_data["permutation"]
+        return tuple(sorted(set(
+            permutation[idx] for idx in answer_data["choice"])))
+
 # }}}
 
 
@@ -690,6 +698,9 @@ class SurveyChoiceQuestion(PageBaseWithTitle):
         return self.process_choice_string(
                 page_context,
                 self.page_desc.choices[choice])
+
+    def normalized_answer_key(self, page_context, page_data, answer_data):
+        return answer_data["choice"]
 # }}}
 
 # vim: foldmethod=marker
@@ -72,18 +72,698 @@ class PythonCodeForm(StyledForm):
 
 RUNPY_PORT = 9941
 
+DOCKER_TIMEOUT = 15
+
+# how long a run may wait for a Docker host with free capacity, if it is
+# carried out in the background (see prefetched_python_runs) ...
+DOCKER_HOST_WAIT_TIMEOUT = 120
+
+# ... and otherwise, e.g. while a student waits for feedback
+DOCKER_HOST_INTERACTIVE_WAIT_TIMEOUT = 5
+
+# printed to stderr by runpy once it is listening on RUNPY_PORT
+RUNPY_READY_MARKER = b"RUNPY READY"
+
+# runpy limits the size of what it sends back. This is a backstop in case
+# a response is still larger than that.
+RUNPY_MAX_RESPONSE_BYTES = 32*1024*1024
+
 
 class InvalidPingResponse(RuntimeError):
     pass
 
 
-def request_python_run(run_req, run_timeout, image=None):
-    import json
-    from six.moves import http_client
+class RunpyResponseTooLarge(RuntimeError):
+    pass
+
+
+def read_runpy_response(http_response, readline=False):
+    """Read the response to a run (or, if *readline*, one line of it),
+    up to :data:`RUNPY_MAX_RESPONSE_BYTES`.
+
+    :raises RunpyResponseTooLarge: if the response is larger than that.
+        In *readline* mode, the remainder of the line has been skipped.
+    """
+
+    if readline:
+        data = http_response.readline(RUNPY_MAX_RESPONSE_BYTES + 1)
+        too_large = (
+                len(data) > RUNPY_MAX_RESPONSE_BYTES
+                and not data.endswith(b"\n"))
+        if too_large:
+            while True:
+                rest = http_response.readline(RUNPY_MAX_RESPONSE_BYTES)
+                if not rest or rest.endswith(b"\n"):
+                    break
+    else:
+        data = http_response.read(RUNPY_MAX_RESPONSE_BYTES + 1)
+        too_large = len(data) > RUNPY_MAX_RESPONSE_BYTES
+
+    if too_large:
+        raise RunpyResponseTooLarge()
+
+    return data
+
+
+def make_response_too_large_result():
+    return {
+            "result": "user_error",
+            "message": "Output too large",
+            "traceback": (
+                "The output produced by your code (printed text, plots, "
+                "HTML) was larger than the limit of %d bytes."
+                % RUNPY_MAX_RESPONSE_BYTES),
+            }
+
+
+# {{{ docker hosts
+
+class DockerHost(object):
+    """A Docker daemon that runs code, with its scheduling state in this
+    process.
+
+    .. attribute:: url
+    .. attribute:: tls_config
+    .. attribute:: max_concurrency
+
+        The maximum number of runs on this host at the same time started by
+        this process, or *None* for no limit. Each web and celery process
+        schedules independently, so the host may see up to the number of
+        processes times this many runs.
+    """
+
+    def __init__(self, url, tls_config=None, max_concurrency=None):
+        self.url = url
+        self.tls_config = tls_config
+        self.max_concurrency = max_concurrency
+
+        # Where to reach ports that containers publish on all interfaces
+        from six.moves.urllib.parse import urlparse
+        parsed_url = urlparse(url)
+        if parsed_url.scheme in ["tcp", "http", "https"] and parsed_url.hostname:
+            self.connect_host = parsed_url.hostname
+        else:
+            self.connect_host = "localhost"
+
+        self.active_runs = 0
+        self.total_runs = 0
+        self.failures = 0
+        self.disabled_until = None
+
+    def has_capacity(self):
+        return (self.max_concurrency is None
+                or self.active_runs < self.max_concurrency)
+
+
+class DockerHostScheduler(object):
+    """Places runs on a list of :class:`DockerHost` instances, preferring
+    the host with the fewest active runs and going round-robin among equally
+    loaded hosts. A host that fails is taken out of rotation for
+    *retry_seconds*, unless no other host is left.
+
+    Active runs and failures are only tracked within the current process.
+    """
+
+    def __init__(self, hosts, retry_seconds):
+        import threading
+
+        assert hosts
+        self.hosts = hosts
+        self.retry_seconds = retry_seconds
+
+        self.condition = threading.Condition()
+        self.next_index = 0
+        self.waiting = 0
+
+    def get_host(self, url):
+        for host in self.hosts:
+            if host.url == url:
+                return host
+
+        raise KeyError(url)
+
+    def is_available(self, host):
+        from time import time
+        return host.disabled_until is None or host.disabled_until <= time()
+
+    def _pick_host(self):
+        # must be called with self.condition held
+
+        candidates = [host for host in self.hosts if self.is_available(host)]
+        if not candidates:
+            # Everything is failing. Better to try again than to give up.
+            candidates = self.hosts
+
+        candidates = [host for host in candidates if host.has_capacity()]
+        if not candidates:
+            return None
+
+        nhosts = len(self.hosts)
+        start = self.next_index
+
+        def rotation_key(host):
+            return (self.hosts.index(host) - start) % nhosts
+
+        host = min(candidates,
+                key=lambda host: (host.active_runs, rotation_key(host)))
+
+        self.next_index = (self.hosts.index(host) + 1) % nhosts
+        return host
+
+    def acquire(self, timeout=None):
+        """
+        :returns: the :class:`DockerHost` on which to run, after counting
+            the run as active on it, or *None* if no host had capacity
+            within *timeout* seconds.
+        """
+
+        from time import time
+
+        with self.condition:
+            deadline = None if timeout is None else time() + timeout
+
+            self.waiting += 1
+            try:
+                while True:
+                    host = self._pick_host()
+                    if host is not None:
+                        host.active_runs += 1
+                        host.total_runs += 1
+                        return host
+
+                    if deadline is None:
+                        self.condition.wait()
+                    else:
+                        remaining = deadline - time()
+                        if remaining <= 0:
+                            return None
+                        self.condition.wait(remaining)
+            finally:
+                self.waiting -= 1
+
+    def release(self, host, failed=False):
+        with self.condition:
+            host.active_runs -= 1
+
+            if failed:
+                self.report_failure(host)
+            else:
+                host.disabled_until = None
+
+            self.condition.notify()
+
+    def report_failure(self, host):
+        from time import time
+
+        with self.condition:
+            host.failures += 1
+            host.disabled_until = time() + self.retry_seconds
+
+    def get_stats(self):
+        """
+        :returns: a dictionary with the number of runs waiting for a host in
+            *waiting* and a list of per-host dictionaries in *hosts*.
+        """
+
+        with self.condition:
+            return {
+                    "waiting": self.waiting,
+                    "hosts": [
+                        {
+                            "url": host.url,
+                            "active_runs": host.active_runs,
+                            "max_concurrency": host.max_concurrency,
+                            "total_runs": host.total_runs,
+                            "failures": host.failures,
+                            "available": self.is_available(host),
+                            }
+                        for host in self.hosts],
+                    }
+
+
+_DOCKER_HOST_SCHEDULER = None
+
+
+def get_docker_host_scheduler():
+    """
+    :returns: the process-wide :class:`DockerHostScheduler` for the hosts
+        in ``RELATE_DOCKER_HOSTS``, or for ``RELATE_DOCKER_URL`` if that is
+        not set.
+    """
+
+    global _DOCKER_HOST_SCHEDULER
+
+    if _DOCKER_HOST_SCHEDULER is None:
+        host_configs = getattr(settings, "RELATE_DOCKER_HOSTS", None)
+        if host_configs:
+            hosts = [
+                    DockerHost(
+                        url=host_config["url"],
+                        tls_config=host_config.get("tls_config"),
+                        max_concurrency=host_config.get("max_concurrency"))
+                    for host_config in host_configs]
+        else:
+            hosts = [DockerHost(
+                url=getattr(settings, "RELATE_DOCKER_URL",
+                    "unix://var/run/docker.sock"),
+                tls_config=getattr(settings, "RELATE_DOCKER_TLS_CONFIG",
+                    None))]
+
+        _DOCKER_HOST_SCHEDULER = DockerHostScheduler(hosts,
+                retry_seconds=getattr(
+                    settings, "RELATE_DOCKER_HOST_RETRY_SECONDS", 60))
+
+    return _DOCKER_HOST_SCHEDULER
+
+# }}}
+
+
+# {{{ runpy containers
+
+def get_docker_client(host=None):
+    """
+    :arg host: a :class:`DockerHost`. Defaults to the first configured host.
+    """
+
     import docker
+
+    if host is None:
+        host = get_docker_host_scheduler().hosts[0]
+
+    return docker.Client(
+            base_url=host.url,
+            tls=host.tls_config,
+            timeout=DOCKER_TIMEOUT,
+            version="1.19")
+
+
+def start_runpy_container(docker_cnx, image, timings=None,
+        default_host_ip="localhost"):
+    """Create and start a single-use runpy container.
+
+    :arg default_host_ip: the address at which to reach the container if it
+        publishes its port on all interfaces.
+    :arg timings: if given, a dictionary into which the time (in seconds)
+        taken to *create* and *start* the container is written.
+    :returns: a tuple ``(container_id, connect_host_ip, port)``
+    """
+
+    from time import time
+    if timings is None:
+        timings = {}
+
+    create_start_time = time()
+
+    host_config = {
+            "Memory": getattr(
+                settings, "RELATE_DOCKER_RUNPY_MEMORY_LIMIT", 384*10**6),
+            "MemorySwap": -1,
+            "PublishAllPorts": True,
+            # Do not enable: matplotlib stops working if enabled.
+            # "ReadonlyRootfs": True,
+            }
+
+    data_dir = get_runpy_data_dir()
+    if data_dir is not None:
+        from .code_runpy_backend import DATA_FILE_DIR
+        host_config["Binds"] = ["%s:%s:ro" % (data_dir, DATA_FILE_DIR)]
+
+    dresult = docker_cnx.create_container(
+            image=image,
+            command=[
+                "/opt/runpy/runpy",
+                "-1"],
+            host_config=host_config,
+            user="runpy")
+
+    container_id = dresult["Id"]
+
+    start_start_time = time()
+    timings["create"] = start_start_time - create_start_time
+
+    try:
+        # FIXME: Prohibit networking
+
+        docker_cnx.start(container_id)
+
+        container_props = docker_cnx.inspect_container(container_id)
+        (port_info,) = (container_props
+                ["NetworkSettings"]["Ports"]["%d/tcp" % RUNPY_PORT])
+        port_host_ip = port_info.get("HostIp")
+
+        connect_host_ip = default_host_ip
+        if port_host_ip != "0.0.0.0":
+            connect_host_ip = port_host_ip
+
+        port = int(port_info["HostPort"])
+    except Exception:
+        remove_runpy_container(docker_cnx, container_id)
+        raise
+
+    timings["start"] = time() - start_start_time
+
+    return container_id, connect_host_ip, port
+
+
+def remove_runpy_container(docker_cnx, container_id):
+    from docker.errors import APIError as DockerAPIError
+    try:
+        docker_cnx.remove_container(container_id, force=True)
+    except DockerAPIError:
+        # Oh well. No need to bother the students with this nonsense.
+        pass
+
+
+def ping_runpy_container(connect_host_ip, port, timeout=None):
+    """
+    :returns: *True* if the container answered the ping, *False* if it is
+        not (yet) ready.
+    """
+
+    from six.moves import http_client
     import socket
     import errno
-    from docker.errors import APIError as DockerAPIError
+
+    try:
+        connection = http_client.HTTPConnection(connect_host_ip, port,
+                timeout=timeout)
+
+        connection.request('GET', '/ping')
+
+        response = connection.getresponse()
+        response_data = response.read().decode()
+
+        if response_data != "OK":
+            raise InvalidPingResponse()
+
+        return True
+
+    except (http_client.BadStatusLine, InvalidPingResponse):
+        return False
+
+    except socket.timeout:
+        return False
+
+    except socket.error as e:
+        if e.errno in [errno.ECONNRESET, errno.ECONNREFUSED]:
+            return False
+        else:
+            raise
+
+
+def wait_for_runpy_ready_marker(docker_cnx, container_id):
+    """Follow the log of the container until runpy reports that it is
+    listening. Blocks for at most the read timeout of *docker_cnx*.
+
+    :returns: *True* if runpy reported readiness, *False* if the log ended
+        (i.e. the container exited) before it did.
+    """
+
+    for chunk in docker_cnx.logs(container_id,
+            stdout=False, stderr=True, stream=True, follow=True):
+        if RUNPY_READY_MARKER in chunk:
+            return True
+
+    return False
+
+
+def wait_for_runpy_container(connect_host_ip, port,
+        docker_cnx=None, container_id=None):
+    """Wait until the container is ready to accept a run.
+
+    If *docker_cnx* and *container_id* are given and the setting
+    ``RELATE_DOCKER_RUNPY_READY_MARKER`` is *True*, this waits for the
+    readiness marker in the container's log. Otherwise, or if the marker does
+    not appear (e.g. because the image predates it), the container is pinged
+    with exponential backoff.
+
+    :returns: *None* once the container is ready, or a run result describing
+        the failure if it did not become ready within :data:`DOCKER_TIMEOUT`.
+    """
+
+    from time import time, sleep
+    from traceback import format_exc
+
+    def make_error(message):
+        return {
+                "result": "uncaught_error",
+                "message": message,
+                "traceback": "".join(format_exc()),
+                "exec_host": connect_host_ip,
+                }
+
+    if (docker_cnx is not None
+            and container_id is not None
+            and getattr(settings, "RELATE_DOCKER_RUNPY_READY_MARKER", False)):
+        try:
+            if wait_for_runpy_ready_marker(docker_cnx, container_id):
+                return None
+        except Exception:
+            # No marker within the read timeout. Fall back to pinging below.
+            pass
+        else:
+            return make_error("Container exited before it became ready.")
+
+    start_time = time()
+    delay = 0.005
+
+    while True:
+        if ping_runpy_container(connect_host_ip, port):
+            return None
+
+        if time() - start_time < DOCKER_TIMEOUT:
+            sleep(delay)
+            delay = min(2*delay, 0.25)
+            # and retry
+        else:
+            return make_error("Timeout waiting for container.")
+
+
+class RunpyContainerPool(object):
+    """Keeps up to *size* started, single-use runpy containers per Docker
+    host and image ready, so that a run does not have to wait for a
+    container to start.
+
+    Containers are started by a background thread. Containers older than
+    *max_age* seconds are discarded, as are containers that fail a health
+    check when they are handed out.
+    """
+
+    def __init__(self, size, max_age):
+        import threading
+
+        self.size = size
+        self.max_age = max_age
+
+        self.lock = threading.Lock()
+        self.refill_needed = threading.Event()
+        self.refill_thread = None
+
+        # (host url, image) -> deque of
+        # (container_id, connect_host_ip, port, start_time)
+        self.containers = {}
+
+    def acquire(self, host, image):
+        """
+        :arg host: the :class:`DockerHost` on which the container should run.
+        :returns: a tuple ``(container_id, connect_host_ip, port)`` of a
+            ready container that now belongs to the caller, or *None* if
+            none is available. The caller must remove the container after
+            use.
+        """
+
+        from time import time
+        from collections import deque
+
+        while True:
+            with self.lock:
+                containers = self.containers.setdefault(
+                        (host.url, image), deque())
+                self._ensure_refill_thread()
+                self.refill_needed.set()
+
+                if not containers:
+                    return None
+
+                container_id, connect_host_ip, port, start_time = \
+                        containers.popleft()
+
+            if (time() - start_time < self.max_age
+                    and ping_runpy_container(connect_host_ip, port, timeout=1)):
+                return container_id, connect_host_ip, port
+
+            self._discard(host, container_id)
+
+    def _discard(self, host, container_id):
+        try:
+            remove_runpy_container(get_docker_client(host), container_id)
+        except Exception:
+            pass
+
+    def _ensure_refill_thread(self):
+        # must be called with self.lock held
+
+        if self.refill_thread is not None and self.refill_thread.is_alive():
+            return
+
+        import threading
+        self.refill_thread = threading.Thread(
+                target=self._refill_loop, name="runpy-container-pool")
+        self.refill_thread.daemon = True
+        self.refill_thread.start()
+
+    def _refill_loop(self):
+        from time import time
+
+        scheduler = get_docker_host_scheduler()
+        docker_cnxs = {}
+
+        def get_client(host_url):
+            if host_url not in docker_cnxs:
+                docker_cnxs[host_url] = get_docker_client(
+                        scheduler.get_host(host_url))
+            return docker_cnxs[host_url]
+
+        while True:
+            self.refill_needed.wait(timeout=max(1, self.max_age / 4))
+            self.refill_needed.clear()
+
+            # {{{ discard expired containers
+
+            expired = []
+            with self.lock:
+                for (host_url, image), containers in six.iteritems(
+                        self.containers):
+                    while (containers
+                            and time() - containers[0][3] >= self.max_age):
+                        expired.append((host_url, containers.popleft()[0]))
+
+            for host_url, container_id in expired:
+                remove_runpy_container(get_client(host_url), container_id)
+
+            # }}}
+
+            with self.lock:
+                keys = list(self.containers.keys())
+
+            for key in keys:
+                host_url, image = key
+                host = scheduler.get_host(host_url)
+                if not scheduler.is_available(host):
+                    continue
+
+                docker_cnx = get_client(host_url)
+
+                while len(self.containers[key]) < self.size:
+                    try:
+                        container_id, connect_host_ip, port = \
+                                start_runpy_container(docker_cnx, image,
+                                    default_host_ip=host.connect_host)
+                    except Exception:
+                        # Docker is unhappy. Try again later, and in the
+                        # meantime let requests start their own containers.
+                        scheduler.report_failure(host)
+                        break
+
+                    try:
+                        ready = wait_for_runpy_container(
+                                connect_host_ip, port,
+                                docker_cnx, container_id) is None
+                    except Exception:
+                        ready = False
+
+                    if not ready:
+                        remove_runpy_container(docker_cnx, container_id)
+                        break
+
+                    with self.lock:
+                        self.containers[key].append(
+                                (container_id, connect_host_ip, port, time()))
+
+    def clear(self):
+        with self.lock:
+            containers_to_remove = [
+                    (host_url, container[0])
+                    for (host_url, image), containers in six.iteritems(
+                        self.containers)
+                    for container in containers]
+            for containers in six.itervalues(self.containers):
+                containers.clear()
+
+        scheduler = get_docker_host_scheduler()
+        for host_url, container_id in containers_to_remove:
+            try:
+                remove_runpy_container(
+                        get_docker_client(scheduler.get_host(host_url)),
+                        container_id)
+            except Exception:
+                pass
+
+
+_RUNPY_CONTAINER_POOL = None
+
+
+def get_runpy_container_pool():
+    """
+    :returns: the process-wide :class:`RunpyContainerPool`, or *None* if
+        ``RELATE_RUNPY_CONTAINER_POOL_SIZE`` is 0.
+    """
+
+    global _RUNPY_CONTAINER_POOL
+
+    if _RUNPY_CONTAINER_POOL is None:
+        size = getattr(settings, "RELATE_RUNPY_CONTAINER_POOL_SIZE", 0)
+        if not size:
+            return None
+
+        _RUNPY_CONTAINER_POOL = RunpyContainerPool(size,
+                max_age=getattr(
+                    settings, "RELATE_RUNPY_CONTAINER_MAX_AGE", 600))
+
+        import atexit
+        atexit.register(_RUNPY_CONTAINER_POOL.clear)
+
+    return _RUNPY_CONTAINER_POOL
+
+# }}}
+
+
+class RunpyContainerUnavailable(RuntimeError):
+    def __init__(self, result):
+        super(RunpyContainerUnavailable, self).__init__(result["message"])
+        self.result = result
+
+
+def get_docker_host_wait_timeout():
+    """
+    :returns: how long (in seconds) a run on the current thread may wait for
+        a Docker host with free capacity, see
+        :class:`prefetched_python_runs`.
+    """
+
+    return getattr(_PREFETCHED_RUNS, "host_wait_timeout",
+            DOCKER_HOST_INTERACTIVE_WAIT_TIMEOUT)
+
+
+def run_in_runpy_container(image, send_request, timings,
+        host_wait_timeout=None):
+    """Find a host for and obtain a ready runpy container, call
+    *send_request(connect_host_ip, port)*, then remove the container.
+
+    :arg host_wait_timeout: how long to wait for a Docker host with free
+        capacity. Defaults to :func:`get_docker_host_wait_timeout`.
+
+    :arg timings: a dictionary into which the time (in seconds) spent in
+        each phase is written: *schedule*, then *create*, *start* and *ready*
+        for a newly started container (or *acquire* for one taken from the
+        :class:`RunpyContainerPool`), and *remove*. *send_request* may add
+        its own entries.
+    :returns: the return value of *send_request*.
+    :raises RunpyContainerUnavailable: if no container could be made ready.
+        Its *result* attribute holds a run result describing the failure.
+    """
+
+    from time import time
 
     debug = False
     if debug:
@@ -93,136 +773,127 @@ def request_python_run(run_req, run_timeout, image=None):
         def debug_print(s):
             pass
 
-    docker_timeout = 15
-
-    # DEBUGGING SWITCH: 1 for 'spawn container', 0 for 'static container'
-    if 1:
-        docker_url = getattr(settings, "RELATE_DOCKER_URL",
-                "unix://var/run/docker.sock")
-        docker_tls = getattr(settings, "RELATE_DOCKER_TLS_CONFIG",
-                None)
-        docker_cnx = docker.Client(
-                base_url=docker_url,
-                tls=docker_tls,
-                timeout=docker_timeout,
-                version="1.19")
-
-        if image is None:
-            image = settings.RELATE_DOCKER_RUNPY_IMAGE
-
-        dresult = docker_cnx.create_container(
-                image=image,
-                command=[
-                    "/opt/runpy/runpy",
-                    "-1"],
-                host_config={
-                    "Memory": 384*10**6,
-                    "MemorySwap": -1,
-                    "PublishAllPorts": True,
-                    # Do not enable: matplotlib stops working if enabled.
-                    # "ReadonlyRootfs": True,
-                    },
-                user="runpy")
-
-        container_id = dresult["Id"]
-    else:
-        container_id = None
+    if image is None:
+        image = settings.RELATE_DOCKER_RUNPY_IMAGE
 
+    docker_cnx = None
+    container = None
+    container_id = None
     connect_host_ip = 'localhost'
+    port = RUNPY_PORT
 
-    try:
-        # FIXME: Prohibit networking
-
-        if container_id is not None:
-            docker_cnx.start(container_id)
+    scheduler = None
+    host = None
+    host_failed = False
 
-            container_props = docker_cnx.inspect_container(container_id)
-            (port_info,) = (container_props
-                    ["NetworkSettings"]["Ports"]["%d/tcp" % RUNPY_PORT])
-            port_host_ip = port_info.get("HostIp")
+    # DEBUGGING SWITCH: 1 for 'spawn container', 0 for 'static container'
+    if 1:
+        scheduler = get_docker_host_scheduler()
 
-            if port_host_ip != "0.0.0.0":
-                connect_host_ip = port_host_ip
+        if host_wait_timeout is None:
+            host_wait_timeout = get_docker_host_wait_timeout()
 
-            port = int(port_info["HostPort"])
-        else:
-            port = RUNPY_PORT
+        schedule_start_time = time()
+        host = scheduler.acquire(timeout=host_wait_timeout)
+        timings["schedule"] = time() - schedule_start_time
 
-        from time import time, sleep
-        start_time = time()
-
-        # {{{ ping until response received
+        if host is None:
+            raise RunpyContainerUnavailable({
+                    "result": "host_unavailable",
+                    "message": "No code execution host available.",
+                    })
 
-        from traceback import format_exc
+        try:
+            pool = get_runpy_container_pool()
+            if pool is not None:
+                acquire_start_time = time()
+                container = pool.acquire(host, image)
+                timings["acquire"] = time() - acquire_start_time
+
+            docker_cnx = get_docker_client(host)
+
+            if container is not None:
+                container_id, connect_host_ip, port = container
+                debug_print("USING POOLED CONTAINER")
+            else:
+                container_id, connect_host_ip, port = start_runpy_container(
+                        docker_cnx, image, timings,
+                        default_host_ip=host.connect_host)
+        except Exception:
+            scheduler.release(host, failed=True)
+            raise
 
-        def check_timeout():
-                if time() - start_time < docker_timeout:
-                    sleep(0.1)
-                    # and retry
-                else:
-                    return {
-                            "result": "uncaught_error",
-                            "message": "Timeout waiting for container.",
-                            "traceback": "".join(format_exc()),
-                            "exec_host": connect_host_ip,
-                            }
+    try:
+        if container is None:
+            ready_start_time = time()
+            ready_result = wait_for_runpy_container(connect_host_ip, port,
+                    docker_cnx, container_id)
+            timings["ready"] = time() - ready_start_time
 
-        while True:
-            try:
-                connection = http_client.HTTPConnection(connect_host_ip, port)
+            if ready_result is not None:
+                host_failed = True
+                raise RunpyContainerUnavailable(ready_result)
 
-                connection.request('GET', '/ping')
+            debug_print("CONTAINER READY")
 
-                response = connection.getresponse()
-                response_data = response.read().decode()
+        return send_request(connect_host_ip, port)
 
-                if response_data != "OK":
-                    raise InvalidPingResponse()
+    finally:
+        if container_id is not None:
+            debug_print("-----------BEGIN DOCKER LOGS for %s" % container_id)
+            debug_print(docker_cnx.logs(container_id))
+            debug_print("-----------END DOCKER LOGS for %s" % container_id)
 
-                break
+            remove_start_time = time()
+            remove_runpy_container(docker_cnx, container_id)
+            timings["remove"] = time() - remove_start_time
 
-            except (http_client.BadStatusLine, InvalidPingResponse):
-                ct_res = check_timeout()
-                if ct_res is not None:
-                    return ct_res
+        if host is not None:
+            scheduler.release(host, failed=host_failed)
 
-            except socket.error as e:
-                if e.errno in [errno.ECONNRESET, errno.ECONNREFUSED]:
-                    ct_res = check_timeout()
-                    if ct_res is not None:
-                        return ct_res
 
-                else:
-                    raise
+def request_python_run(run_req, run_timeout, image=None,
+        host_wait_timeout=None):
+    """
+    The returned result carries the time (in seconds) spent in each phase
+    of the run in its *timings* entry, see :func:`run_in_runpy_container`.
+    The time spent running the code is in *run*.
+    """
 
-        # }}}
+    import json
+    from six.moves import http_client
+    import socket
+    from time import time
 
-        debug_print("PING SUCCESSFUL")
+    timings = {}
 
-        try:
-            # Add a second to accommodate 'wire' delays
-            connection = http_client.HTTPConnection(connect_host_ip, port,
-                    timeout=1 + run_timeout)
+    def send_request(connect_host_ip, port):
+        # Add a second to accommodate 'wire' delays
+        connection = http_client.HTTPConnection(connect_host_ip, port,
+                timeout=1 + run_timeout)
 
-            headers = {'Content-type': 'application/json'}
+        headers = {'Content-type': 'application/json'}
 
-            json_run_req = json.dumps(run_req).encode("utf-8")
+        json_run_req = json.dumps(run_req).encode("utf-8")
 
-            from time import time
-            start_time = time()
+        start_time = time()
 
-            debug_print("BEFPOST")
+        try:
             connection.request('POST', '/run-python', json_run_req, headers)
-            debug_print("AFTPOST")
 
             http_response = connection.getresponse()
-            debug_print("GETR")
-            response_data = http_response.read().decode("utf-8")
-            debug_print("READR")
+            try:
+                response_data = read_runpy_response(http_response)
+            except RunpyResponseTooLarge:
+                timings["run"] = time() - start_time
+                result = make_response_too_large_result()
+                result["exec_host"] = connect_host_ip
+                return result
 
             end_time = time()
+            timings["run"] = end_time - start_time
 
-            result = json.loads(response_data)
+            result = json.loads(response_data.decode("utf-8"))
 
             result["feedback"] = (result.get("feedback", [])
                     + ["Execution time: %.1f s -- Time limit: %.1f s"
@@ -233,21 +904,129 @@ def request_python_run(run_req, run_timeout, image=None):
             return result
 
         except socket.timeout:
+            timings["run"] = time() - start_time
+
             return {
                     "result": "timeout",
                     "exec_host": connect_host_ip,
                     }
-    finally:
-        if container_id is not None:
-            debug_print("-----------BEGIN DOCKER LOGS for %s" % container_id)
-            debug_print(docker_cnx.logs(container_id))
-            debug_print("-----------END DOCKER LOGS for %s" % container_id)
 
-            try:
-                docker_cnx.remove_container(container_id, force=True)
-            except DockerAPIError:
-                # Oh well. No need to bother the students with this nonsense.
-                pass
+    try:
+        result = run_in_runpy_container(image, send_request, timings,
+                host_wait_timeout=host_wait_timeout)
+    except RunpyContainerUnavailable as e:
+        result = e.result
+
+    result["timings"] = timings
+    return result
+
+
+def request_python_run_batch(common_run_req, items, run_timeout, image=None,
+        memory_limit=None, host_wait_timeout=None):
+    """Carry out several runs that differ only in the parts given in *items*
+    (usually just ``user_code``) in a single container. runpy runs each item
+    in a forked child with *run_timeout* and, if given, *memory_limit*
+    (in bytes) applied to it.
+
+    If the items differ only in ``user_code``, runpy executes the setup code
+    once and forks each item's child from the resulting state.
+
+    Only for trusted paths (e.g. regrading): a run can see the state that
+    earlier runs in the same batch left on the file system.
+
+    :returns: a list of run results, one per entry of *items*, as returned by
+        :func:`request_python_run`.
+    """
+
+    import json
+    from six.moves import http_client
+    import socket
+    from time import time
+
+    timings = {}
+    results = [None] * len(items)
+
+    def send_request(connect_host_ip, port):
+        # runpy sends one line per item as soon as it is done, so the
+        # socket timeout (which applies to each read) bounds each item.
+        # Before the first item, runpy may spend up to run_timeout running
+        # the shared setup code.
+        connection = http_client.HTTPConnection(connect_host_ip, port,
+                timeout=1 + 2*run_timeout)
+
+        headers = {'Content-type': 'application/json'}
+
+        json_batch_req = json.dumps({
+            "common": common_run_req,
+            "items": items,
+            "timeout": run_timeout,
+            "memory_limit": memory_limit,
+            }).encode("utf-8")
+
+        start_time = time()
+
+        try:
+            connection.request('POST', '/run-python-batch', json_batch_req,
+                    headers)
+
+            http_response = connection.getresponse()
+
+            # runpy sends the items' results in order.
+            next_index = 0
+
+            while True:
+                try:
+                    line = read_runpy_response(http_response, readline=True)
+                except RunpyResponseTooLarge:
+                    result = make_response_too_large_result()
+                    result["exec_host"] = connect_host_ip
+                    results[next_index] = result
+                    next_index += 1
+                    continue
+
+                if not line:
+                    break
+
+                item_result = json.loads(line.decode("utf-8"))
+                next_index = item_result["index"] + 1
+                result = item_result["response"]
+
+                exec_time = result.pop("exec_time", None)
+                if exec_time is not None and result["result"] != "timeout":
+                    result["feedback"] = (result.get("feedback", [])
+                            + ["Execution time: %.1f s -- Time limit: %.1f s"
+                                % (exec_time, run_timeout)])
+
+                result["exec_host"] = connect_host_ip
+                results[item_result["index"]] = result
+
+        except socket.timeout:
+            pass
+
+        finally:
+            timings["run"] = time() - start_time
+
+        for i in range(len(results)):
+            if results[i] is None:
+                results[i] = {
+                        "result": "uncaught_error",
+                        "message": "Batch run did not return a result "
+                        "for this item.",
+                        "exec_host": connect_host_ip,
+                        }
+
+        return results
+
+    try:
+        results = run_in_runpy_container(image, send_request, timings,
+                host_wait_timeout=host_wait_timeout)
+    except RunpyContainerUnavailable as e:
+        results = [dict(e.result) for item in items]
+
+    for result in results:
+        result["timings"] = timings
+
+    return results
 
 
 def is_nuisance_failure(result):
@@ -273,9 +1052,17 @@ def is_nuisance_failure(result):
     return False
 
 
-def request_python_run_with_retries(run_req, run_timeout, image=None, retry_count=3):
+def request_python_run_with_retries(run_req, run_timeout, image=None, retry_count=3,
+        host_wait_timeout=None):
+    prefetched_runs = getattr(_PREFETCHED_RUNS, "runs", None)
+    if prefetched_runs is not None:
+        key = _get_run_key(run_req, run_timeout, image)
+        if key in prefetched_runs:
+            return prefetched_runs[key]
+
     while True:
-        result = request_python_run(run_req, run_timeout, image=image)
+        result = request_python_run(run_req, run_timeout, image=image,
+                host_wait_timeout=host_wait_timeout)
 
         if retry_count and is_nuisance_failure(result):
             retry_count -= 1
@@ -284,6 +1071,413 @@ def request_python_run_with_retries(run_req, run_timeout, image=None, retry_coun
         return result
 
 
+# {{{ concurrent runs
+
+import threading
+_PREFETCHED_RUNS = threading.local()
+
+
+def _get_run_key(run_req, run_timeout, image):
+    import json
+    return json.dumps([run_req, run_timeout, image], sort_keys=True)
+
+
+class prefetched_python_runs(object):  # noqa
+    """A context manager that carries out all the runs in *run_requests*, a
+    list of tuples ``(run_req, run_timeout)``, concurrently on a pool of at
+    most *max_workers* threads. Within the context, calls to
+    :func:`request_python_run_with_retries` on the same thread that ask for one
+    of these runs return its result instead of starting a container.
+
+    *max_workers* defaults to the setting
+    ``RELATE_PYTHON_RUN_CONCURRENCY``.
+
+    If *background* is *True*, these runs, and other runs on the same thread
+    within the context, may wait up to :data:`DOCKER_HOST_WAIT_TIMEOUT`
+    for a Docker host with free capacity, rather than
+    :data:`DOCKER_HOST_INTERACTIVE_WAIT_TIMEOUT`. Only use this where no
+    one is waiting for the response, such as in celery tasks. Nested
+    contexts inherit this.
+
+    If *batch* is *True*, runs that differ only in their ``user_code`` are
+    carried out together using :func:`request_python_run_batch`, in batches
+    of at most ``RELATE_PYTHON_RUN_BATCH_SIZE``. Only use this on trusted
+    paths such as regrading.
+
+    Runs that fail to be prefetched (including runs that found no free
+    Docker host and, for batches, runs that end in an ``uncaught_error``)
+    are not kept, so that
+    :func:`request_python_run_with_retries` carries them out on its own,
+    with retries.
+    """
+
+    def __init__(self, run_requests, max_workers=None, image=None, batch=False,
+            background=False):
+        if max_workers is None:
+            max_workers = getattr(settings, "RELATE_PYTHON_RUN_CONCURRENCY", 4)
+
+        self.run_requests = run_requests
+        self.max_workers = max_workers
+        self.image = image
+        self.batch = batch
+        self.background = background
+
+    def _get_jobs(self, unique_requests):
+        """
+        :returns: a list of tuples ``(keys, run_func)``, where *run_func*
+            returns a list of results corresponding to *keys*, with *None*
+            for runs whose result should not be kept.
+        """
+
+        def make_single_job(key, run_req, run_timeout):
+            def run():
+                result = request_python_run_with_retries(
+                    run_req, run_timeout, image=self.image,
+                    host_wait_timeout=self.host_wait_timeout)
+                if result["result"] == "host_unavailable":
+                    return [None]
+
+                return [result]
+
+            return [key], run
+
+        def make_batch_job(keys, common_run_req, items, run_timeout):
+            def run():
+                return [
+                        None if result["result"] in [
+                            "uncaught_error", "host_unavailable"]
+                        else result
+                        for result in request_python_run_batch(
+                            common_run_req, items, run_timeout,
+                            image=self.image,
+                            memory_limit=common_run_req.get("memory_limit"),
+                            host_wait_timeout=self.host_wait_timeout)]
+
+            return keys, run
+
+        if not self.batch:
+            return [
+                    make_single_job(key, run_req, run_timeout)
+                    for key, (run_req, run_timeout) in unique_requests]
+
+        import json
+
+        # common key -> list of (key, run_req)
+        groups = {}
+        group_info = {}
+        for key, (run_req, run_timeout) in unique_requests:
+            common_run_req = dict(
+                    (name, val) for name, val in six.iteritems(run_req)
+                    if name != "user_code")
+            common_key = json.dumps([common_run_req, run_timeout], sort_keys=True)
+
+            groups.setdefault(common_key, []).append((key, run_req))
+            group_info[common_key] = (common_run_req, run_timeout)
+
+        batch_size = getattr(settings, "RELATE_PYTHON_RUN_BATCH_SIZE", 50)
+
+        jobs = []
+        for common_key, group in six.iteritems(groups):
+            common_run_req, run_timeout = group_info[common_key]
+
+            if len(group) == 1:
+                (key, run_req), = group
+                jobs.append(make_single_job(key, run_req, run_timeout))
+                continue
+
+            for i in range(0, len(group), batch_size):
+                batch = group[i:i+batch_size]
+                jobs.append(make_batch_job(
+                    [key for key, run_req in batch],
+                    common_run_req,
+                    [{"user_code": run_req["user_code"]}
+                        for key, run_req in batch],
+                    run_timeout))
+
+        return jobs
+
+    def __enter__(self):
+        self.outer_runs = getattr(_PREFETCHED_RUNS, "runs", None)
+        self.outer_host_wait_timeout = getattr(
+                _PREFETCHED_RUNS, "host_wait_timeout", None)
+
+        if self.background:
+            self.host_wait_timeout = DOCKER_HOST_WAIT_TIMEOUT
+        else:
+            self.host_wait_timeout = get_docker_host_wait_timeout()
+
+        runs = {}
+        if self.outer_runs is not None:
+            runs.update(self.outer_runs)
+
+        unique_requests = []
+        seen_keys = set()
+        for run_req, run_timeout in self.run_requests:
+            key = _get_run_key(run_req, run_timeout, self.image)
+            if key in runs or key in seen_keys:
+                continue
+
+            seen_keys.add(key)
+            unique_requests.append((key, (run_req, run_timeout)))
+
+        def run_job(job):
+            keys, run_func = job
+            try:
+                results = run_func()
+            except Exception:
+                # e.g. an image without batch support, or a connection
+                # error: leave these runs to the per-run path.
+                return []
+
+            return [(key, result)
+                    for key, result in zip(keys, results)
+                    if result is not None]
+
+        jobs = self._get_jobs(unique_requests)
+
+        if len(jobs) > 1 and self.max_workers > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(min(self.max_workers, len(jobs)))
+            try:
+                job_results = pool.map(run_job, jobs)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            job_results = [run_job(job) for job in jobs]
+
+        for job_result in job_results:
+            runs.update(job_result)
+
+        _PREFETCHED_RUNS.runs = runs
+        _PREFETCHED_RUNS.host_wait_timeout = self.host_wait_timeout
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        _PREFETCHED_RUNS.runs = self.outer_runs
+
+        if self.outer_host_wait_timeout is None:
+            del _PREFETCHED_RUNS.host_wait_timeout
+        else:
+            _PREFETCHED_RUNS.host_wait_timeout = self.outer_host_wait_timeout
+
+# }}}
+
+
+# {{{ run result cache
+
+# Only results that depend on nothing but the run request are cached.
+CACHEABLE_RUN_RESULTS = ["success", "user_compile_error", "user_error"]
+
+# Exceptions raised when a run exceeds its resource limits. Whether that
+# happens also depends on the load of the host, so such results are not
+# cached.
+RESOURCE_LIMIT_EXCEPTIONS = ["CPUTimeLimitExceeded", "MemoryError"]
+
+# how long (in seconds) the image ID of a host is remembered, so that a
+# re-tagged image is noticed
+RUNPY_IMAGE_ID_TTL = 60
+
+# how long (in seconds) a failure to obtain it is remembered, so that an
+# unreachable Docker host does not hold up every run
+RUNPY_IMAGE_ID_FAILURE_TTL = 10
+
+# (host url, image) -> (image ID or None, expiry time)
+_RUNPY_IMAGE_IDS = {}
+
+
+def get_runpy_image_id(image, host=None):
+    """
+    :arg host: the :class:`DockerHost` to ask. Defaults to the first
+        configured host.
+    :returns: the ID of the Docker image currently tagged *image* on *host*,
+        or *None* if Docker could not be asked.
+    """
+
+    from time import time
+
+    if host is None:
+        host = get_docker_host_scheduler().hosts[0]
+
+    key = (host.url, image)
+
+    try:
+        image_id, expiry_time = _RUNPY_IMAGE_IDS[key]
+    except KeyError:
+        pass
+    else:
+        if time() < expiry_time:
+            return image_id
+
+    try:
+        image_id = get_docker_client(host).inspect_image(image)["Id"]
+    except Exception:
+        image_id = None
+
+    _RUNPY_IMAGE_IDS[key] = (image_id, time() + (
+        RUNPY_IMAGE_ID_TTL if image_id is not None
+        else RUNPY_IMAGE_ID_FAILURE_TTL))
+
+    return image_id
+
+
+def get_run_result_cache_key(run_req, run_timeout, image=None):
+    """
+    :returns: a key identifying the result of running *run_req* in *image*,
+        or *None* if no such key can be determined. Since the host that
+        carries out a run is only chosen once the run starts, this requires
+        all Docker hosts to have the same image tagged *image*.
+    """
+
+    if image is None:
+        image = settings.RELATE_DOCKER_RUNPY_IMAGE
+
+    image_ids = set(
+            get_runpy_image_id(image, host)
+            for host in get_docker_host_scheduler().hosts)
+    if len(image_ids) != 1:
+        # e.g. while a new image is being rolled out
+        return None
+
+    image_id, = image_ids
+    if image_id is None:
+        return None
+
+    import json
+    from course.content import make_content_cache_key
+    return make_content_cache_key("runpy:v1",
+            image_id, repr(run_timeout), json.dumps(run_req, sort_keys=True))
+
+
+def get_cached_run_result(cache_key):
+    from course.content import get_content_cache
+    return get_content_cache().get(cache_key)
+
+
+def is_resource_limit_failure(result):
+    message = result.get("message") or ""
+    return any(
+            message.startswith(exc_name + ":")
+            for exc_name in RESOURCE_LIMIT_EXCEPTIONS)
+
+
+def add_cached_run_result(cache_key, result):
+    if result["result"] not in CACHEABLE_RUN_RESULTS:
+        return
+
+    if is_resource_limit_failure(result):
+        return
+
+    result = dict(
+            (key, val) for key, val in six.iteritems(result)
+            if key != "timings")
+
+    import json
+    result_size = len(json.dumps(result))
+
+    from course.content import get_content_cache
+    get_content_cache().add(cache_key, result,
+            shared=result_size <= getattr(settings, "RELATE_CACHE_MAX_BYTES", 0))
+
+# }}}
+
+
+# {{{ data files
+
+def get_runpy_data_dir():
+    """
+    :returns: the directory in which data files are staged for runpy
+        containers, or *None* if data files are sent along with each run.
+    """
+    return getattr(settings, "RELATE_DOCKER_RUNPY_DATA_DIR", None)
+
+
+def _get_data_file_cache_key(kind, repo, name, commit_sha):
+    from course.content import get_true_repo_and_path, make_content_cache_key
+    dul_repo, true_name = get_true_repo_and_path(repo, name)
+    return make_content_cache_key(
+            kind, dul_repo.controldir(), true_name, commit_sha)
+
+
+def get_encoded_data_file(repo, name, commit_sha):
+    """
+    :returns: the base64-encoded contents of the data file *name*, encoded
+        only once per *commit_sha* if the result fits into the shared cache.
+        The in-process tier of the content cache is not used, since these
+        strings may be large and the file's contents are already kept there.
+    """
+
+    from course.content import get_content_cache, get_repo_blob_data_cached
+
+    cache_key = _get_data_file_cache_key(
+            "runpy-data-file-b64:v1", repo, name, commit_sha)
+
+    content_cache = get_content_cache()
+    result = content_cache.get(cache_key, local=False)
+    if result is not None:
+        return result
+
+    from base64 import b64encode
+    result = b64encode(
+            get_repo_blob_data_cached(repo, name, commit_sha)).decode()
+
+    if len(result) <= getattr(settings, "RELATE_CACHE_MAX_BYTES", 0):
+        content_cache.add(cache_key, result, local=False)
+
+    return result
+
+
+def stage_data_file(repo, name, commit_sha):
+    """Make the data file *name* available to runpy containers in
+    :func:`get_runpy_data_dir`, once per *commit_sha*.
+
+    :returns: the SHA-256 hex digest of the file's contents, which is also
+        its file name in the staging directory.
+    """
+
+    from os.path import join, exists
+    from course.content import get_content_cache, get_repo_blob_data_cached
+
+    data_dir = get_runpy_data_dir()
+
+    cache_key = _get_data_file_cache_key(
+            "runpy-data-file-hash:v1", repo, name, commit_sha)
+
+    content_cache = get_content_cache()
+    content_hash = content_cache.get(cache_key)
+    if (content_hash is not None
+            and exists(join(data_dir, content_hash))):
+        return content_hash
+
+    data = get_repo_blob_data_cached(repo, name, commit_sha)
+
+    from hashlib import sha256
+    content_hash = sha256(data).hexdigest()
+
+    path = join(data_dir, content_hash)
+    if not exists(path):
+        # Write under a temporary name first so that containers never see
+        # a partially written file.
+        import os
+        from tempfile import mkstemp
+        fd, temp_path = mkstemp(dir=data_dir, prefix=".staging-")
+        try:
+            with os.fdopen(fd, "wb") as outf:
+                outf.write(data)
+            os.chmod(temp_path, 0o644)
+            os.rename(temp_path, path)
+        except Exception:
+            if exists(temp_path):
+                os.unlink(temp_path)
+            raise
+
+    content_cache.add(cache_key, content_hash)
+
+    return content_hash
+
+# }}}
+
+
 class PythonCodeQuestion(PageBaseWithTitle, PageBaseWithValue):
     """
     An auto-graded question allowing an answer consisting of Python code.
@@ -410,6 +1604,31 @@ class PythonCodeQuestion(PageBaseWithTitle, PageBaseWithValue):
         based on its :attr:`access_rules` (not the ones of the flow), a warning
         is shown. Setting this attribute to True will silence the warning.
 
+    .. attribute:: deterministic
+
+        Optional, a Boolean. Set this to True if the result of running a given
+        answer depends only on that answer, the :attr:`setup_code`,
+        :attr:`test_code` and :attr:`data_files` (i.e. not on random numbers,
+        the time, or how long the code takes to run). Results of grading runs
+        are then cached, so that regrading an unchanged answer to an
+        unchanged question does not run the code again.
+
+    .. attribute:: memory_limit
+
+        Optional. The amount of memory (address space, in megabytes) that a
+        run of the code may use. Cannot exceed the memory limit of the code
+        container, which is used if this is not given.
+
+    .. attribute:: cpu_limit
+
+        Optional. The CPU time (in seconds) that a run of the code may use.
+        Code that exceeds it fails with an exception. :attr:`timeout` still
+        limits the wall-clock time of each run.
+
+    The CPU time, peak memory use and output size of each grading run are
+    stored with the grade, see
+    :attr:`course.models.FlowPageVisitGrade.resource_usage`.
+
     The following symbols are available in :attr:`setup_code` and :attr:`test_code`:
 
     * ``GradingComplete``: An exception class that can be raised to indicated
@@ -465,6 +1684,11 @@ class PythonCodeQuestion(PageBaseWithTitle, PageBaseWithValue):
                     raise ValidationError("%s: data file '%s' not found"
                             % (location, data_file))
 
+        for limit_attr in ["memory_limit", "cpu_limit"]:
+            if getattr(page_desc, limit_attr, 1) <= 0:
+                raise ValidationError("%s: %s must be positive"
+                        % (location, limit_attr))
+
         if not getattr(page_desc, "single_submission", False) and vctx is not None:
             is_multi_submit = False
 
@@ -502,6 +1726,9 @@ class PythonCodeQuestion(PageBaseWithTitle, PageBaseWithValue):
                 ("initial_code", str),
                 ("data_files", list),
                 ("single_submission", bool),
+                ("deterministic", bool),
+                ("memory_limit", (int, float)),
+                ("cpu_limit", (int, float)),
                 )
 
     def _initial_code(self):
@@ -573,16 +1800,48 @@ class PythonCodeQuestion(PageBaseWithTitle, PageBaseWithValue):
         from .code_runpy_backend import substitute_correct_code_into_test_code
         return substitute_correct_code_into_test_code(test_code, correct_code)
 
-    def grade(self, page_context, page_data, answer_data, grade_data):
+    def get_python_run_request(self, page_context, answer_data):
+        """
+        :returns: a tuple ``(run_req, run_timeout)`` describing the run
+            that :meth:`grade` carries out for *answer_data*, or *None* if
+            no run is needed (e.g. because its result is cached). See
+            :class:`prefetched_python_runs`. A subsequent :meth:`grade` of
+            the same answer on this page object reuses the run request.
+        """
+
         if answer_data is None:
-            return AnswerFeedback(correctness=0,
-                    feedback=_("No answer provided."))
+            return None
 
-        user_code = answer_data["answer"]
+        run_req, run_timeout = self._get_run_request(page_context, answer_data)
 
-        # {{{ request run
+        cache_key = self._get_run_result_cache_key(run_req, run_timeout)
+        if (cache_key is not None
+                and get_cached_run_result(cache_key) is not None):
+            return None
+
+        return run_req, run_timeout
+
+    def _get_run_result_cache_key(self, run_req, run_timeout):
+        if not getattr(self.page_desc, "deterministic", False):
+            return None
 
-        run_req = {"compile_only": False, "user_code": user_code}
+        return get_run_result_cache_key(run_req, run_timeout)
+
+    def _get_run_request(self, page_context, answer_data):
+        # Building a run request may involve encoding data files, so keep
+        # the last one around for grade() after get_python_run_request().
+        key = (page_context.commit_sha, answer_data["answer"])
+
+        last_run_request = getattr(self, "_last_run_request", None)
+        if last_run_request is not None and last_run_request[0] == key:
+            return last_run_request[1]
+
+        run_request = self._make_run_request(page_context, answer_data)
+        self._last_run_request = (key, run_request)
+        return run_request
+
+    def _make_run_request(self, page_context, answer_data):
+        run_req = {"compile_only": False, "user_code": answer_data["answer"]}
 
         def transfer_attr(name):
             if hasattr(self.page_desc, name):
@@ -591,33 +1850,61 @@ class PythonCodeQuestion(PageBaseWithTitle, PageBaseWithValue):
         transfer_attr("setup_code")
         transfer_attr("names_for_user")
         transfer_attr("names_from_user")
+        transfer_attr("cpu_limit")
+
+        if hasattr(self.page_desc, "memory_limit"):
+            run_req["memory_limit"] = int(self.page_desc.memory_limit * 10**6)
 
         if hasattr(self.page_desc, "test_code"):
             run_req["test_code"] = self.get_test_code()
 
         if hasattr(self.page_desc, "data_files"):
-            run_req["data_files"] = {}
+            if get_runpy_data_dir() is not None:
+                run_req["data_file_hashes"] = dict(
+                        (data_file, stage_data_file(
+                            page_context.repo, data_file,
+                            page_context.commit_sha))
+                        for data_file in self.page_desc.data_files)
+            else:
+                run_req["data_files"] = dict(
+                        (data_file, get_encoded_data_file(
+                            page_context.repo, data_file,
+                            page_context.commit_sha))
+                        for data_file in self.page_desc.data_files)
+
+        return run_req, self.page_desc.timeout
+
+    def grade(self, page_context, page_data, answer_data, grade_data):
+        if answer_data is None:
+            return AnswerFeedback(correctness=0,
+                    feedback=_("No answer provided."))
 
-            from course.content import get_repo_blob
+        user_code = answer_data["answer"]
 
-            for data_file in self.page_desc.data_files:
-                from base64 import b64encode
-                run_req["data_files"][data_file] = \
-                        b64encode(
-                                get_repo_blob(
-                                    page_context.repo, data_file,
-                                    page_context.commit_sha).data).decode()
+        # {{{ request run
 
-        try:
-            response_dict = request_python_run_with_retries(run_req,
-                    run_timeout=self.page_desc.timeout)
-        except:
-            from traceback import format_exc
-            response_dict = {
-                    "result": "uncaught_error",
-                    "message": "Error connecting to container",
-                    "traceback": "".join(format_exc()),
-                    }
+        run_req, run_timeout = self._get_run_request(page_context, answer_data)
+
+        cache_key = self._get_run_result_cache_key(run_req, run_timeout)
+
+        response_dict = None
+        if cache_key is not None:
+            response_dict = get_cached_run_result(cache_key)
+
+        if response_dict is None:
+            try:
+                response_dict = request_python_run_with_retries(run_req,
+                        run_timeout=run_timeout)
+            except:
+                from traceback import format_exc
+                response_dict = {
+                        "result": "uncaught_error",
+                        "message": "Error connecting to container",
+                        "traceback": "".join(format_exc()),
+                        }
+            else:
+                if cache_key is not None:
+                    add_cached_run_result(cache_key, response_dict)
 
         # }}}
 
@@ -716,6 +2003,15 @@ class PythonCodeQuestion(PageBaseWithTitle, PageBaseWithValue):
 
         if response.result == "success":
             pass
+        elif response.result == "host_unavailable":
+            feedback_bits.append("".join([
+                "<p>",
+                _(
+                    "Your code could not be run because the servers that "
+                    "run code are busy at the moment. Please try again "
+                    "in a few minutes."
+                    ),
+                "</p>"]))
         elif response.result in [
                 "uncaught_error",
                 "setup_compile_error",
@@ -826,6 +2122,13 @@ class PythonCodeQuestion(PageBaseWithTitle, PageBaseWithValue):
             fig_lines.append("</dl>")
             bulk_feedback_bits.extend(fig_lines)
 
+        if hasattr(response, "figures_omitted") and response.figures_omitted:
+            bulk_feedback_bits.append("".join([
+                "<p>",
+                _("%d further plots were not shown because your code "
+                    "produced too many or too large plots."),
+                "</p>"]) % response.figures_omitted)
+
         # {{{ html output / santization
 
         if hasattr(response, "html") and response.html:
@@ -884,7 +2187,8 @@ class PythonCodeQuestion(PageBaseWithTitle, PageBaseWithValue):
         return AnswerFeedback(
                 correctness=correctness,
                 feedback="\n".join(feedback_bits),
-                bulk_feedback="\n".join(bulk_feedback_bits))
+                bulk_feedback="\n".join(bulk_feedback_bits),
+                resource_usage=response_dict.get("resources"))
 
     def correct_answer(self, page_context, page_data, answer_data, grade_data):
         result = ""
@@ -911,6 +2215,9 @@ class PythonCodeQuestion(PageBaseWithTitle, PageBaseWithValue):
         from django.utils.html import escape
         return "<pre>%s</pre>" % escape(normalized_answer)
 
+    def normalized_answer_key(self, page_context, page_data, answer_data):
+        return answer_data["answer"]
+
     def normalized_bytes_answer(self, page_context, page_data, answer_data):
         if answer_data is None:
             return None
@@ -1053,6 +2360,7 @@ class PythonCodeQuestionWithHumanTextFeedback(
         return AnswerFeedback(
                 correctness=correctness,
                 feedback=feedback,
-                bulk_feedback=code_feedback.bulk_feedback)
+                bulk_feedback=code_feedback.bulk_feedback,
+                resource_usage=code_feedback.resource_usage)
 
 # }}}
@@ -55,6 +55,13 @@ PROTOCOL
         base64-cencoded contents.
         Optional.
 
+    .. attribute:: data_file_hashes
+
+        A dictionary from data file names to the SHA-256 hex digests
+        of their contents. Each file is read from the file of that name
+        in :data:`DATA_FILE_DIR`, where RELATE has staged it.
+        Optional.
+
     .. attribute:: compile_only
 
         :class:`bool`
@@ -67,6 +74,8 @@ PROTOCOL
         * ``success``
         * ``timeout``
         * ``uncaught_error``
+        * ``host_unavailable`` (only set by RELATE, if no Docker host
+          had capacity for the run)
         * ``setup_compile_error``
         * ``setup_error``,
         * ``user_compile_error``
@@ -86,13 +95,13 @@ PROTOCOL
 
     .. attribute:: stdout
 
-        Whatever came out of stdout.
+        Whatever came out of stdout, truncated to a fixed length.
 
         Optional.
 
     .. attribute:: stderr
 
-        Whatever came out of stderr.
+        Whatever came out of stderr, truncated to a fixed length.
 
         Optional.
 
@@ -102,12 +111,24 @@ PROTOCOL
         base64-encoded representation of the figure. *index* will usually
         correspond to the matplotlib figure number.
 
+        At most :data:`MAX_FIGURES` figures are included, each scaled down to
+        at most :data:`MAX_FIGURE_PIXELS` pixels, and only as many as fit
+        into :data:`MAX_FIGURE_BYTES`.
+
+        Optional.
+
+    .. attribute:: figures_omitted
+
+        The number of figures left out of :attr:`figures` because of
+        these limits.
+
         Optional.
 
     .. attribute:: html
 
         A list of HTML strings generated. These are aggressively sanitized
-        before being rendered.
+        before being rendered. Output beyond :data:`MAX_HTML_LENGTH`
+        characters is dropped.
 
     .. attribute:: points
 
@@ -123,6 +144,23 @@ PROTOCOL
 """
 
 
+# where RELATE's staged data files are mounted inside the container (RELATE
+# mounts them here, too, see course.page.code.start_runpy_container)
+DATA_FILE_DIR = "/opt/runpy/data"
+
+# {{{ output limits
+
+MAX_HTML_LENGTH = 256*1024
+
+MAX_FIGURES = 20
+MAX_FIGURE_PIXELS = 1600*1200
+
+# total size of the base64-encoded figures
+MAX_FIGURE_BYTES = 4*1024*1024
+
+# }}}
+
+
 # {{{ tools
 
 class Struct(object):
@@ -161,6 +199,61 @@ def package_exception(result, what):
             traceback.format_exception(tp, val, tb))
 
 
+def export_figures():
+    """Encode the open matplotlib figures one at a time, within
+    :data:`MAX_FIGURES`, :data:`MAX_FIGURE_PIXELS` and
+    :data:`MAX_FIGURE_BYTES`.
+
+    :returns: a tuple ``(figures, figures_omitted)``, see
+        :attr:`Response.figures`.
+    """
+
+    import matplotlib.pyplot as pt
+    from io import BytesIO
+    from base64 import b64encode
+
+    format = "png"
+    mime = "image/png"
+    figures = []
+    figures_omitted = 0
+    total_bytes = 0
+
+    for fignum in pt.get_fignums():
+        if len(figures) >= MAX_FIGURES or total_bytes >= MAX_FIGURE_BYTES:
+            figures_omitted += 1
+            continue
+
+        fig = pt.figure(fignum)
+
+        dpi = pt.rcParams["savefig.dpi"]
+        if dpi == "figure":
+            dpi = fig.dpi
+
+        width, height = fig.get_size_inches()
+        pixels = width * height * dpi**2
+        if pixels > MAX_FIGURE_PIXELS:
+            dpi *= (MAX_FIGURE_PIXELS / pixels) ** 0.5
+
+        bio = BytesIO()
+        try:
+            pt.savefig(bio, format=format, dpi=dpi)
+        except:
+            continue
+
+        data = b64encode(bio.getvalue()).decode()
+        del bio
+
+        if total_bytes + len(data) > MAX_FIGURE_BYTES:
+            figures_omitted += 1
+            total_bytes = MAX_FIGURE_BYTES
+            continue
+
+        total_bytes += len(data)
+        figures.append((fignum, mime, data))
+
+    return figures, figures_omitted
+
+
 def run_code(result, run_req):
     # {{{ silence matplotlib font cache warnings
 
@@ -205,7 +298,43 @@ def run_code(result, run_req):
         result["result"] = "success"
         return
 
-    # {{{ run code
+    prepared = set_up_run(result, run_req, setup_code, user_code)
+    if prepared is None:
+        return
+
+    finish_run(result, run_req, prepared, user_code, test_code)
+
+
+# {{{ prepared runs
+
+class PreparedRun(object):
+    """The state of a run once its setup code has been executed.
+
+    A process holding this can fork once per submission and continue each
+    copy with :func:`run_prepared`, so that setup code shared by many
+    submissions is compiled and executed only once.
+
+    .. attribute:: maint_ctx
+    .. attribute:: feedback
+    .. attribute:: generated_html
+    .. attribute:: test_code
+
+        The compiled test code, or *None*.
+    """
+
+    def __init__(self, maint_ctx, feedback, generated_html, test_code=None):
+        self.maint_ctx = maint_ctx
+        self.feedback = feedback
+        self.generated_html = generated_html
+        self.test_code = test_code
+
+
+def set_up_run(result, run_req, setup_code, user_code):
+    """Execute the compiled *setup_code* for *run_req*.
+
+    :returns: a :class:`PreparedRun`, or *None* if setup failed, in which
+        case *result* describes the failure.
+    """
 
     data_files = {}
     if hasattr(run_req, "data_files"):
@@ -213,11 +342,26 @@ def run_code(result, run_req):
         for name, contents in run_req.data_files.items():
             data_files[name] = b64decode(contents.encode())
 
+    if hasattr(run_req, "data_file_hashes"):
+        from os.path import join, basename
+        for name, content_hash in run_req.data_file_hashes.items():
+            with open(join(DATA_FILE_DIR, basename(content_hash)), "rb") as inf:
+                data_files[name] = inf.read()
+
     generated_html = []
     result["html"] = generated_html
 
+    html_length = [0]
+
     def output_html(s):
-        generated_html.append(s)
+        if html_length[0] > MAX_HTML_LENGTH:
+            return
+
+        html_length[0] += len(s)
+        if html_length[0] > MAX_HTML_LENGTH:
+            generated_html.append("<p>[TRUNCATED... TOO MUCH HTML OUTPUT]</p>")
+        else:
+            generated_html.append(s)
 
     feedback = Feedback()
     maint_ctx = {
@@ -233,7 +377,72 @@ def run_code(result, run_req):
             exec(setup_code, maint_ctx)
         except:
             package_exception(result, "setup_error")
-            return
+            return None
+
+    return PreparedRun(maint_ctx, feedback, generated_html)
+
+
+def prepare_run(run_req):
+    """Compile the setup and test code of *run_req* and execute the setup
+    code, for use with :func:`run_prepared` on several submissions.
+
+    :returns: a :class:`PreparedRun`, or *None* if *run_req* cannot be
+        prepared without knowing the user code (e.g. because setup fails
+        or refers to ``user_code``). Such requests should be run with
+        :func:`run_code` as usual, which reports any failure properly.
+    """
+
+    import warnings
+    warnings.filterwarnings(
+            "ignore", message="Matplotlib is building the font cache.*")
+
+    setup_source = getattr(run_req, "setup_code", None)
+    if setup_source and "user_code" in setup_source:
+        return None
+
+    try:
+        setup_code = None
+        if setup_source:
+            setup_code = compile(setup_source, "<setup code>", 'exec')
+
+        test_code = None
+        if getattr(run_req, "test_code", None):
+            test_code = compile(run_req.test_code, "<test code>", 'exec')
+    except:
+        return None
+
+    result = {}
+    prepared = set_up_run(result, run_req, setup_code, user_code=None)
+    if prepared is None:
+        return None
+
+    prepared.test_code = test_code
+    return prepared
+
+
+def run_prepared(result, run_req, prepared):
+    """Like :func:`run_code`, but starting from the state in *prepared*,
+    which is used up in the process.
+    """
+
+    try:
+        user_code = compile(
+                run_req.user_code, "<user code>", 'exec')
+    except:
+        package_exception(result, "user_compile_error")
+        return
+
+    result["html"] = prepared.generated_html
+    prepared.maint_ctx["user_code"] = user_code
+
+    finish_run(result, run_req, prepared, user_code, prepared.test_code)
+
+# }}}
+
+
+def finish_run(result, run_req, prepared, user_code, test_code):
+    maint_ctx = prepared.maint_ctx
+    feedback = prepared.feedback
 
     user_ctx = {}
     if hasattr(run_req, "names_for_user"):
@@ -256,26 +465,10 @@ def run_code(result, run_req):
     # {{{ export plots
 
     if "matplotlib" in sys.modules:
-        import matplotlib.pyplot as pt
-        from io import BytesIO
-        from base64 import b64encode
-
-        format = "png"
-        mime = "image/png"
-        figures = []
-
-        for fignum in pt.get_fignums():
-            pt.figure(fignum)
-            bio = BytesIO()
-            try:
-                pt.savefig(bio, format=format)
-            except:
-                pass
-            else:
-                figures.append(
-                    (fignum, mime, b64encode(bio.getvalue()).decode()))
-
+        figures, figures_omitted = export_figures()
         result["figures"] = figures
+        if figures_omitted:
+            result["figures_omitted"] = figures_omitted
 
     # }}}
 
@@ -305,8 +498,6 @@ def run_code(result, run_req):
     result["points"] = feedback.points
     result["feedback"] = feedback.feedback_items
 
-    # }}}
-
     result["result"] = "success"
 
 # vim: foldmethod=marker
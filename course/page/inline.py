@@ -36,7 +36,9 @@ from relate.utils import Struct, StyledInlineForm
 from course.page.base import (
         AnswerFeedback, PageBaseWithValue, markup_to_html)
 
-from course.page.text import TextQuestionBase, parse_matcher
+from course.page.text import (
+        TextQuestionBase, parse_matcher, get_matcher_correctness,
+        make_unchecked_answer_feedback)
 
 import re
 
@@ -166,11 +168,19 @@ class AnswerBase(object):
         raise NotImplementedError()
 
     def get_correctness(self, answer):
+        """
+        :returns: the correctness of *answer*, or *None* if it could not be
+            determined.
+        """
         raise NotImplementedError()
 
     def get_weight(self, answer):
         if answer is not None:
-            return self.weight * self.get_correctness(answer)
+            correctness = self.get_correctness(answer)
+            if correctness is None:
+                return None
+
+            return self.weight * correctness
         else:
             return 0
 
@@ -343,20 +353,7 @@ class ShortAnswer(AnswerBase):
                 )
 
     def get_correctness(self, answer):
-
-        correctnesses = [0]
-        # If empty an list, sometime it will cause ValueError:
-        # max() arg is an empty sequence, observed in SandBox
-
-        for matcher in self.matchers:
-            try:
-                matcher.validate(answer)
-            except forms.ValidationError:
-                continue
-
-            correctnesses.append(matcher.grade(answer))
-
-        return max(correctnesses)
+        return get_matcher_correctness(self.matchers, answer)
 
     def get_form_field(self, page_context, force_required=False):
         return (self.form_field_class)(
@@ -910,8 +907,12 @@ class InlineMultiQuestion(TextQuestionBase, PageBaseWithValue):
             achieved_weight = 0
             for answer_instance in self.answer_instance_list:
                 if answer_dict[answer_instance.name] is not None:
-                    achieved_weight += answer_instance.get_weight(
+                    weight = answer_instance.get_weight(
                             answer_dict[answer_instance.name])
+                    if weight is None:
+                        return make_unchecked_answer_feedback()
+
+                    achieved_weight += weight
             correctness = achieved_weight / total_weight
 
         # for case when all questions have no weight assigned
@@ -919,8 +920,12 @@ class InlineMultiQuestion(TextQuestionBase, PageBaseWithValue):
             n_corr = 0
             for answer_instance in self.answer_instance_list:
                 if answer_dict[answer_instance.name] is not None:
-                    n_corr += answer_instance.get_correctness(
+                    answer_correctness = answer_instance.get_correctness(
                             answer_dict[answer_instance.name])
+                    if answer_correctness is None:
+                        return make_unchecked_answer_feedback()
+
+                    n_corr += answer_correctness
             correctness = n_corr / len(self.answer_instance_list)
 
         return AnswerFeedback(correctness=correctness)
@@ -942,6 +947,10 @@ class InlineMultiQuestion(TextQuestionBase, PageBaseWithValue):
 
         return nml_answer_output
 
+    def normalized_answer_key(self, page_context, page_data, answer_data):
+        answer_dict = answer_data["answer"]
+        return tuple(answer_dict[name] for name in self.embedded_name_list)
+
 # }}}
 
 # vim: foldmethod=marker
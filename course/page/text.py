@@ -26,6 +26,7 @@ THE SOFTWARE.
 
 
 import six
+from django.conf import settings
 from django.utils.translation import (
         ugettext_lazy as _, ugettext, string_concat)
 from course.validation import validate_struct, ValidationError
@@ -226,6 +227,10 @@ class TextAnswerMatcher(object):
         pass
 
     def grade(self, s):
+        """
+        :returns: the correctness of *s*, or *None* if it could not be
+            determined, e.g. because that took too long.
+        """
         raise NotImplementedError()
 
     def correct_answer_text(self):
@@ -324,6 +329,140 @@ def parse_sympy(s):
     return PymbolicToSympyMapper()(parse(s))
 
 
+# {{{ symbolic grading
+
+SYMPY_NUMERICAL_CHECK_POINTS = 5
+SYMPY_NUMERICAL_CHECK_DIGITS = 30
+SYMPY_NUMERICAL_CHECK_RTOL = 1e-12
+
+
+class SympyTimeout(Exception):
+    pass
+
+
+class sympy_time_limit(object):  # noqa
+    """A context manager that raises :exc:`SympyTimeout` in the code
+    running within it once that has taken more than *seconds*.
+
+    This relies on :data:`signal.SIGALRM`, so it only has an effect in the
+    main thread of a process, and only if no other alarm is pending.
+    Elsewhere, the code runs without a time limit.
+    """
+
+    def __init__(self, seconds=None):
+        if seconds is None:
+            seconds = getattr(settings, "RELATE_SYMPY_TIME_LIMIT", 5)
+
+        self.seconds = seconds
+
+    def __enter__(self):
+        import signal
+        import threading
+
+        self.active = (
+                self.seconds
+                and hasattr(signal, "SIGALRM")
+                and threading.current_thread().name == "MainThread"
+                and signal.getitimer(signal.ITIMER_REAL)[0] == 0)
+
+        if self.active:
+            seconds = self.seconds
+
+            def handle_alarm(signum, frame):
+                raise SympyTimeout(
+                        "symbolic computation took longer than %g s" % seconds)
+
+            self.prev_handler = signal.signal(signal.SIGALRM, handle_alarm)
+            signal.setitimer(signal.ITIMER_REAL, seconds)
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if self.active:
+            import signal
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, self.prev_handler)
+
+
+def _get_sympy_cache_key(kind, s):
+    from course.content import make_content_cache_key
+
+    # whitespace does not change the meaning of an expression
+    return make_content_cache_key(kind, "".join(s.split()))
+
+
+def sympy_equal_numerically(expr_a, expr_b):
+    """Compare *expr_a* and *expr_b* by evaluating them (with complex
+    arithmetic) at a few pseudo-random values of their free symbols.
+
+    :returns: *False* if they differ at some point, *True* if they agree at
+        all points, or *None* if they could not be evaluated there (e.g.
+        because they involve undefined functions or have a pole).
+    """
+
+    from random import Random
+    rng = Random(17)
+
+    symbols = sorted(
+            (expr_a.free_symbols | expr_b.free_symbols), key=str)
+
+    def is_finite(z):
+        from math import isinf, isnan
+        return not any(
+                isinf(part) or isnan(part) for part in [z.real, z.imag])
+
+    for i in range(SYMPY_NUMERICAL_CHECK_POINTS):
+        subs = dict((sym, rng.uniform(-2, 2)) for sym in symbols)
+
+        try:
+            value_a = complex(
+                    expr_a.evalf(SYMPY_NUMERICAL_CHECK_DIGITS, subs=subs))
+            value_b = complex(
+                    expr_b.evalf(SYMPY_NUMERICAL_CHECK_DIGITS, subs=subs))
+        except (TypeError, ValueError, ArithmeticError):
+            return None
+
+        if not (is_finite(value_a) and is_finite(value_b)):
+            return None
+
+        scale = max(abs(value_a), abs(value_b), 1)
+        if abs(value_a - value_b) > SYMPY_NUMERICAL_CHECK_RTOL * scale:
+            return False
+
+    return True
+
+
+def sympy_equal(expr_a, expr_b):
+    """
+    :returns: whether *expr_a* and *expr_b* are equivalent. They are first
+        compared numerically (see :func:`sympy_equal_numerically`). If that
+        finds them unequal, they are. Otherwise, and unless it found exact
+        expressions equal, this checks whether :func:`sympy.simplify` turns
+        their difference into zero.
+    """
+
+    result = sympy_equal_numerically(expr_a, expr_b)
+    if result is False:
+        return False
+
+    if result is True:
+        # A decimal approximation (e.g. of pi) agrees numerically with the
+        # exact value but is not equal to it.
+        from sympy import Float
+        if not (expr_a.atoms(Float) or expr_b.atoms(Float)):
+            return True
+
+    from sympy import simplify
+    try:
+        return simplify(expr_a - expr_b) == 0
+    except SympyTimeout:
+        raise
+    except Exception:
+        return False
+
+# }}}
+
+
 class SymbolicExpressionMatcher(TextAnswerMatcher):
     type = "sym_expr"
     is_case_sensitive = True
@@ -368,18 +507,28 @@ class SymbolicExpressionMatcher(TextAnswerMatcher):
                     % {"err_type": tp.__name__, "err_str": str(e)})
 
     def grade(self, s):
-        from sympy import simplify
-        answer_sym = parse_sympy(s)
+        from course.content import get_content_cache
+
+        # Many participants submit the same few answers.
+        cache_key = _get_sympy_cache_key(
+                "sym_expr_match:v1", self.pattern + "\0" + s)
+
+        content_cache = get_content_cache()
+        result = content_cache.get(cache_key)
+        if result is not None:
+            return result
 
         try:
-            simp_result = simplify(answer_sym - self.pattern_sym)
-        except Exception:
-            return 0
+            with sympy_time_limit():
+                answer_sym = parse_sympy(s)
+                result = int(sympy_equal(answer_sym, self.pattern_sym))
+        except SympyTimeout:
+            # not cached, so that the answer is tried again next time
+            return None
 
-        if simp_result == 0:
-            return 1
-        else:
-            return 0
+        content_cache.add(cache_key, result)
+
+        return result
 
     def correct_answer_text(self):
         return self.pattern
@@ -403,8 +552,22 @@ def float_or_sympy_evalf(s):
     if s == "":
         return s
 
+    from course.content import get_content_cache
+
+    cache_key = _get_sympy_cache_key("sympy_evalf:v1", s)
+
+    content_cache = get_content_cache()
+    result = content_cache.get(cache_key)
+    if result is not None:
+        return result
+
     # return a float type value, expression not allowed
-    return float(parse_sympy(s).evalf())
+    with sympy_time_limit():
+        result = float(parse_sympy(s).evalf())
+
+    content_cache.add(cache_key, result)
+
+    return result
 
 
 def _is_valid_float(s):
@@ -497,6 +660,9 @@ class FloatMatcher(TextAnswerMatcher):
     def validate(self, s):
         try:
             float_or_sympy_evalf(s)
+        except SympyTimeout:
+            # not necessarily invalid, left to grade()
+            pass
         except:
             tp, e, _ = sys.exc_info()
             raise forms.ValidationError("%(err_type)s: %(err_str)s"
@@ -506,7 +672,10 @@ class FloatMatcher(TextAnswerMatcher):
         if s == "":
             return 0
 
-        answer_float = float_or_sympy_evalf(s)
+        try:
+            answer_float = float_or_sympy_evalf(s)
+        except SympyTimeout:
+            return None
 
         if hasattr(self.matcher_desc, "atol"):
             if (abs(answer_float - self.matcher_desc.value)
@@ -534,6 +703,41 @@ TEXT_ANSWER_MATCHER_CLASSES = [
         ]
 
 
+def get_matcher_correctness(matchers, answer):
+    """
+    :returns: the best correctness that one of *matchers* gives *answer*,
+        or *None* if one of them could not determine its correctness and
+        none of the others found *answer* fully correct.
+    """
+
+    correctness = 0
+    unchecked = False
+
+    for matcher in matchers:
+        try:
+            matcher.validate(answer)
+        except forms.ValidationError:
+            continue
+
+        matcher_correctness = matcher.grade(answer)
+        if matcher_correctness is None:
+            unchecked = True
+        elif matcher_correctness >= correctness:
+            correctness = matcher_correctness
+
+    if unchecked and correctness < 1:
+        return None
+
+    return correctness
+
+
+def make_unchecked_answer_feedback():
+    return AnswerFeedback(correctness=None,
+            feedback=ugettext("Your answer could not be checked in time, "
+                "so it has not been graded. Please submit it again, or "
+                "ask the course staff to have it regraded."))
+
+
 MATCHER_RE = re.compile(r"^\<([a-zA-Z0-9_:.]+)\>(.*)$")
 MATCHER_RE_2 = re.compile(r"^([a-zA-Z0-9_.]+):(.*)$")
 
@@ -729,6 +933,12 @@ class TextQuestionBase(PageBaseWithTitle):
         from django.utils.html import escape
         return escape(normalized_answer)
 
+    def normalized_answer_key(self, page_context, page_data, answer_data):
+        answer = answer_data["answer"]
+        if not self.is_case_sensitive():
+            answer = answer.lower()
+        return answer
+
     def normalized_bytes_answer(self, page_context, page_data, answer_data):
         if answer_data is None:
             return None
@@ -929,20 +1139,10 @@ class TextQuestion(TextQuestionBase, PageBaseWithValue):
             return AnswerFeedback(correctness=0,
                     feedback=ugettext("No answer provided."))
 
-        answer = answer_data["answer"]
-
-        correctness = 0
-
-        for matcher in self.matchers:
-            try:
-                matcher.validate(answer)
-            except forms.ValidationError:
-                continue
-
-            matcher_correctness = matcher.grade(answer)
-            if (matcher_correctness is not None
-                    and matcher_correctness >= correctness):
-                correctness = matcher_correctness
+        correctness = get_matcher_correctness(
+                self.matchers, answer_data["answer"])
+        if correctness is None:
+            return make_unchecked_answer_feedback()
 
         return AnswerFeedback(correctness=correctness)
 
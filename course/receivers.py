@@ -24,14 +24,18 @@ OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
 THE SOFTWARE.
 """
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
+from django.core.signals import request_started
 from django.db import transaction
 from django.dispatch import receiver
 
+from celery.signals import task_prerun
+
 from accounts.models import User
 from course.models import (
         Course, Participation, participation_status,
         ParticipationPreapproval,
+        Event,
         )
 
 from typing import List, Union, Text, Optional, Tuple, Any  # noqa
@@ -108,4 +112,26 @@ def may_preapprove_role(course, user):
 
 # }}}
 
+
+# {{{ Keep cached event tables current
+
+@receiver(request_started)
+def clear_event_tables_on_start(**kwargs):
+    # type: (**Any) -> None
+    from course.content import clear_event_tables
+    clear_event_tables()
+
+
+task_prerun.connect(clear_event_tables_on_start)
+
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def clear_event_table_on_change(sender, instance, **kwargs):
+    # type: (Any, Event, **Any) -> None
+    from course.content import clear_event_tables
+    clear_event_tables(instance.course_id)
+
+# }}}
+
 # vim: foldmethod=marker
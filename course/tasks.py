@@ -31,12 +31,259 @@ from django.utils.translation import ugettext as _
 from course.models import (Course, FlowSession)
 from course.content import get_course_repo
 
+import logging
+logger = logging.getLogger(__name__)
+
+
+# {{{ bulk session processing
+
+def _get_session_action_message(action, count, failed):
+    if action == "expire":
+        message = _("%d sessions expired.") % count
+    elif action == "finish":
+        message = _("%d sessions ended.") % count
+    elif action == "recalculate":
+        message = _("Grades recalculated for %d sessions.") % count
+    elif action == "regrade":
+        message = _("%d sessions regraded.") % count
+    else:
+        raise ValueError("invalid session action '%s'" % action)
+
+    if failed:
+        message = message + " " + (
+                _("Processing failed for %(count)d sessions: %(errors)s")
+                % {"count": len(failed),
+                    "errors": "; ".join(
+                        "%d: %s" % (session_id, error)
+                        for session_id, error in failed)})
+
+    return message
+
+
+def _process_sessions(task, course, flow_id, action, sessions, params):
+    """Apply *action* to each of *sessions*. A failure on one session is
+    recorded and does not keep the remaining sessions from being processed.
+
+    :returns: a dictionary with the number of sessions processed in *count*
+        and a list of tuples ``(session_id, error)`` in *failed*.
+    """
+
+    repo = get_course_repo(course)
+
+    from course.utils import (
+            get_flow_rule_participation_data, get_session_grading_rules)
+    rule_data = get_flow_rule_participation_data(course, flow_id,
+            set(session.participation for session in sessions))
+
+    if action in ["expire", "finish"]:
+        from course.content import get_flow_desc, get_course_commit_sha
+        flow_desc = get_flow_desc(repo, course, flow_id,
+                get_course_commit_sha(course, participation=None))
+
+        grading_rules = get_session_grading_rules(sessions, flow_desc,
+                params["now_datetime"], rule_data_by_participation=rule_data)
+    else:
+        flow_desc = None
+        grading_rules = [None] * len(sessions)
+
+    from course.flow import (
+            adjust_flow_session_page_data,
+            expire_flow_session_standalone,
+            finish_flow_session_standalone,
+            recalculate_session_grade,
+            regrade_session)
+
+    count = 0
+    failed = []
+    nsessions = len(sessions)
+
+    from time import time
+    last_progress_time = None
+
+    if action == "regrade":
+        run_requests = _get_regrade_python_run_requests(sessions)
+    else:
+        run_requests = []
+
+    from course.page.code import prefetched_python_runs
+    with prefetched_python_runs(run_requests, batch=True, background=True):
+
+        for i, (session, grading_rule) in enumerate(zip(sessions, grading_rules)):
+            session_rule_data = rule_data[session.participation_id]
+
+            try:
+                if action == "expire":
+                    processed = expire_flow_session_standalone(
+                            repo, course, session, params["now_datetime"],
+                            past_due_only=params["past_due_only"],
+                            grading_rule=grading_rule,
+                            rule_data=session_rule_data)
+
+                elif action == "finish":
+                    adjust_flow_session_page_data(repo, session, course.identifier,
+                            flow_desc=flow_desc, respect_preview=False)
+
+                    processed = finish_flow_session_standalone(
+                            repo, course, session,
+                            now_datetime=params["now_datetime"],
+                            past_due_only=params["past_due_only"],
+                            grading_rule=grading_rule)
+
+                elif action == "recalculate":
+                    recalculate_session_grade(repo, course, session,
+                            rule_data=session_rule_data)
+                    processed = True
+
+                elif action == "regrade":
+                    regrade_session(repo, course, session,
+                            rule_data=session_rule_data)
+                    processed = True
+
+                else:
+                    raise ValueError("invalid session action '%s'" % action)
+
+            except Exception as e:
+                failed.append(
+                        (session.id, "%s: %s" % (type(e).__name__, str(e))))
+
+            else:
+                if processed:
+                    count += 1
+
+            # Updating the task state is a write to the result backend, so
+            # do not do it for every session.
+            if (last_progress_time is None
+                    or time() - last_progress_time >= 1
+                    or i + 1 == nsessions):
+                task.update_state(
+                        state='PROGRESS',
+                        meta={'current': i + 1, 'total': nsessions})
+                last_progress_time = time()
+
+    return {"count": count, "failed": failed}
+
+
+def _get_regrade_python_run_requests(sessions):
+    """Return the code runs that regrading *sessions* will need, so that
+    they can be carried out in batches ahead of time.
+    """
+
+    from course.flow import get_sessions_grading_data, get_python_run_requests
+
+    visits = []
+    for grading_data in get_sessions_grading_data(sessions):
+        for visit in grading_data.answer_visits:
+            if visit is None:
+                continue
+
+            # In-progress sessions only get regraded where there already
+            # is a grade.
+            if (grading_data.flow_session.in_progress
+                    and grading_data.get_most_recent_grade(visit) is None):
+                continue
+
+            visits.append(visit)
+
+    try:
+        return get_python_run_requests(visits, respect_preview=False)
+    except Exception:
+        # Prefetching is only an optimization. Any problem will show up
+        # again (and be reported) when the session itself is regraded.
+        return []
+
+
+@shared_task(bind=True)
+def process_flow_session_chunk(self, course_id, flow_id, action, session_ids,
+        params):
+    course = Course.objects.get(id=course_id)
+
+    sessions = list(FlowSession.objects
+            .filter(id__in=session_ids)
+            .select_related("participation")
+            .order_by("id"))
+
+    return _process_sessions(self, course, flow_id, action, sessions, params)
+
+
+@shared_task(bind=True)
+def summarize_flow_session_chunks(self, chunk_results, action):
+    count = sum(chunk_result["count"] for chunk_result in chunk_results)
+    failed = [
+            failure
+            for chunk_result in chunk_results
+            for failure in chunk_result["failed"]]
+
+    return {
+            "message": _get_session_action_message(action, count, failed),
+            "failed": failed,
+            }
+
+
+def _run_session_action(task, course, flow_id, action, sessions, params):
+    """Apply *action* to *sessions*, either within *task* or, for large
+    numbers of sessions, by fanning out to a chord of
+    :func:`process_flow_session_chunk` tasks whose results are summarized by
+    :func:`summarize_flow_session_chunks`.
+
+    In the latter case, the result of *task* carries the IDs of the chunk
+    and summary tasks in *fan_out*, which :func:`course.views.monitor_task`
+    uses to report overall progress.
+    """
+
+    from django.conf import settings
+    chunk_size = getattr(settings, "RELATE_BULK_SESSION_TASK_CHUNK_SIZE", None)
+
+    if not chunk_size or len(sessions) <= chunk_size:
+        result = _process_sessions(
+                task, course, flow_id, action, sessions, params)
+
+        return {
+                "message": _get_session_action_message(
+                    action, result["count"], result["failed"]),
+                "failed": result["failed"],
+                }
+
+    session_ids = [session.id for session in sessions]
+
+    from celery import chord
+    from celery.utils import uuid
+
+    chunks = []
+    header = []
+    for i in range(0, len(session_ids), chunk_size):
+        chunk_session_ids = session_ids[i:i+chunk_size]
+        chunk_task_id = uuid()
+
+        chunks.append((chunk_task_id, len(chunk_session_ids)))
+        header.append(
+                process_flow_session_chunk.s(
+                    course.id, flow_id, action, chunk_session_ids, params)
+                .set(task_id=chunk_task_id))
+
+    summary_task_id = uuid()
+    chord(header)(
+            summarize_flow_session_chunks.s(action)
+            .set(task_id=summary_task_id))
+
+    return {
+            "message": _("%(nsessions)d sessions distributed "
+                "across %(nchunks)d tasks.") % {
+                    "nsessions": len(sessions),
+                    "nchunks": len(chunks)},
+            "fan_out": {
+                "chunks": chunks,
+                "total": len(sessions),
+                "summary_task_id": summary_task_id,
+                },
+            }
+
+# }}}
+
 
 @shared_task(bind=True)
 def expire_in_progress_sessions(self, course_id, flow_id, rule_tag, now_datetime,
         past_due_only):
     course = Course.objects.get(id=course_id)
-    repo = get_course_repo(course)
 
     sessions = (FlowSession.objects
             .filter(
@@ -47,30 +294,16 @@ def expire_in_progress_sessions(self, course_id, flow_id, rule_tag, now_datetime
                 in_progress=True,
                 ))
 
-    count = 0
-    nsessions = sessions.count()
-
-    from course.flow import expire_flow_session_standalone
-
-    for i, session in enumerate(sessions):
-        if expire_flow_session_standalone(repo, course, session, now_datetime,
-                past_due_only=past_due_only):
-            count += 1
-
-        self.update_state(
-                state='PROGRESS',
-                meta={'current': i, 'total': nsessions})
-
-    repo.close()
+    sessions = list(sessions.select_related("participation"))
 
-    return {"message": _("%d sessions expired.") % count}
+    return _run_session_action(self, course, flow_id, "expire", sessions,
+            {"now_datetime": now_datetime, "past_due_only": past_due_only})
 
 
 @shared_task(bind=True)
 def finish_in_progress_sessions(self, course_id, flow_id, rule_tag, now_datetime,
         past_due_only):
     course = Course.objects.get(id=course_id)
-    repo = get_course_repo(course)
 
     sessions = (FlowSession.objects
             .filter(
@@ -81,32 +314,15 @@ def finish_in_progress_sessions(self, course_id, flow_id, rule_tag, now_datetime
                 in_progress=True,
                 ))
 
-    count = 0
-    nsessions = sessions.count()
-
-    from course.flow import finish_flow_session_standalone
-    for i, session in enumerate(sessions):
-        from course.flow import adjust_flow_session_page_data
-        adjust_flow_session_page_data(repo, session, course.identifier,
-                respect_preview=False)
+    sessions = list(sessions.select_related("participation"))
 
-        if finish_flow_session_standalone(repo, course, session,
-                now_datetime=now_datetime, past_due_only=past_due_only):
-            count += 1
-
-        self.update_state(
-                state='PROGRESS',
-                meta={'current': i, 'total': nsessions})
-
-    repo.close()
-
-    return {"message": _("%d sessions ended.") % count}
+    return _run_session_action(self, course, flow_id, "finish", sessions,
+            {"now_datetime": now_datetime, "past_due_only": past_due_only})
 
 
 @shared_task(bind=True)
 def recalculate_ended_sessions(self, course_id, flow_id, rule_tag):
     course = Course.objects.get(id=course_id)
-    repo = get_course_repo(course)
 
     sessions = (FlowSession.objects
             .filter(
@@ -117,27 +333,15 @@ def recalculate_ended_sessions(self, course_id, flow_id, rule_tag):
                 in_progress=False,
                 ))
 
-    nsessions = sessions.count()
-    count = 0
-
-    from course.flow import recalculate_session_grade
-    for session in sessions:
-        recalculate_session_grade(repo, course, session)
-        count += 1
-
-        self.update_state(
-                state='PROGRESS',
-                meta={'current': count, 'total': nsessions})
-
-    repo.close()
+    sessions = list(sessions.select_related("participation"))
 
-    return {"message": _("Grades recalculated for %d sessions.") % count}
+    return _run_session_action(self, course, flow_id, "recalculate", sessions,
+            {})
 
 
 @shared_task(bind=True)
 def regrade_flow_sessions(self, course_id, flow_id, access_rules_tag, inprog_value):
     course = Course.objects.get(id=course_id)
-    repo = get_course_repo(course)
 
     sessions = (FlowSession.objects
             .filter(
@@ -151,21 +355,87 @@ def regrade_flow_sessions(self, course_id, flow_id, access_rules_tag, inprog_val
     if inprog_value is not None:
         sessions = sessions.filter(in_progress=inprog_value)
 
-    nsessions = sessions.count()
-    count = 0
+    sessions = list(sessions.select_related("participation"))
 
-    from course.flow import regrade_session
-    for session in sessions:
-        regrade_session(repo, course, session)
-        count += 1
+    return _run_session_action(self, course, flow_id, "regrade", sessions, {})
+
+
+@shared_task(bind=True)
+def adjust_in_progress_session_page_data(self, course_id, flow_id=None):
+    """Bring the page data of all in-progress sessions of the course (or of
+    just the flow *flow_id*) up to date with the active revision of the
+    course content, so that participants do not pay for the migration on
+    their next page view.
+    """
+
+    course = Course.objects.get(id=course_id)
+    repo = get_course_repo(course)
+
+    from course.content import get_course_commit_sha
+    commit_sha = get_course_commit_sha(course, participation=None)
+    revision_key = "2:"+commit_sha.decode()
+
+    sessions = (FlowSession.objects
+            .filter(
+                course=course,
+                in_progress=True)
+            .exclude(page_data_at_revision_key=revision_key))
+
+    if flow_id is not None:
+        sessions = sessions.filter(flow_id=flow_id)
+
+    session_ids = list(sessions
+            .order_by("flow_id")
+            .values_list("id", flat=True))
+
+    nsessions = len(session_ids)
+    count = 0
+    failed = 0
+
+    from django.core.exceptions import ObjectDoesNotExist
+    from course.content import get_flow_desc
+    from course.flow import adjust_flow_session_page_data
+
+    flow_descs = {}
+    for i, session_id in enumerate(session_ids):
+        # The session may have ended since the list was made.
+        session = (FlowSession.objects
+                .filter(id=session_id, in_progress=True)
+                .select_related("course", "participation")
+                .first())
+
+        if session is not None:
+            try:
+                if session.flow_id not in flow_descs:
+                    try:
+                        flow_descs[session.flow_id] = get_flow_desc(
+                                repo, course, session.flow_id, commit_sha)
+                    except ObjectDoesNotExist:
+                        flow_descs[session.flow_id] = None
+
+                flow_desc = flow_descs[session.flow_id]
+                if flow_desc is not None:
+                    # runs in its own transaction
+                    adjust_flow_session_page_data(repo, session,
+                            course.identifier, flow_desc=flow_desc,
+                            respect_preview=False)
+                    count += 1
+
+            except Exception:
+                # Leave this session to be updated on its next visit.
+                logger.exception("failed to adjust page data of "
+                        "flow session %d", session_id)
+                failed += 1
 
         self.update_state(
                 state='PROGRESS',
-                meta={'current': count, 'total': nsessions})
+                meta={'current': i, 'total': nsessions})
 
-    repo.close()
+    if failed:
+        return {"message": _("Page data updated for %(count)d sessions, "
+            "failed for %(failed)d.") % {"count": count, "failed": failed}}
 
-    return {"message": _("%d sessions regraded.") % count}
+    return {"message": _("Page data updated for %d sessions.") % count}
 
 
 # vim: foldmethod=marker
@@ -25,7 +25,7 @@ THE SOFTWARE.
 """
 
 import six
-from typing import cast, Tuple, List, Text, Iterable, Any, Optional  # noqa
+from typing import cast, Tuple, List, Text, Iterable, Any, Optional, Dict  # noqa
 import datetime  # noqa
 
 from django.shortcuts import (  # noqa
@@ -142,61 +142,417 @@ class FlowSessionGradingRule(FlowSessionRuleBase):
         self.bonus_points = bonus_points
 
 
-def _eval_generic_conditions(
-        rule,  # type: Any
+# {{{ compiled rules
+
+class FlowRuleParticipationData(object):
+    """The data about a participation's standing in a flow that flow rules
+    may test: its roles, its active :class:`course.models.FlowRuleException`
+    instances and a summary of its sessions.
+
+    Each kind of data is fetched at most once, on first use. Use
+    :func:`get_flow_rule_participation_data` to fetch it for many
+    participations at once. Since session counts are cached, an instance
+    should not be reused across the creation of new sessions.
+    """
+
+    def __init__(
+            self,
+            course,  # type: Course
+            participation,  # type: Optional[Participation]
+            flow_id,  # type: Text
+            resolved_dates=None,  # type: Optional[Dict[Any, datetime.datetime]]
+            ):
+        # type: (...) -> None
+        self.course = course
+        self.participation = participation
+        self.flow_id = flow_id
+
+        if resolved_dates is None:
+            resolved_dates = {}
+        self.resolved_dates = resolved_dates
+
+        self._roles = None  # type: Optional[List[Text]]
+        self._exceptions = None  # type: Optional[List[Any]]
+        self._session_states = None  # type: Optional[List[Tuple[bool, Optional[Text]]]]  # noqa
+
+    def roles(self):
+        # type: () -> List[Text]
+        if self._roles is None:
+            from course.enrollment import get_participation_role_identifiers
+            self._roles = list(get_participation_role_identifiers(
+                    self.course, self.participation))
+
+        return self._roles
+
+    def _get_exceptions(self):
+        # type: () -> List[Any]
+        if self._exceptions is None:
+            from course.models import FlowRuleException
+            self._exceptions = list(
+                    FlowRuleException.objects
+                    .filter(
+                        participation=self.participation,
+                        active=True,
+                        flow_id=self.flow_id)
+                    .order_by("creation_time"))
+
+        return self._exceptions
+
+    def exception_rules(self, kind, now_datetime):
+        # type: (Text, datetime.datetime) -> List[CompiledFlowRule]
+        """Return compiled exception rules of *kind* in the order in which
+        they should be tried.
+        """
+
+        result = []
+        # rules created first will get inserted first, and show up last
+        for exc in self._get_exceptions():
+            if exc.kind != kind:
+                continue
+
+            if exc.expiration is not None and now_datetime > exc.expiration:
+                continue
+
+            from relate.utils import dict_to_struct
+            result.insert(0, CompiledFlowRule(kind, dict_to_struct(exc.rule)))
+
+        return result
+
+    def session_states(self):
+        # type: () -> List[Tuple[bool, Optional[Text]]]
+        """Return a list of *(in_progress, access_rules_tag)* tuples, one
+        for each session of the participation in the flow.
+        """
+        if self._session_states is None:
+            from course.models import FlowSession
+            self._session_states = list(
+                    FlowSession.objects
+                    .filter(
+                        participation=self.participation,
+                        course=self.course,
+                        flow_id=self.flow_id)
+                    .values_list("in_progress", "access_rules_tag"))
+
+        return self._session_states
+
+    def resolve_date(self, datespec):
+        # type: (Any) -> datetime.datetime
+        if isinstance(datespec, (datetime.date, datetime.datetime)):
+            return parse_date_spec(self.course, datespec)
+
+        try:
+            return self.resolved_dates[datespec]
+        except KeyError:
+            result = self.resolved_dates[datespec] = \
+                    parse_date_spec(self.course, datespec)
+            return result
+
+
+def get_flow_rule_participation_data(
         course,  # type: Course
-        participation,  # type: Optional[Participation]
-        now_datetime,  # type: datetime.datetime
         flow_id,  # type: Text
-        login_exam_ticket,  # type: Optional[ExamTicket]
+        participations,  # type: Iterable[Participation]
         ):
-    # type: (...) -> bool
+    # type: (...) -> Dict[int, FlowRuleParticipationData]
+    """Return a mapping from participation IDs to
+    :class:`FlowRuleParticipationData` for all of *participations*, fetched
+    with a constant number of queries.
+    """
 
-    if hasattr(rule, "if_before"):
-        ds = parse_date_spec(course, rule.if_before)
-        if not (now_datetime <= ds):
-            return False
+    resolved_dates = {}  # type: Dict[Any, datetime.datetime]
+    result = dict(
+            (participation.id, FlowRuleParticipationData(
+                course, participation, flow_id,
+                resolved_dates=resolved_dates))
+            for participation in participations)
+
+    for data in six.itervalues(result):
+        data._roles = []
+        data._exceptions = []
+        data._session_states = []
+
+    participation_ids = list(result.keys())
+
+    from course.models import (
+            ParticipationRole, FlowRuleException, FlowSession)
+
+    for participation_id, identifier in (
+            ParticipationRole.objects
+            .filter(participation__in=participation_ids)
+            .values_list("participation__id", "identifier")):
+        result[participation_id]._roles.append(identifier)
+
+    for exc in (
+            FlowRuleException.objects
+            .filter(
+                participation__in=participation_ids,
+                active=True,
+                flow_id=flow_id)
+            .order_by("creation_time")):
+        result[exc.participation_id]._exceptions.append(exc)
+
+    for participation_id, in_progress, access_rules_tag in (
+            FlowSession.objects
+            .filter(
+                participation__in=participation_ids,
+                course=course,
+                flow_id=flow_id)
+            .values_list("participation_id", "in_progress", "access_rules_tag")):
+        result[participation_id]._session_states.append(
+                (in_progress, access_rules_tag))
+
+    return result
+
+
+class FlowRuleEvaluationContext(object):
+    def __init__(
+            self,
+            data,  # type: FlowRuleParticipationData
+            now_datetime,  # type: datetime.datetime
+            facilities=frozenset(),  # type: frozenset[Text]
+            login_exam_ticket=None,  # type: Optional[ExamTicket]
+            for_rollover=False,  # type: bool
+            ):
+        # type: (...) -> None
+        self.data = data
+        self.now_datetime = now_datetime
+        self.facilities = facilities
+        self.login_exam_ticket = login_exam_ticket
+        self.for_rollover = for_rollover
 
-    if hasattr(rule, "if_after"):
-        ds = parse_date_spec(course, rule.if_after)
-        if not (now_datetime >= ds):
-            return False
 
-    if hasattr(rule, "if_has_role"):
-        from course.enrollment import get_participation_role_identifiers
-        roles = get_participation_role_identifiers(course, participation)
-        if all(role not in rule.if_has_role for role in roles):
-            return False
+class CompiledFlowRule(object):
+    """A flow rule of a given *kind* (see :class:`course.constants.flow_rule_kind`)
+    whose conditions have been turned into a list of predicates once.
+
+    Each predicate is called as ``pred(ectx, session)``, where *ectx* is a
+    :class:`FlowRuleEvaluationContext` and *session* is the
+    :class:`course.models.FlowSession` being considered (*None* for start
+    rules).
+    """
 
-    if (hasattr(rule, "if_signed_in_with_matching_exam_ticket")
-            and rule.if_signed_in_with_matching_exam_ticket):
-        if login_exam_ticket is None:
-            return False
-        if login_exam_ticket is None:
-            return False
-        if login_exam_ticket.exam.flow_id != flow_id:
-            return False
+    def __init__(self, kind, rule):
+        # type: (Text, Any) -> None
+        from relate.utils import struct_to_dict
+        self.kind = kind
+        self.rule = rule
+        self.attrs = struct_to_dict(rule)
+        self.predicates = self._compile_predicates()
 
-    return True
+    def has(self, name):
+        # type: (Text) -> bool
+        return name in self.attrs
 
+    def get(self, name, default=None):
+        # type: (Text, Any) -> Any
+        return self.attrs.get(name, default)
 
-def _eval_generic_session_conditions(
-        rule,  # type: Any
-        session,  # type: FlowSession
-        now_datetime,  # type: datetime.datetime
-        ):
-    # type: (...) -> bool
+    def _compile_predicates(self):
+        # type: () -> List[Any]
+        attrs = self.attrs
+        preds = []  # type: List[Any]
+
+        # {{{ generic conditions
+
+        if self.kind in [flow_rule_kind.start, flow_rule_kind.access]:
+            if "if_before" in attrs:
+                if_before = attrs["if_before"]
+                preds.append(lambda ectx, session:
+                        ectx.now_datetime <= ectx.data.resolve_date(if_before))
+
+            if "if_after" in attrs:
+                if_after = attrs["if_after"]
+                preds.append(lambda ectx, session:
+                        ectx.now_datetime >= ectx.data.resolve_date(if_after))
+
+        if "if_has_role" in attrs:
+            if_has_role = attrs["if_has_role"]
+            preds.append(lambda ectx, session:
+                    any(role in if_has_role for role in ectx.data.roles()))
+
+        if (self.kind in [flow_rule_kind.start, flow_rule_kind.access]
+                and attrs.get("if_signed_in_with_matching_exam_ticket")):
+            def matching_exam_ticket(ectx, session):
+                ticket = ectx.login_exam_ticket
+                return (ticket is not None
+                        and ticket.exam.flow_id == ectx.data.flow_id)
+
+            preds.append(matching_exam_ticket)
+
+        # }}}
+
+        # {{{ session conditions
+
+        if self.kind in [flow_rule_kind.access, flow_rule_kind.grading]:
+            if "if_has_tag" in attrs:
+                if_has_tag = attrs["if_has_tag"]
+                preds.append(lambda ectx, session:
+                        session.access_rules_tag == if_has_tag)
+
+            if "if_started_before" in attrs:
+                if_started_before = attrs["if_started_before"]
+                preds.append(lambda ectx, session:
+                        session.start_time
+                        < ectx.data.resolve_date(if_started_before))
+
+        # }}}
+
+        if self.kind == flow_rule_kind.start:
+            preds.extend(self._compile_start_predicates())
+        elif self.kind == flow_rule_kind.access:
+            preds.extend(self._compile_access_predicates())
+        elif self.kind == flow_rule_kind.grading:
+            preds.extend(self._compile_grading_predicates())
+
+        return preds
+
+    def _compile_start_predicates(self):
+        # type: () -> List[Any]
+        attrs = self.attrs
+        preds = []  # type: List[Any]
+
+        # These conditions are ignored when rolling over a session.
+
+        if "if_in_facility" in attrs:
+            if_in_facility = attrs["if_in_facility"]
+            preds.append(lambda ectx, session:
+                    ectx.for_rollover or if_in_facility in ectx.facilities)
+
+        if "if_has_in_progress_session" in attrs:
+            if_has_in_progress_session = attrs["if_has_in_progress_session"]
+            preds.append(lambda ectx, session:
+                    ectx.for_rollover
+                    or any(in_progress
+                        for in_progress, tag in ectx.data.session_states())
+                    == if_has_in_progress_session)
+
+        if "if_has_session_tagged" in attrs:
+            if_has_session_tagged = attrs["if_has_session_tagged"]
+            preds.append(lambda ectx, session:
+                    ectx.for_rollover
+                    or any(tag == if_has_session_tagged
+                        for in_progress, tag in ectx.data.session_states()))
+
+        if "if_has_fewer_sessions_than" in attrs:
+            if_has_fewer_sessions_than = attrs["if_has_fewer_sessions_than"]
+            preds.append(lambda ectx, session:
+                    ectx.for_rollover
+                    or len(ectx.data.session_states())
+                    < if_has_fewer_sessions_than)
+
+        if "if_has_fewer_tagged_sessions_than" in attrs:
+            if_has_fewer_tagged_sessions_than = \
+                    attrs["if_has_fewer_tagged_sessions_than"]
+            preds.append(lambda ectx, session:
+                    ectx.for_rollover
+                    or sum(1
+                        for in_progress, tag in ectx.data.session_states()
+                        if tag is not None)
+                    < if_has_fewer_tagged_sessions_than)
+
+        return preds
+
+    def _compile_access_predicates(self):
+        # type: () -> List[Any]
+        attrs = self.attrs
+        preds = []  # type: List[Any]
+
+        if "if_in_facility" in attrs:
+            if_in_facility = attrs["if_in_facility"]
+            preds.append(lambda ectx, session:
+                    if_in_facility in ectx.facilities)
+
+        if "if_in_progress" in attrs:
+            if_in_progress = attrs["if_in_progress"]
+            preds.append(lambda ectx, session:
+                    session.in_progress == if_in_progress)
+
+        if "if_expiration_mode" in attrs:
+            if_expiration_mode = attrs["if_expiration_mode"]
+            preds.append(lambda ectx, session:
+                    session.expiration_mode == if_expiration_mode)
+
+        if "if_session_duration_shorter_than_minutes" in attrs:
+            max_duration_min = attrs["if_session_duration_shorter_than_minutes"]
+
+            def duration_shorter_than(ectx, session):
+                duration_min = (
+                        ectx.now_datetime - session.start_time
+                        ).total_seconds() / 60
+
+                if session.participation is not None:
+                    duration_min /= float(session.participation.time_factor)
+
+                return duration_min <= max_duration_min
+
+            preds.append(duration_shorter_than)
+
+        return preds
+
+    def _compile_grading_predicates(self):
+        # type: () -> List[Any]
+        attrs = self.attrs
+        preds = []  # type: List[Any]
+
+        if "if_completed_before" in attrs:
+            if_completed_before = attrs["if_completed_before"]
+
+            def completed_before(ectx, session):
+                ds = ectx.data.resolve_date(if_completed_before)
+                if session.in_progress:
+                    return ectx.now_datetime <= ds
+                else:
+                    return session.completion_time <= ds
+
+            preds.append(completed_before)
+
+        return preds
+
+    def matches(self, ectx, session=None):
+        # type: (FlowRuleEvaluationContext, Optional[FlowSession]) -> bool
+        for pred in self.predicates:
+            if not pred(ectx, session):
+                return False
+
+        return True
+
+
+_DEFAULT_RULES_DESC = {
+        flow_rule_kind.start: [
+            dict(may_start_new_session=True, may_list_existing_sessions=False)],
+        flow_rule_kind.access: [
+            dict(permissions=[flow_permission.view])],
+        flow_rule_kind.grading: [
+            dict(generates_grade=False)],
+        }
+
+
+def get_compiled_flow_rules(flow_desc, kind):
+    # type: (FlowDesc, Text) -> List[CompiledFlowRule]
+    """Return the rules of *kind* in *flow_desc* (or the default rules if
+    there are none) as a list of :class:`CompiledFlowRule`. The result is
+    computed once and stored on *flow_desc*.
+    """
+
+    compiled_rules = getattr(flow_desc, "_compiled_rules", None)
+    if compiled_rules is None:
+        compiled_rules = flow_desc._compiled_rules = {}
 
-    if hasattr(rule, "if_has_tag"):
-        if session.access_rules_tag != rule.if_has_tag:
-            return False
+    try:
+        return compiled_rules[kind]
+    except KeyError:
+        pass
 
-    if hasattr(rule, "if_started_before"):
-        ds = parse_date_spec(session.course, rule.if_started_before)
-        if not session.start_time < ds:
-            return False
+    if (not hasattr(flow_desc, "rules")
+            or not hasattr(flow_desc.rules, kind)):
+        from relate.utils import dict_to_struct
+        rules = [dict_to_struct(rule) for rule in _DEFAULT_RULES_DESC[kind]]
+    else:
+        rules = getattr(flow_desc.rules, kind)
 
-    return True
+    result = compiled_rules[kind] = [
+            CompiledFlowRule(kind, rule) for rule in rules]
+    return result
 
 
 def get_flow_rules(
@@ -206,36 +562,26 @@ def get_flow_rules(
         flow_id,  # type: Text
         now_datetime,  # type: datetime.datetime
         consider_exceptions=True,  # type: bool
-        default_rules_desc=[]  # type: List[Any]
+        rule_data=None,  # type: Optional[FlowRuleParticipationData]
         ):
-    # type: (...) -> List[Any]
+    # type: (...) -> List[CompiledFlowRule]
 
-    if (not hasattr(flow_desc, "rules")
-            or not hasattr(flow_desc.rules, kind)):
-        rules = default_rules_desc[:]
-    else:
-        rules = getattr(flow_desc.rules, kind)[:]
+    rules = get_compiled_flow_rules(flow_desc, kind)
 
-    from course.models import FlowRuleException
     if consider_exceptions:
-        for exc in (
-                FlowRuleException.objects
-                .filter(
-                    participation=participation,
-                    active=True,
-                    kind=kind,
-                    flow_id=flow_id)
-                # rules created first will get inserted first, and show up last
-                .order_by("creation_time")):
+        if rule_data is None:
+            rule_data = FlowRuleParticipationData(
+                    participation.course if participation is not None else None,
+                    participation, flow_id)
 
-            if exc.expiration is not None and now_datetime > exc.expiration:
-                continue
-
-            from relate.utils import dict_to_struct
-            rules.insert(0, dict_to_struct(exc.rule))
+        exception_rules = rule_data.exception_rules(kind, now_datetime)
+        if exception_rules:
+            rules = exception_rules + rules
 
     return rules
 
+# }}}
+
 
 def get_session_start_rule(
         course,  # type: Course
@@ -246,82 +592,44 @@ def get_session_start_rule(
         facilities=None,  # type: Optional[frozenset[Text]]
         for_rollover=False,  # type: bool
         login_exam_ticket=None,  # type: Optional[ExamTicket]
+        rule_data=None,  # type: Optional[FlowRuleParticipationData]
         ):
     # type: (...) -> FlowSessionStartRule
 
     """Return a :class:`FlowSessionStartRule` if a new session is
     permitted or *None* if no new session is allowed.
+
+    :arg rule_data: a :class:`FlowRuleParticipationData` for *participation*,
+        to avoid refetching it across multiple rule evaluations.
     """
 
     if facilities is None:
         facilities = frozenset()
 
-    from relate.utils import dict_to_struct
+    if rule_data is None:
+        rule_data = FlowRuleParticipationData(course, participation, flow_id)
+
+    ectx = FlowRuleEvaluationContext(
+            rule_data, now_datetime,
+            facilities=facilities,
+            login_exam_ticket=login_exam_ticket,
+            for_rollover=for_rollover)
+
     rules = get_flow_rules(flow_desc, flow_rule_kind.start,
-            participation, flow_id, now_datetime,
-            default_rules_desc=[
-                dict_to_struct(dict(
-                    may_start_new_session=True,
-                    may_list_existing_sessions=False))])
+            participation, flow_id, now_datetime, rule_data=rule_data)
 
-    from course.models import FlowSession  # noqa
     for rule in rules:
-        if not _eval_generic_conditions(rule, course, participation,
-                now_datetime, flow_id=flow_id,
-                login_exam_ticket=login_exam_ticket):
+        if not rule.matches(ectx):
             continue
 
-        if not for_rollover and hasattr(rule, "if_in_facility"):
-            if rule.if_in_facility not in facilities:
-                continue
-
-        if not for_rollover and hasattr(rule, "if_has_in_progress_session"):
-            session_count = FlowSession.objects.filter(
-                    participation=participation,
-                    course=course,
-                    flow_id=flow_id,
-                    in_progress=True).count()
-
-            if bool(session_count) != rule.if_has_in_progress_session:
-                continue
-
-        if not for_rollover and hasattr(rule, "if_has_session_tagged"):
-            tagged_session_count = FlowSession.objects.filter(
-                    participation=participation,
-                    course=course,
-                    access_rules_tag=rule.if_has_session_tagged,
-                    flow_id=flow_id).count()
-
-            if not tagged_session_count:
-                continue
-
-        if not for_rollover and hasattr(rule, "if_has_fewer_sessions_than"):
-            session_count = FlowSession.objects.filter(
-                    participation=participation,
-                    course=course,
-                    flow_id=flow_id).count()
-
-            if session_count >= rule.if_has_fewer_sessions_than:
-                continue
-
-        if not for_rollover and hasattr(rule, "if_has_fewer_tagged_sessions_than"):
-            tagged_session_count = FlowSession.objects.filter(
-                    participation=participation,
-                    course=course,
-                    access_rules_tag__isnull=False,
-                    flow_id=flow_id).count()
-
-            if tagged_session_count >= rule.if_has_fewer_tagged_sessions_than:
-                continue
-
         return FlowSessionStartRule(
-                tag_session=getattr(rule, "tag_session", None),
-                may_start_new_session=getattr(
-                    rule, "may_start_new_session", True),
-                may_list_existing_sessions=getattr(
-                    rule, "may_list_existing_sessions", True),
-                default_expiration_mode=getattr(
-                    rule, "default_expiration_mode", None),
+                tag_session=rule.get("tag_session", None),
+                may_start_new_session=rule.get(
+                    "may_start_new_session", True),
+                may_list_existing_sessions=rule.get(
+                    "may_list_existing_sessions", True),
+                default_expiration_mode=rule.get(
+                    "default_expiration_mode", None),
                 )
 
     return FlowSessionStartRule(
@@ -335,55 +643,38 @@ def get_session_access_rule(
         now_datetime,  # type: datetime.datetime
         facilities=None,  # type: Optional[frozenset[Text]]
         login_exam_ticket=None,  # type: Optional[ExamTicket]
+        rule_data=None,  # type: Optional[FlowRuleParticipationData]
         ):
     # type: (...) -> FlowSessionAccessRule
     """Return a :class:`ExistingFlowSessionRule`` to describe
     how a flow may be accessed.
+
+    :arg rule_data: a :class:`FlowRuleParticipationData` for the session's
+        participation, to avoid refetching it across multiple rule
+        evaluations.
     """
 
     if facilities is None:
         facilities = frozenset()
 
-    from relate.utils import dict_to_struct
+    if rule_data is None:
+        rule_data = FlowRuleParticipationData(
+                session.course, session.participation, session.flow_id)
+
+    ectx = FlowRuleEvaluationContext(
+            rule_data, now_datetime,
+            facilities=facilities,
+            login_exam_ticket=login_exam_ticket)
+
     rules = get_flow_rules(flow_desc, flow_rule_kind.access,
             session.participation, session.flow_id, now_datetime,
-            default_rules_desc=[
-                dict_to_struct(dict(
-                    permissions=[flow_permission.view],
-                    ))])  # type: List[FlowSessionAccessRuleDesc]
+            rule_data=rule_data)
 
     for rule in rules:
-        if not _eval_generic_conditions(
-                rule, session.course, session.participation,
-                now_datetime, flow_id=session.flow_id,
-                login_exam_ticket=login_exam_ticket):
-            continue
-
-        if not _eval_generic_session_conditions(rule, session, now_datetime):
+        if not rule.matches(ectx, session):
             continue
 
-        if hasattr(rule, "if_in_facility"):
-            if rule.if_in_facility not in facilities:
-                continue
-
-        if hasattr(rule, "if_in_progress"):
-            if session.in_progress != rule.if_in_progress:
-                continue
-
-        if hasattr(rule, "if_expiration_mode"):
-            if session.expiration_mode != rule.if_expiration_mode:
-                continue
-
-        if hasattr(rule, "if_session_duration_shorter_than_minutes"):
-            duration_min = (now_datetime - session.start_time).total_seconds() / 60
-
-            if session.participation is not None:
-                duration_min /= float(session.participation.time_factor)
-
-            if duration_min > rule.if_session_duration_shorter_than_minutes:
-                continue
-
-        permissions = set(rule.permissions)
+        permissions = set(rule.get("permissions"))
 
         # {{{ deal with deprecated permissions
 
@@ -411,7 +702,7 @@ def get_session_access_rule(
 
         return FlowSessionAccessRule(
                 permissions=frozenset(permissions),
-                message=getattr(rule, "message", None)
+                message=rule.get("message", None)
                 )
 
     return FlowSessionAccessRule(permissions=frozenset())
@@ -420,43 +711,38 @@ def get_session_access_rule(
 def get_session_grading_rule(
         session,  # type: FlowSession
         flow_desc,  # type: FlowDesc
-        now_datetime  # type: datetime.datetime
+        now_datetime,  # type: datetime.datetime
+        rule_data=None,  # type: Optional[FlowRuleParticipationData]
         ):
     # type: (...) -> FlowSessionGradingRule
 
+    """
+    :arg rule_data: a :class:`FlowRuleParticipationData` for the session's
+        participation, to avoid refetching it across multiple rule
+        evaluations.
+    """
+
     flow_desc_rules = getattr(flow_desc, "rules", None)
 
-    from relate.utils import dict_to_struct
+    if rule_data is None:
+        rule_data = FlowRuleParticipationData(
+                session.course, session.participation, session.flow_id)
+
+    ectx = FlowRuleEvaluationContext(rule_data, now_datetime)
+
     rules = get_flow_rules(flow_desc, flow_rule_kind.grading,
             session.participation, session.flow_id, now_datetime,
-            default_rules_desc=[
-                dict_to_struct(dict(
-                    generates_grade=False,
-                    ))])
-
-    from course.enrollment import get_participation_role_identifiers
-    roles = get_participation_role_identifiers(session.course, session.participation)
+            rule_data=rule_data)
 
     for rule in rules:
-        if hasattr(rule, "if_has_role"):
-            if all(role not in rule.if_has_role for role in roles):
-                continue
-
-        if not _eval_generic_session_conditions(rule, session, now_datetime):
+        if not rule.matches(ectx, session):
             continue
 
-        if hasattr(rule, "if_completed_before"):
-            ds = parse_date_spec(session.course, rule.if_completed_before)
-            if session.in_progress and now_datetime > ds:
-                continue
-            if not session.in_progress and session.completion_time > ds:
-                continue
-
-        due = parse_date_spec(session.course, getattr(rule, "due", None))
+        due = rule_data.resolve_date(rule.get("due", None))
         if due is not None:
             assert due.tzinfo is not None
 
-        generates_grade = getattr(rule, "generates_grade", True)
+        generates_grade = rule.get("generates_grade", True)
 
         grade_identifier = None
         grade_aggregation_strategy = None
@@ -465,20 +751,22 @@ def get_session_grading_rule(
             grade_aggregation_strategy = getattr(
                     flow_desc_rules, "grade_aggregation_strategy", None)
 
-        bonus_points = getattr_with_fallback((rule, flow_desc), "bonus_points", 0)
-        max_points = getattr_with_fallback((rule, flow_desc), "max_points", None)
+        bonus_points = getattr_with_fallback(
+                (rule.rule, flow_desc), "bonus_points", 0)
+        max_points = getattr_with_fallback(
+                (rule.rule, flow_desc), "max_points", None)
         max_points_enforced_cap = getattr_with_fallback(
-                (rule, flow_desc), "max_points_enforced_cap", None)
+                (rule.rule, flow_desc), "max_points_enforced_cap", None)
 
         return FlowSessionGradingRule(
                 grade_identifier=grade_identifier,
                 grade_aggregation_strategy=grade_aggregation_strategy,
                 due=due,
                 generates_grade=generates_grade,
-                description=getattr(rule, "description", None),
-                credit_percent=getattr(rule, "credit_percent", 100),
-                use_last_activity_as_completion_time=getattr(
-                    rule, "use_last_activity_as_completion_time", False),
+                description=rule.get("description", None),
+                credit_percent=rule.get("credit_percent", 100),
+                use_last_activity_as_completion_time=rule.get(
+                    "use_last_activity_as_completion_time", False),
 
                 bonus_points=bonus_points,
                 max_points=max_points,
@@ -488,6 +776,34 @@ def get_session_grading_rule(
     raise RuntimeError(_("grading rule determination was unable to find "
             "a grading rule"))
 
+
+def get_session_grading_rules(
+        sessions,  # type: List[FlowSession]
+        flow_desc,  # type: FlowDesc
+        now_datetime,  # type: datetime.datetime
+        rule_data_by_participation=None,  # type: Optional[Dict[int, FlowRuleParticipationData]]  # noqa
+        ):
+    # type: (...) -> List[FlowSessionGradingRule]
+    """Evaluate the grading rules of *flow_desc* for each of *sessions*, all
+    of which must belong to the same course and flow and must have a
+    participation. Participation data is fetched for all sessions at once
+    unless passed in as *rule_data_by_participation*, as returned by
+    :func:`get_flow_rule_participation_data`.
+    """
+
+    if not sessions:
+        return []
+
+    if rule_data_by_participation is None:
+        rule_data_by_participation = get_flow_rule_participation_data(
+                sessions[0].course, sessions[0].flow_id,
+                set(session.participation for session in sessions))
+
+    return [
+            get_session_grading_rule(session, flow_desc, now_datetime,
+                rule_data=rule_data_by_participation[session.participation_id])
+            for session in sessions]
+
 # }}}
 
 
@@ -512,9 +828,6 @@ class CoursePageContext(object):
         from course.views import check_course_state
         check_course_state(self.course, self.participation)
 
-        self.course_commit_sha = get_course_commit_sha(
-                self.course, self.participation)
-
         self.repo = get_course_repo(self.course)
 
         # logic duplicated in course.content.get_course_commit_sha
@@ -524,13 +837,11 @@ class CoursePageContext(object):
             if self.participation.preview_git_commit_sha:
                 preview_sha = self.participation.preview_git_commit_sha.encode()
 
-                repo = get_course_repo(self.course)
-
                 from relate.utils import SubdirRepoWrapper
-                if isinstance(repo, SubdirRepoWrapper):
-                    true_repo = repo.repo
+                if isinstance(self.repo, SubdirRepoWrapper):
+                    true_repo = self.repo.repo
                 else:
-                    true_repo = cast(dulwich.repo.Repo, repo)
+                    true_repo = cast(dulwich.repo.Repo, self.repo)
 
                 try:
                     true_repo[preview_sha]
@@ -696,9 +1007,7 @@ def instantiate_flow_page_with_ctx(fctx, page_data):
 def course_view(f):
     def wrapper(request, course_identifier, *args, **kwargs):
         pctx = CoursePageContext(request, course_identifier)
-        response = f(pctx, *args, **kwargs)
-        pctx.repo.close()
-        return response
+        return f(pctx, *args, **kwargs)
 
     from functools import update_wrapper
     update_wrapper(wrapper, f)
@@ -64,6 +64,9 @@ from course.constants import (
         participation_permission as pperm,
         )
 
+import logging
+logger = logging.getLogger(__name__)
+
 # {{{ for mypy
 
 from django import http  # noqa
@@ -396,6 +399,9 @@ def run_course_update_command(
 
         repo[b"HEAD"] = remote_head
 
+        from course.content import refresh_course_repo
+        refresh_course_repo(pctx.course)
+
         messages.add_message(request, messages.SUCCESS, _("Fetch successful."))
 
         new_sha = remote_head
@@ -441,6 +447,10 @@ def run_course_update_command(
 
     # }}}
 
+    if command == "preview" or (command == "update" and may_update):
+        from course.content import prewarm_repo_path_index
+        prewarm_repo_path_index(content_repo, new_sha)
+
     if command == "preview":
         messages.add_message(request, messages.INFO,
                 _("Preview activated."))
@@ -452,6 +462,20 @@ def run_course_update_command(
         pctx.course.active_git_commit_sha = new_sha.decode()
         pctx.course.save()
 
+        from course.tasks import adjust_in_progress_session_page_data
+        try:
+            adjust_in_progress_session_page_data.delay(pctx.course.id)
+        except Exception:
+            # e.g. the task broker is unavailable. The page data is still
+            # brought up to date as sessions are visited.
+            logger.exception("failed to enqueue page data adjustment "
+                    "for course '%s'", pctx.course.identifier)
+
+            messages.add_message(request, messages.WARNING,
+                    _("Could not start updating in-progress sessions "
+                        "in the background. They will be updated as "
+                        "participants visit them."))
+
         if pctx.participation.preview_git_commit_sha is not None:
             pctx.participation.preview_git_commit_sha = None
             pctx.participation.save()
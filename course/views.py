@@ -1267,11 +1267,37 @@ def monitor_task(request, task_id):
     from celery.result import AsyncResult
     async_res = AsyncResult(task_id)
 
+    state = async_res.state
+    info = async_res.info
+
+    if (state == "SUCCESS"
+            and isinstance(info, dict)
+            and "fan_out" in info):
+        # The task has handed its work to a number of chunk tasks (see
+        # course.tasks._run_session_action). Report on those instead.
+        fan_out = info["fan_out"]
+
+        async_res = AsyncResult(fan_out["summary_task_id"])
+        state = async_res.state
+        info = async_res.info
+
+        if state not in ["SUCCESS", "FAILURE"]:
+            current = 0
+            for chunk_task_id, chunk_total in fan_out["chunks"]:
+                chunk_res = AsyncResult(chunk_task_id)
+                if chunk_res.ready():
+                    current += chunk_total
+                elif chunk_res.state == "PROGRESS":
+                    current += chunk_res.info["current"]
+
+            state = "PROGRESS"
+            info = {"current": current, "total": fan_out["total"]}
+
     progress_percent = None
     progress_statement = None
 
-    if async_res.state == "PROGRESS":
-        meta = async_res.info
+    if state == "PROGRESS":
+        meta = info
         current = meta["current"]
         total = meta["total"]
         if total > 0:
@@ -1281,17 +1307,17 @@ def monitor_task(request, task_id):
                 _("%(current)d out of %(total)d items processed.")
                 % {"current": current, "total": total})
 
-    if async_res.state == "SUCCESS":
-        if (isinstance(async_res.result, dict)
-                and "message" in async_res.result):
-            progress_statement = async_res.result["message"]
+    if state == "SUCCESS":
+        if (isinstance(info, dict)
+                and "message" in info):
+            progress_statement = info["message"]
 
     traceback = None
-    if request.user.is_staff and async_res.state == "FAILURE":
+    if request.user.is_staff and state == "FAILURE":
         traceback = async_res.traceback
 
     return render(request, "course/task-monitor.html", {
-        "state": async_res.state,
+        "state": state,
         "progress_percent": progress_percent,
         "progress_statement": progress_statement,
         "traceback": traceback,
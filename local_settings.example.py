@@ -44,6 +44,12 @@ RELATE_BASE_URL = "http://YOUR/RELATE/SITE/DOMAIN"
 #     }
 # }
 
+# In addition to the cache above, each RELATE process keeps recently used
+# course content (parsed YAML, rendered markup, small files) in memory,
+# up to this many bytes.
+#
+# RELATE_LOCAL_CONTENT_CACHE_MAX_BYTES = 32*1024*1024
+
 # SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
@@ -65,6 +71,12 @@ TIME_ZONE = "America/Chicago"
 #GIT_ROOT = "/some/where"
 GIT_ROOT = ".."
 
+# Course repositories are kept open between requests (per worker thread) so
+# that dulwich does not have to re-read pack indices for every request. This
+# bounds how many repositories each thread keeps open. Set to 0 to open the
+# repository anew for every request.
+#RELATE_COURSE_REPO_POOL_SIZE = 32
+
 # }}}
 
 # {{{ email
@@ -164,6 +176,12 @@ if RELATE_ENABLE_MULTIPLE_SMTP:
 # is allowed to be started.
 RELATE_SESSION_RESTART_COOLDOWN_SECONDS = 10
 
+# Bulk operations on flow sessions (ending, expiring, regrading,
+# recalculating) that cover more than this many sessions are split into
+# chunks of this size that are processed in parallel by the celery workers.
+# Set to 0 to process all sessions in a single task.
+#RELATE_BULK_SESSION_TASK_CHUNK_SIZE = 100
+
 
 # {{{ sign-in methods
 
@@ -238,6 +256,12 @@ RELATE_DOCKER_URL = "unix://var/run/docker.sock"
 
 RELATE_DOCKER_TLS_CONFIG = None
 
+# If your runpy image was built from a version of docker-image-run-py that
+# announces in its log that runpy is ready to accept code, set this to True
+# to wait for that announcement instead of polling the container. The
+# prebuilt inducer/relate-runpy-i386 image does not make the announcement.
+#RELATE_DOCKER_RUNPY_READY_MARKER = False
+
 # Example setup for targeting remote Docker instances
 # with TLS authentication:
 
@@ -255,6 +279,64 @@ RELATE_DOCKER_TLS_CONFIG = None
 #     ca_cert=os.path.join(pki_base_dir, "ca.pem"),
 #     verify=True)
 
+# To spread code execution across several Docker daemons, list them here
+# instead of setting RELATE_DOCKER_URL and RELATE_DOCKER_TLS_CONFIG. Each run
+# goes to the host with the fewest runs in progress, going round-robin among
+# equally loaded hosts. A host may be given a limit on the number of runs it
+# carries out at the same time. A host that fails is left out for
+# RELATE_DOCKER_HOST_RETRY_SECONDS.
+#
+# Each RELATE process (web and celery workers alike) keeps track of load and
+# failures on its own. A host may therefore carry up to max_concurrency runs
+# per process. Runs for which a student is waiting give up if no host has
+# had capacity for a few seconds; runs in celery tasks wait for up to two
+# minutes.
+#
+# RELATE_DOCKER_HOSTS = [
+#     {"url": "unix://var/run/docker.sock", "max_concurrency": 4},
+#     {"url": "https://runner1.example.com:2375",
+#         "tls_config": RELATE_DOCKER_TLS_CONFIG,
+#         "max_concurrency": 16},
+#     ]
+# RELATE_DOCKER_HOST_RETRY_SECONDS = 60
+
+# When a flow session with several code questions is ended or regraded,
+# up to this many code containers are run at the same time.
+#RELATE_PYTHON_RUN_CONCURRENCY = 4
+
+# When regrading, answers to the same code question are run in batches of
+# up to this many per container.
+#RELATE_PYTHON_RUN_BATCH_SIZE = 50
+
+# If set to a positive number, each RELATE process (web and celery workers
+# alike) keeps this many started runpy containers per image ready, so that
+# running student code does not have to wait for a container to start. The
+# number of idle containers is therefore this times the number of processes.
+# Containers that have been waiting for longer than
+# RELATE_RUNPY_CONTAINER_MAX_AGE seconds are replaced. By default (0), a
+# container is started for every run.
+#RELATE_RUNPY_CONTAINER_POOL_SIZE = 2
+#RELATE_RUNPY_CONTAINER_MAX_AGE = 600
+
+# If set, data files of code questions are written once (per file contents)
+# to this directory and mounted read-only into runpy containers, instead of
+# being sent along with every run. The directory must be visible at the same
+# path to every Docker host, and readable by the container's runpy user.
+#RELATE_DOCKER_RUNPY_DATA_DIR = "/var/lib/relate/runpy-data"
+
+# The memory (in bytes) available to each runpy container. Code questions
+# may ask for less with their memory_limit attribute.
+#RELATE_DOCKER_RUNPY_MEMORY_LIMIT = 384*10**6
+
+# }}}
+
+# {{{ symbolic answers
+
+# The number of seconds that checking a single symbolic or numerical text
+# answer with sympy may take before it is considered wrong. Only enforced
+# in the main thread of a process.
+#RELATE_SYMPY_TIME_LIMIT = 5
+
 # }}}
 
 # {{{ maintenance and announcements
@@ -230,6 +230,34 @@ RELATE_TICKET_MINUTES_VALID_AFTER_USE = 0
 
 RELATE_CACHE_MAX_BYTES = 32768
 
+RELATE_LOCAL_CONTENT_CACHE_MAX_BYTES = 32*1024*1024
+
+RELATE_FLOW_DESC_CACHE_SIZE = 200
+
+RELATE_COURSE_REPO_POOL_SIZE = 32
+
+RELATE_REPO_PATH_INDEX_SIZE = 20000
+
+RELATE_BULK_SESSION_TASK_CHUNK_SIZE = 100
+
+RELATE_PYTHON_RUN_CONCURRENCY = 4
+
+RELATE_PYTHON_RUN_BATCH_SIZE = 50
+
+RELATE_RUNPY_CONTAINER_POOL_SIZE = 0
+
+RELATE_RUNPY_CONTAINER_MAX_AGE = 600
+
+RELATE_DOCKER_HOST_RETRY_SECONDS = 60
+
+RELATE_DOCKER_RUNPY_READY_MARKER = False
+
+RELATE_DOCKER_RUNPY_DATA_DIR = None
+
+RELATE_DOCKER_RUNPY_MEMORY_LIMIT = 384*10**6
+
+RELATE_SYMPY_TIME_LIMIT = 5
+
 RELATE_ADMIN_EMAIL_LOCALE = "en_US"
 
 RELATE_EDITABLE_INST_ID_BEFORE_VERIFICATION = True
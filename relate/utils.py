@@ -231,6 +231,96 @@ def struct_to_dict(data):
 # }}}
 
 
+# {{{ in-process LRU cache
+
+class LRUCache(object):
+    """A thread-safe, bounded mapping that evicts the least recently used
+    entries once it holds more than *max_entries* items or once the sizes
+    passed to :meth:`put` add up to more than *max_size*.
+    """
+
+    def __init__(self, max_entries=None, max_size=None):
+        # type: (Optional[int], Optional[int]) -> None
+        import threading
+        from collections import OrderedDict
+
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+        # key -> (value, size)
+        self.entries = OrderedDict()  # type: Any
+        self.total_size = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        # type: (Any, Any) -> Any
+        with self.lock:
+            try:
+                entry = self.entries.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def __contains__(self, key):
+        # type: (Any) -> bool
+        with self.lock:
+            return key in self.entries
+
+    def __len__(self):
+        # type: () -> int
+        return len(self.entries)
+
+    def put(self, key, value, size=1):
+        # type: (Any, Any, int) -> None
+        if self.max_size is not None and size > self.max_size:
+            return
+
+        with self.lock:
+            old_entry = self.entries.pop(key, None)
+            if old_entry is not None:
+                self.total_size -= old_entry[1]
+
+            self.entries[key] = (value, size)
+            self.total_size += size
+
+            while (
+                    (self.max_entries is not None
+                        and len(self.entries) > self.max_entries)
+                    or
+                    (self.max_size is not None
+                        and self.total_size > self.max_size)):
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_size -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        # type: () -> None
+        with self.lock:
+            self.entries.clear()
+            self.total_size = 0
+
+    def get_stats(self):
+        # type: () -> Dict[Text, int]
+        with self.lock:
+            return {
+                    "entries": len(self.entries),
+                    "size": self.total_size,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "evictions": self.evictions,
+                    }
+
+# }}}
+
+
 def retry_transaction(f, args, kwargs={}, max_tries=None, serializable=None):
     # type: (Any, Tuple, Dict, Optional[int], Optional[bool]) -> Any
 
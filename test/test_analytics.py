@@ -0,0 +1,208 @@
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2017 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from random import Random
+
+import six
+from django.test import SimpleTestCase
+from django.utils.translation import pgettext
+
+from course.analytics import Histogram
+
+
+class ReferenceHistogram(object):
+    """The binning of :class:`course.analytics.Histogram` before it sorted
+    its values, with one bisection per data point.
+    """
+
+    def __init__(self, num_bin_count=10, num_bin_starts=None,
+            num_min_value=None, num_max_value=None, num_log_bins=False):
+        self.string_weights = {}
+        self.num_values = []
+        self.num_bin_starts = num_bin_starts
+        self.num_min_value = num_min_value
+        self.num_max_value = num_max_value
+        self.num_bin_count = num_bin_count
+        self.num_log_bins = num_log_bins
+
+    def add_data_point(self, value, weight=1):
+        if isinstance(value, six.string_types):
+            self.string_weights[value] = \
+                    self.string_weights.get(value, 0) + weight
+        elif value is None:
+            self.add_data_point(
+                "".join(["(", pgettext("No data", "None"), ")"]), weight)
+        elif (self.num_max_value is not None
+                and value > self.num_max_value):
+            self.add_data_point(
+                "".join([
+                    "(",
+                    pgettext("Value of grade", "value greater than max"),
+                    ")"]),
+                weight)
+        elif (self.num_min_value is not None
+                and value < self.num_min_value):
+            self.add_data_point(
+                "".join([
+                    "(",
+                    pgettext("Value of grade", "value smaller than min"),
+                    ")"]),
+                weight)
+        else:
+            self.num_values.append((value, weight))
+
+    def get_bins(self):
+        """
+        :returns: a dictionary mapping bin titles to their weights.
+        """
+
+        min_value = self.num_min_value
+        max_value = self.num_max_value
+
+        if self.num_bin_starts is not None:
+            num_bin_starts = self.num_bin_starts
+        else:
+            if min_value is None:
+                if self.num_values:
+                    min_value, _ = min(self.num_values)
+                else:
+                    min_value = 1
+            if max_value is None:
+                if self.num_values:
+                    max_value, _ = max(self.num_values)
+                else:
+                    max_value = 1
+
+            if self.num_log_bins:
+                from math import log, exp
+                bin_width = (log(max_value) - log(min_value))/self.num_bin_count
+                num_bin_starts = [
+                        exp(log(min_value)+bin_width*i)
+                        for i in range(self.num_bin_count)]
+            else:
+                bin_width = (max_value - min_value)/self.num_bin_count
+                num_bin_starts = [
+                        min_value+bin_width*i
+                        for i in range(self.num_bin_count)]
+
+        bins = [0 for i in range(len(num_bin_starts))]
+
+        result = self.string_weights.copy()
+
+        oob = pgettext("Value in histogram", "<out of bounds>")
+
+        from bisect import bisect
+        for value, weight in self.num_values:
+            if ((max_value is not None
+                    and value > max_value)
+                    or value < num_bin_starts[0]):
+                result[oob] = result.get(oob, 0) + weight
+            else:
+                bins[bisect(num_bin_starts, value)-1] += weight
+
+        for start, weight in zip(num_bin_starts, bins):
+            result[str(start)] = result.get(str(start), 0) + weight
+
+        return result
+
+
+class HistogramTest(SimpleTestCase):
+    def check(self, rng, hist_kwargs, make_value):
+        hist = Histogram(**hist_kwargs)
+        ref_hist = ReferenceHistogram(**hist_kwargs)
+
+        for i in range(rng.randrange(1, 5)):
+            weight = rng.randrange(1, 4)
+            values = [make_value() for j in range(rng.randrange(0, 200))]
+
+            hist.add_data_points(values, weight)
+            for value in values:
+                ref_hist.add_data_point(value, weight)
+
+        bins = {}
+        for bin_info in hist.get_bin_info_list():
+            bins[bin_info.title] = \
+                    bins.get(bin_info.title, 0) + bin_info.raw_weight
+
+        self.assertEqual(
+                dict((title, weight)
+                    for title, weight in six.iteritems(bins) if weight),
+                dict((title, weight)
+                    for title, weight in six.iteritems(ref_hist.get_bins())
+                    if weight),
+                hist_kwargs)
+
+    def test_matches_reference(self):
+        rng = Random(17)
+
+        for i in range(200):
+            hist_kwargs = {"num_bin_count": rng.randrange(1, 15)}
+
+            if rng.random() < 0.5:
+                # values on the bin boundaries, too
+                def make_value():
+                    return rng.randrange(0, 20) / 2
+            else:
+                def make_value():
+                    return rng.uniform(0, 10)
+
+            kind = rng.randrange(4)
+            if kind == 0:
+                hist_kwargs["num_min_value"] = rng.uniform(0, 3)
+                hist_kwargs["num_max_value"] = rng.uniform(7, 10)
+            elif kind == 1:
+                hist_kwargs["num_bin_starts"] = sorted(
+                        rng.uniform(0, 10)
+                        for j in range(hist_kwargs["num_bin_count"]))
+            elif kind == 2:
+                hist_kwargs["num_log_bins"] = True
+
+                def make_value():
+                    return rng.uniform(1, 1000)
+
+            def make_any_value():
+                r = rng.random()
+                if r < 0.05:
+                    return None
+                elif r < 0.1:
+                    return "(in progress)"
+                else:
+                    return make_value()
+
+            self.check(rng, hist_kwargs, make_any_value)
+
+    def test_add_data_point(self):
+        hist = Histogram(num_bin_starts=[0, 10], num_max_value=20)
+        hist.add_data_point(5)
+        hist.add_data_point(10, weight=2)
+        hist.add_data_point(25)
+        hist.add_data_point(-1)
+
+        self.assertEqual(
+                [(bin_info.title, bin_info.raw_weight)
+                    for bin_info in hist.get_bin_info_list()],
+                [("0", 1), ("10", 2),
+                    ("(value greater than max)", 1),
+                    ("<out of bounds>", 1)])
+        self.assertEqual(hist.total_weight(), 5)
@@ -0,0 +1,332 @@
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2017 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from django.test import SimpleTestCase, override_settings
+
+import course.page.code as code
+
+
+class FakeDockerClient(object):
+    """Stands in for the parts of :class:`docker.Client` that are used to
+    start, wait for and remove runpy containers.
+    """
+
+    def __init__(self, log_chunks=(), log_error=None, fail_create=False,
+            host_port=32768):
+        self.log_chunks = list(log_chunks)
+        self.log_error = log_error
+        self.logs_calls = 0
+
+        self.fail_create = fail_create
+        self.host_port = host_port
+        self.created = []
+        self.removed = []
+
+    def create_container(self, image, command, host_config, user):
+        if self.fail_create:
+            raise IOError("cannot connect to Docker")
+
+        container_id = "container-%d" % len(self.created)
+        self.created.append(container_id)
+        return {"Id": container_id}
+
+    def start(self, container_id):
+        pass
+
+    def inspect_container(self, container_id):
+        return {"NetworkSettings": {"Ports": {
+            "%d/tcp" % code.RUNPY_PORT: [
+                {"HostIp": "0.0.0.0", "HostPort": str(self.host_port)}]}}}
+
+    def remove_container(self, container_id, force=False):
+        self.removed.append(container_id)
+
+    def logs(self, container_id, **kwargs):
+        self.logs_calls += 1
+
+        for chunk in self.log_chunks:
+            yield chunk
+
+        if self.log_error is not None:
+            raise self.log_error
+
+
+class FakePing(object):
+    """Stands in for :func:`course.page.code.ping_runpy_container`, answering
+    successfully from the *ready_after*-th call on.
+    """
+
+    def __init__(self, ready_after=1):
+        self.ready_after = ready_after
+        self.calls = 0
+
+    def __call__(self, connect_host_ip, port, timeout=None):
+        self.calls += 1
+        return self.calls >= self.ready_after
+
+
+class WaitForRunpyContainerTest(SimpleTestCase):
+    def setUp(self):
+        self.orig_ping = code.ping_runpy_container
+
+    def tearDown(self):
+        code.ping_runpy_container = self.orig_ping
+
+    def install_ping(self, ping):
+        code.ping_runpy_container = ping
+        return ping
+
+    @override_settings(RELATE_DOCKER_RUNPY_READY_MARKER=False)
+    def test_pings_by_default(self):
+        ping = self.install_ping(FakePing(ready_after=3))
+        docker_cnx = FakeDockerClient([b"RUNPY READY\n"])
+
+        self.assertIsNone(code.wait_for_runpy_container(
+            "localhost", 1234, docker_cnx, "container"))
+        self.assertEqual(docker_cnx.logs_calls, 0)
+        self.assertEqual(ping.calls, 3)
+
+    @override_settings(RELATE_DOCKER_RUNPY_READY_MARKER=True)
+    def test_marker_skips_ping(self):
+        ping = self.install_ping(FakePing())
+        docker_cnx = FakeDockerClient([b"starting\n", b"RUNPY READY\n"])
+
+        self.assertIsNone(code.wait_for_runpy_container(
+            "localhost", 1234, docker_cnx, "container"))
+        self.assertEqual(ping.calls, 0)
+
+    @override_settings(RELATE_DOCKER_RUNPY_READY_MARKER=True)
+    def test_missing_marker_falls_back_to_ping(self):
+        # an image that never prints the marker: the log read times out
+        ping = self.install_ping(FakePing(ready_after=2))
+        docker_cnx = FakeDockerClient(
+                [b"starting\n"], log_error=IOError("read timed out"))
+
+        self.assertIsNone(code.wait_for_runpy_container(
+            "localhost", 1234, docker_cnx, "container"))
+        self.assertEqual(ping.calls, 2)
+
+    @override_settings(RELATE_DOCKER_RUNPY_READY_MARKER=True)
+    def test_exited_container_fails(self):
+        ping = self.install_ping(FakePing())
+        docker_cnx = FakeDockerClient([b"Traceback\n"])
+
+        result = code.wait_for_runpy_container(
+            "localhost", 1234, docker_cnx, "container")
+        self.assertEqual(result["result"], "uncaught_error")
+        self.assertEqual(ping.calls, 0)
+
+
+class DockerHostSchedulerTest(SimpleTestCase):
+    def make_scheduler(self, *max_concurrencies):
+        return code.DockerHostScheduler([
+            code.DockerHost("tcp://host%d:2375" % i, max_concurrency=mc)
+            for i, mc in enumerate(max_concurrencies)],
+            retry_seconds=60)
+
+    def test_least_loaded_round_robin(self):
+        scheduler = self.make_scheduler(None, None)
+        host0, host1 = scheduler.hosts
+
+        self.assertIs(scheduler.acquire(), host0)
+        self.assertIs(scheduler.acquire(), host1)
+
+        scheduler.release(host0)
+        self.assertIs(scheduler.acquire(), host0)
+
+        scheduler.release(host0)
+        scheduler.release(host1)
+        self.assertIs(scheduler.acquire(), host1)
+
+    def test_capacity(self):
+        scheduler = self.make_scheduler(1)
+        host, = scheduler.hosts
+
+        self.assertIs(scheduler.acquire(timeout=0), host)
+        self.assertIsNone(scheduler.acquire(timeout=0.01))
+
+        scheduler.release(host)
+        self.assertIs(scheduler.acquire(timeout=0), host)
+
+    def test_failed_host_is_skipped(self):
+        scheduler = self.make_scheduler(None, None)
+        host0, host1 = scheduler.hosts
+
+        scheduler.report_failure(host0)
+        self.assertIs(scheduler.acquire(), host1)
+        self.assertIs(scheduler.acquire(), host1)
+
+        # Better to try a failed host than to give up.
+        scheduler.report_failure(host1)
+        self.assertIsNotNone(scheduler.acquire())
+
+
+@override_settings(
+        RELATE_DOCKER_RUNPY_IMAGE="runpy-image",
+        RELATE_DOCKER_RUNPY_READY_MARKER=False,
+        RELATE_DOCKER_RUNPY_DATA_DIR=None,
+        RELATE_RUNPY_CONTAINER_POOL_SIZE=0)
+class RunInRunpyContainerTest(SimpleTestCase):
+    def setUp(self):
+        self.orig_ping = code.ping_runpy_container
+        self.orig_get_docker_client = code.get_docker_client
+        self.orig_scheduler = code._DOCKER_HOST_SCHEDULER
+
+        code.ping_runpy_container = FakePing()
+
+        self.scheduler = code._DOCKER_HOST_SCHEDULER = \
+                code.DockerHostScheduler([
+                    code.DockerHost("tcp://host0:2375", max_concurrency=1),
+                    code.DockerHost("tcp://host1:2375", max_concurrency=1),
+                    ], retry_seconds=60)
+
+        self.docker_clients = dict(
+                (host.url, FakeDockerClient(host_port=32768 + i))
+                for i, host in enumerate(self.scheduler.hosts))
+        code.get_docker_client = \
+                lambda host=None: self.docker_clients[host.url]
+
+    def tearDown(self):
+        code.ping_runpy_container = self.orig_ping
+        code.get_docker_client = self.orig_get_docker_client
+        code._DOCKER_HOST_SCHEDULER = self.orig_scheduler
+
+    def test_run(self):
+        requests = []
+
+        def send_request(connect_host_ip, port):
+            requests.append((connect_host_ip, port))
+            return "result"
+
+        timings = {}
+        self.assertEqual(
+                code.run_in_runpy_container(None, send_request, timings),
+                "result")
+
+        # The container's port is published on all interfaces, so it is
+        # reached through the host name of the Docker URL.
+        self.assertEqual(requests, [("host0", 32768)])
+
+        docker_cnx = self.docker_clients["tcp://host0:2375"]
+        self.assertEqual(docker_cnx.removed, docker_cnx.created)
+        self.assertEqual(len(docker_cnx.created), 1)
+
+        for phase in ["schedule", "create", "start", "ready", "remove"]:
+            self.assertIn(phase, timings)
+
+        stats = self.scheduler.get_stats()
+        self.assertEqual(
+                [host["active_runs"] for host in stats["hosts"]], [0, 0])
+
+    def test_failing_host(self):
+        self.docker_clients["tcp://host0:2375"].fail_create = True
+
+        with self.assertRaises(IOError):
+            code.run_in_runpy_container(None, lambda ip, port: None, {})
+
+        host0, host1 = self.scheduler.hosts
+        self.assertFalse(self.scheduler.is_available(host0))
+        self.assertEqual(host0.active_runs, 0)
+
+        requests = []
+        code.run_in_runpy_container(None,
+                lambda ip, port: requests.append(ip), {})
+        self.assertEqual(requests, ["host1"])
+
+    def test_no_host_available(self):
+        for host in self.scheduler.hosts:
+            self.scheduler.acquire(timeout=0)
+
+        with self.assertRaises(code.RunpyContainerUnavailable) as cm:
+            code.run_in_runpy_container(None, lambda ip, port: None, {},
+                    host_wait_timeout=0.01)
+
+        self.assertEqual(cm.exception.result["result"], "host_unavailable")
+
+
+@override_settings(
+        RELATE_DOCKER_RUNPY_IMAGE="runpy-image",
+        RELATE_DOCKER_RUNPY_DATA_DIR=None,
+        RELATE_RUNPY_CONTAINER_POOL_SIZE=0)
+class HostUnavailableGradeTest(SimpleTestCase):
+    def setUp(self):
+        self.orig_scheduler = code._DOCKER_HOST_SCHEDULER
+        self.orig_wait_timeout = code.DOCKER_HOST_INTERACTIVE_WAIT_TIMEOUT
+
+        scheduler = code._DOCKER_HOST_SCHEDULER = code.DockerHostScheduler(
+                [code.DockerHost("tcp://host0:2375", max_concurrency=1)],
+                retry_seconds=60)
+        scheduler.acquire(timeout=0)
+
+        code.DOCKER_HOST_INTERACTIVE_WAIT_TIMEOUT = 0.01
+
+    def tearDown(self):
+        code._DOCKER_HOST_SCHEDULER = self.orig_scheduler
+        code.DOCKER_HOST_INTERACTIVE_WAIT_TIMEOUT = self.orig_wait_timeout
+
+    def test_grade(self):
+        from relate.utils import dict_to_struct
+        from course.page.base import PageContext
+
+        page = code.PythonCodeQuestion(None, "test", dict_to_struct({
+            "type": "PythonCodeQuestion",
+            "id": "test",
+            "value": 1,
+            "timeout": 1,
+            "prompt": "Compute x.",
+            "names_from_user": ["x"],
+            "test_code": "feedback.finish(1, 'ok')",
+            }))
+
+        page_context = PageContext(
+                course=None, repo=None, commit_sha=b"sha", flow_session=None)
+
+        feedback = page.grade(
+                page_context, None, {"answer": "x = 1"}, None)
+
+        # no grade, no notification of the course staff
+        self.assertIsNone(feedback.correctness)
+        self.assertIn("try again", feedback.feedback)
+        self.assertNotIn("grading code failed", feedback.feedback)
+
+
+class RunResultCacheTest(SimpleTestCase):
+    def test_resource_limit_failures_not_cached(self):
+        for i, (result, cached) in enumerate([
+                ({"result": "success"}, True),
+                ({"result": "user_error",
+                    "message": "ZeroDivisionError: division by zero"}, True),
+                ({"result": "user_error",
+                    "message": "MemoryError: "}, False),
+                ({"result": "user_error",
+                    "message": "CPUTimeLimitExceeded: "
+                    "CPU time limit of 1 s exceeded"}, False),
+                ({"result": "timeout"}, False),
+                ]):
+            cache_key = "test-run-result-cache-%d" % i
+            code.add_cached_run_result(cache_key, result)
+
+            self.assertEqual(
+                    code.get_cached_run_result(cache_key) is not None, cached,
+                    result)
@@ -0,0 +1,168 @@
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2017 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from datetime import timedelta
+from random import Random
+
+from django.test import TestCase
+from django.utils.timezone import now
+
+from accounts.models import User
+from course.constants import (
+        participation_status, grade_state_change_types,
+        grade_aggregation_strategy)
+from course.models import (
+        Course, Participation, GradingOpportunity, GradeChange, GradeCell,
+        rebuild_grade_cells)
+
+
+class GradeCellTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):  # noqa
+        cls.course = Course.objects.create(
+                identifier="test-course",
+                name="Test Course",
+                number="CS123",
+                time_period="Fall 2016",
+                from_email="inform@tiker.net",
+                notify_email="inform@tiker.net",
+                active_git_commit_sha="some_sha")
+
+        cls.participations = []
+        for i in range(4):
+            user = User.objects.create_user(
+                    username="student%d" % i,
+                    password="test",
+                    email="student%d@example.com" % i)
+            cls.participations.append(Participation.objects.create(
+                    user=user,
+                    course=cls.course,
+                    status=participation_status.active))
+
+        cls.opportunities = [
+                GradingOpportunity.objects.create(
+                    course=cls.course,
+                    identifier="opp%d" % i,
+                    name="Opportunity %d" % i,
+                    aggregation_strategy=grade_aggregation_strategy.max_grade)
+                for i in range(2)]
+
+    def get_cells(self):
+        return sorted(
+                (cell.participation_id, cell.opportunity_id, cell.state,
+                    cell.aggregated_percentage, cell.attempt_count,
+                    cell.last_graded_time, cell.last_grade_change_time,
+                    cell.history_error)
+                for cell in GradeCell.objects.all())
+
+    def assert_cells_match_rebuild(self):
+        cells = self.get_cells()
+        rebuild_grade_cells(course=self.course)
+        self.assertEqual(cells, self.get_cells())
+
+    def test_incremental_matches_rebuild(self):
+        rng = Random(17)
+        grade_time = now() - timedelta(days=30)
+
+        states = [
+                grade_state_change_types.graded,
+                grade_state_change_types.graded,
+                grade_state_change_types.graded,
+                grade_state_change_types.do_over,
+                grade_state_change_types.exempt,
+                grade_state_change_types.unavailable,
+                grade_state_change_types.extension,
+                grade_state_change_types.report_sent,
+                ]
+
+        for step in range(150):
+            # distinct times, so that the order of the history is unique
+            grade_time += timedelta(minutes=rng.randrange(1, 100))
+
+            existing = list(GradeChange.objects.all())
+            action = rng.random()
+
+            if existing and action < 0.1:
+                rng.choice(existing).delete()
+
+            elif existing and action < 0.15:
+                # moved to another cell, e.g. in the admin
+                gchange = rng.choice(existing)
+                gchange.participation = rng.choice(self.participations)
+                gchange.opportunity = rng.choice(self.opportunities)
+                gchange.save()
+
+            else:
+                state = rng.choice(states)
+                GradeChange.objects.create(
+                        opportunity=rng.choice(self.opportunities),
+                        participation=rng.choice(self.participations),
+                        state=state,
+                        attempt_id=rng.choice(["main", "flow-session-1", None]),
+                        points=(
+                            rng.randrange(0, 11)
+                            if state == grade_state_change_types.graded
+                            else None),
+                        max_points=10,
+                        grade_time=grade_time)
+
+            if step % 10 == 0:
+                self.assert_cells_match_rebuild()
+
+        self.assert_cells_match_rebuild()
+
+        opp = self.opportunities[0]
+        opp.aggregation_strategy = grade_aggregation_strategy.use_earliest
+        opp.save()
+        self.assert_cells_match_rebuild()
+
+        GradeChange.objects.filter(participation=self.participations[0]).delete()
+        self.assertFalse(GradeCell.objects.filter(
+            participation=self.participations[0]).exists())
+        self.assert_cells_match_rebuild()
+
+    def test_invalid_history(self):
+        participation = self.participations[0]
+        opp = self.opportunities[0]
+        grade_time = now() - timedelta(days=1)
+
+        GradeChange.objects.create(
+                opportunity=opp, participation=participation,
+                state=grade_state_change_types.exempt,
+                grade_time=grade_time)
+
+        # must not fail because of the history
+        GradeChange.objects.create(
+                opportunity=opp, participation=participation,
+                state=grade_state_change_types.graded,
+                points=5, max_points=10,
+                grade_time=grade_time + timedelta(hours=1))
+
+        cell = GradeCell.objects.get(
+                opportunity=opp, participation=participation)
+        self.assertIsNotNone(cell.history_error)
+        self.assertIsNone(cell.percentage())
+        self.assertEqual(cell.stringify_machine_readable_state(), "INVALID")
+
+        self.assert_cells_match_rebuild()
@@ -0,0 +1,210 @@
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2017 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from django.test import TestCase
+
+from accounts.models import User
+from course.constants import participation_status
+from course.models import Course, Participation, FlowSession, FlowPageData
+from relate.utils import dict_to_struct
+
+import course.content as content
+import course.flow as flow
+
+
+FLOW_ID = "quiz"
+
+
+class FakePage(object):
+    """Stands in for the flow pages, whose titles come straight from their
+    descriptions.
+    """
+
+    def __init__(self, page_desc):
+        self.page_desc = page_desc
+
+    def initialize_page_data(self, page_context):
+        return {"initialized": self.page_desc.id}
+
+    def title(self, page_context, page_data):
+        return self.page_desc.title
+
+
+def make_flow_desc(groups):
+    """
+    :arg groups: a list of tuples ``(group_id, [(page_id, title), ...])``.
+    """
+
+    return dict_to_struct({"groups": [
+        {"id": group_id, "pages": [
+            {"id": page_id, "type": "Page", "title": title}
+            for page_id, title in pages]}
+        for group_id, pages in groups]})
+
+
+class AdjustFlowSessionPageDataTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):  # noqa
+        cls.course = Course.objects.create(
+                identifier="test-course",
+                name="Test Course",
+                number="CS123",
+                time_period="Fall 2016",
+                from_email="inform@tiker.net",
+                notify_email="inform@tiker.net",
+                active_git_commit_sha="some_sha")
+
+        user = User.objects.create_user(
+                username="student",
+                password="test",
+                email="student@example.com")
+        cls.participation = Participation.objects.create(
+                user=user,
+                course=cls.course,
+                status=participation_status.active)
+
+    def setUp(self):
+        self.orig_instantiate_flow_page = content.instantiate_flow_page
+        content.instantiate_flow_page = \
+                lambda location, repo, page_desc, commit_sha: FakePage(page_desc)
+
+        self.session = FlowSession.objects.create(
+                course=self.course,
+                participation=self.participation,
+                user=self.participation.user,
+                active_git_commit_sha="some_sha",
+                flow_id=FLOW_ID,
+                in_progress=True)
+
+    def tearDown(self):
+        content.instantiate_flow_page = self.orig_instantiate_flow_page
+
+    def adjust(self, flow_desc):
+        # as if the course had moved on to a new revision
+        FlowSession.objects.filter(id=self.session.id).update(
+                page_data_at_revision_key=None)
+        self.session.refresh_from_db()
+
+        flow.adjust_flow_session_page_data(None, self.session,
+                self.course.identifier, flow_desc=flow_desc,
+                respect_preview=False)
+
+    def get_page_data(self):
+        return dict(
+                ((fpd.group_id, fpd.page_id), (fpd.ordinal, fpd.title))
+                for fpd in FlowPageData.objects.filter(
+                    flow_session=self.session))
+
+    def test_adjust(self):
+        self.adjust(make_flow_desc([
+            ("intro", [("welcome", "Welcome")]),
+            ("main", [("p1", "P1"), ("p2", "P2"), ("p3", "P3")]),
+            ]))
+
+        self.assertEqual(self.get_page_data(), {
+            ("intro", "welcome"): (0, "Welcome"),
+            ("main", "p1"): (1, "P1"),
+            ("main", "p2"): (2, "P2"),
+            ("main", "p3"): (3, "P3"),
+            })
+
+        session = FlowSession.objects.get(id=self.session.id)
+        self.assertEqual(session.page_count, 4)
+        self.assertEqual(session.page_data_at_revision_key, "2:some_sha")
+
+        p1_id = FlowPageData.objects.get(
+                flow_session=self.session, page_id="p1").id
+
+        # reordered, retitled, removed, added and renamed group
+        self.adjust(make_flow_desc([
+            ("main", [("p3", "P3"), ("p1", "P1, revised"), ("p4", "P4")]),
+            ("outro", [("bye", "Bye")]),
+            ]))
+
+        self.assertEqual(self.get_page_data(), {
+            ("intro", "welcome"): (None, "Welcome"),
+            ("main", "p1"): (1, "P1, revised"),
+            ("main", "p2"): (None, "P2"),
+            ("main", "p3"): (0, "P3"),
+            ("main", "p4"): (2, "P4"),
+            ("outro", "bye"): (3, "Bye"),
+            })
+        self.assertEqual(
+                FlowSession.objects.get(id=self.session.id).page_count, 4)
+
+        # existing page data is kept
+        self.assertEqual(FlowPageData.objects.get(
+            flow_session=self.session, page_id="p1").id, p1_id)
+
+        # removed pages come back in place
+        self.adjust(make_flow_desc([
+            ("intro", [("welcome", "Welcome")]),
+            ("main", [("p1", "P1"), ("p2", "P2")]),
+            ]))
+
+        self.assertEqual(self.get_page_data(), {
+            ("intro", "welcome"): (0, "Welcome"),
+            ("main", "p1"): (1, "P1"),
+            ("main", "p2"): (2, "P2"),
+            ("main", "p3"): (None, "P3"),
+            ("main", "p4"): (None, "P4"),
+            ("outro", "bye"): (None, "Bye"),
+            })
+
+    def test_many_pages(self):
+        # more than one chunk of bulk updates
+        page_ids = ["p%d" % i for i in range(250)]
+
+        self.adjust(make_flow_desc([
+            ("main", [(page_id, page_id) for page_id in page_ids]),
+            ]))
+
+        self.adjust(make_flow_desc([
+            ("main", [(page_id, page_id.upper())
+                for page_id in reversed(page_ids)]),
+            ]))
+
+        self.assertEqual(self.get_page_data(), dict(
+            (("main", page_id), (len(page_ids) - 1 - i, page_id.upper()))
+            for i, page_id in enumerate(page_ids)))
+
+    def test_concurrently_ended_session(self):
+        flow_desc = make_flow_desc([("main", [("p1", "P1")])])
+
+        FlowSession.objects.filter(id=self.session.id).update(
+                page_data_at_revision_key=None)
+        self.session.refresh_from_db()
+
+        # The session ends after it was loaded for the update.
+        FlowSession.objects.filter(id=self.session.id).update(
+                in_progress=False, points=5)
+
+        flow.adjust_flow_session_page_data(None, self.session,
+                self.course.identifier, flow_desc=flow_desc,
+                respect_preview=False)
+
+        session = FlowSession.objects.get(id=self.session.id)
+        self.assertFalse(session.in_progress)
+        self.assertEqual(session.points, 5)
+        self.assertEqual(session.page_count, 1)
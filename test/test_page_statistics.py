@@ -0,0 +1,219 @@
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2017 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+from datetime import timedelta
+from random import Random
+
+from django.test import TestCase
+from django.utils.timezone import now
+
+from accounts.models import User
+from course.constants import participation_status
+from course.models import (
+        Course, Participation, ParticipationRole, FlowSession, FlowPageData,
+        FlowPageVisit, FlowPageVisitGrade, FlowPageStatistics)
+from course.page import PageContext
+
+import course.analytics as analytics
+
+
+FLOW_ID = "quiz"
+PAGE_IDS = ["page0", "page1"]
+
+
+class FakePage(object):
+    """Stands in for the flow pages, whose answers are strings that are
+    their own normalized answers.
+    """
+
+    def normalized_answer(self, page_context, page_data, answer_data):
+        if answer_data is None:
+            return None
+
+        return answer_data["answer"]
+
+    def normalized_answers(self, page_context, page_data_list,
+            answer_data_list):
+        return [
+                self.normalized_answer(page_context, page_data, answer_data)
+                for page_data, answer_data in zip(
+                    page_data_list, answer_data_list)]
+
+
+class FakePageInstanceCache(object):
+    def __init__(self, repo, course, flow_id):
+        pass
+
+    def get_page(self, group_id, page_id, commit_sha):
+        return FakePage()
+
+
+class PageStatisticsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):  # noqa
+        cls.course = Course.objects.create(
+                identifier="test-course",
+                name="Test Course",
+                number="CS123",
+                time_period="Fall 2016",
+                from_email="inform@tiker.net",
+                notify_email="inform@tiker.net",
+                active_git_commit_sha="some_sha")
+
+        student_role = ParticipationRole.objects.get(
+                course=cls.course, identifier="student")
+
+        cls.participations = []
+        for i in range(3):
+            user = User.objects.create_user(
+                    username="student%d" % i,
+                    password="test",
+                    email="student%d@example.com" % i)
+            participation = Participation.objects.create(
+                    user=user,
+                    course=cls.course,
+                    status=participation_status.active)
+            participation.roles.add(student_role)
+            cls.participations.append(participation)
+
+    def setUp(self):
+        self.orig_page_instance_cache = analytics.PageInstanceCache
+        analytics.PageInstanceCache = FakePageInstanceCache
+
+        self.page_context = PageContext(
+                course=self.course, repo=None, commit_sha=b"some_sha",
+                flow_session=None)
+
+        self.rng = Random(17)
+        self.visit_time = now() - timedelta(days=30)
+        self.page_data = []
+
+    def tearDown(self):
+        analytics.PageInstanceCache = self.orig_page_instance_cache
+
+    def start_session(self):
+        participation = self.rng.choice(self.participations)
+        session = FlowSession.objects.create(
+                course=self.course,
+                participation=participation,
+                user=participation.user,
+                active_git_commit_sha="some_sha",
+                flow_id=FLOW_ID,
+                in_progress=True,
+                page_count=len(PAGE_IDS))
+
+        for i, page_id in enumerate(PAGE_IDS):
+            self.page_data.append(FlowPageData.objects.create(
+                    flow_session=session,
+                    ordinal=i,
+                    group_id="main",
+                    page_id=page_id,
+                    data={}))
+
+    def grade(self, visit):
+        correctness = self.rng.choice([None, 0, 0.25, 0.5, 1])
+        FlowPageVisitGrade.objects.create(
+                visit=visit,
+                correctness=correctness,
+                max_points=1)
+
+        # as it would happen once the grading transaction commits
+        analytics._update_page_statistics(
+                visit, FakePage(), self.page_context, correctness)
+
+    def submit_answer(self):
+        page_data = self.rng.choice(self.page_data)
+
+        # distinct times, so that the latest and first answers are unique
+        self.visit_time += timedelta(minutes=self.rng.randrange(1, 100))
+
+        answer = self.rng.choice([None, "a", "b", "c"])
+        visit = FlowPageVisit.objects.create(
+                flow_session=page_data.flow_session,
+                page_data=page_data,
+                visit_time=self.visit_time,
+                answer=(
+                    {"answer": answer}
+                    if answer is not None
+                    else None),
+                is_submitted_answer=True)
+
+        self.grade(visit)
+
+    def get_statistics(self):
+        return sorted(
+                (stats.group_id, stats.page_id, stats.attempt_mode,
+                    stats.total_count, stats.answer_count, stats.empty_count,
+                    stats.graded_count, stats.correctness_sum,
+                    sorted(
+                        (entry.slot, entry.visit_id, entry.visit_time,
+                            entry.has_answer, entry.correctness,
+                            entry.normalized_answer)
+                        for entry in stats.entries.all()))
+                for stats in FlowPageStatistics.objects.filter(
+                    course=self.course, flow_id=FLOW_ID))
+
+    def rebuild(self):
+        analytics.rebuild_page_statistics(
+                None, self.course, FLOW_ID, "some_sha")
+
+    def assert_statistics_match_rebuild(self):
+        stats = self.get_statistics()
+        self.rebuild()
+        self.assertEqual(stats, self.get_statistics())
+
+    def test_not_counted_before_build(self):
+        self.start_session()
+        self.submit_answer()
+
+        self.assertFalse(FlowPageStatistics.objects.exists())
+
+        self.rebuild()
+        self.assertEqual(
+                sum(stats.total_count
+                    for stats in FlowPageStatistics.objects.all()),
+                2)
+
+    def test_incremental_matches_rebuild(self):
+        for i in range(3):
+            self.start_session()
+            self.submit_answer()
+
+        self.rebuild()
+
+        for step in range(100):
+            r = self.rng.random()
+            if r < 0.1:
+                self.start_session()
+            elif r < 0.2:
+                # a regrade of an earlier answer
+                self.grade(self.rng.choice(list(
+                    FlowPageVisit.objects.filter(is_submitted_answer=True))))
+            else:
+                self.submit_answer()
+
+            if step % 10 == 0:
+                self.assert_statistics_match_rebuild()
+
+        self.assert_statistics_match_rebuild()
@@ -0,0 +1,127 @@
+from __future__ import division
+
+__copyright__ = "Copyright (C) 2017 Andreas Kloeckner"
+
+__license__ = """
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+"""
+
+import sympy
+from django.test import SimpleTestCase
+
+import course.page.text as text
+
+
+class SympyEqualTest(SimpleTestCase):
+    def setUp(self):
+        self.x, self.y = sympy.symbols("x y")
+
+        # count the calls of sympy.simplify to tell the paths apart
+        self.orig_simplify = sympy.simplify
+        self.simplify_calls = 0
+
+        def counting_simplify(expr, *args, **kwargs):
+            self.simplify_calls += 1
+            return self.orig_simplify(expr, *args, **kwargs)
+
+        sympy.simplify = counting_simplify
+
+    def tearDown(self):
+        sympy.simplify = self.orig_simplify
+
+    def test_numerically_equal(self):
+        x, y = self.x, self.y
+
+        for expr_a, expr_b in [
+                (sympy.sin(x)**2 + sympy.cos(x)**2, sympy.Integer(1)),
+                ((x + y)**2, x**2 + 2*x*y + y**2),
+                (sympy.exp(sympy.log(x + 3)), x + 3),
+                ]:
+            self.assertIs(text.sympy_equal_numerically(expr_a, expr_b), True)
+            self.assertTrue(text.sympy_equal(expr_a, expr_b))
+
+        # decided without simplification
+        self.assertEqual(self.simplify_calls, 0)
+
+    def test_numerically_unequal(self):
+        x, y = self.x, self.y
+
+        for expr_a, expr_b in [
+                (x**2, x**3),
+                (x + y, x - y),
+                (sympy.sin(x), sympy.sin(x) + 10**-6),
+                ]:
+            self.assertIs(text.sympy_equal_numerically(expr_a, expr_b), False)
+            self.assertFalse(text.sympy_equal(expr_a, expr_b))
+
+        self.assertEqual(self.simplify_calls, 0)
+
+    def test_decimal_approximation(self):
+        approx_pi = sympy.Float("3.14159265358979")
+
+        # numerically indistinguishable, but not the exact value
+        self.assertIs(text.sympy_equal_numerically(sympy.pi, approx_pi), True)
+        self.assertFalse(text.sympy_equal(sympy.pi, approx_pi))
+        self.assertEqual(self.simplify_calls, 1)
+
+        self.assertTrue(text.sympy_equal(
+            sympy.Float("0.5")*self.x, self.x/2))
+
+    def test_not_evaluable(self):
+        f = sympy.Function("f")
+        g = sympy.Function("g")
+        x = self.x
+
+        self.assertIsNone(text.sympy_equal_numerically(f(x), f(x)))
+
+        self.assertTrue(text.sympy_equal(f(x) + f(x), 2*f(x)))
+        self.assertFalse(text.sympy_equal(f(x), g(x)))
+        self.assertEqual(self.simplify_calls, 2)
+
+
+class SympyTimeoutTest(SimpleTestCase):
+    def setUp(self):
+        self.orig_sympy_equal = text.sympy_equal
+
+        def sympy_equal(expr_a, expr_b):
+            raise text.SympyTimeout("too slow")
+
+        text.sympy_equal = sympy_equal
+
+        self.matcher = text.SymbolicExpressionMatcher(None, "test", "x+1")
+
+    def tearDown(self):
+        text.sympy_equal = self.orig_sympy_equal
+
+    def test_matcher(self):
+        self.assertIsNone(self.matcher.grade("1+x+0*x"))
+
+    def test_unchecked(self):
+        self.assertIsNone(text.get_matcher_correctness(
+            [self.matcher, text.PlainMatcher(None, "test", "y")],
+            "x+2*1"))
+
+        feedback = text.make_unchecked_answer_feedback()
+        self.assertIsNone(feedback.correctness)
+        self.assertIn("could not be checked in time", feedback.feedback)
+
+    def test_other_matcher_correct(self):
+        self.assertEqual(text.get_matcher_correctness(
+            [self.matcher, text.PlainMatcher(None, "test", "1 + x")],
+            "1 + x"), 1)